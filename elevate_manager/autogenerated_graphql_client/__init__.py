@@ -2,6 +2,13 @@
 from .async_base_client import AsyncBaseClient
 from .base_model import BaseModel
 from .client import GraphQLClient
+from .engagement_employees import EngagementEmployees
+from .engagement_employees import EngagementEmployeesEngagements
+from .engagement_employees import EngagementEmployeesEngagementsObjects
+from .engagement_employees import EngagementEmployeesEngagementsObjectsValidities
+from .engagement_employees import (
+    EngagementEmployeesEngagementsObjectsValiditiesEmployee,
+)
 from .enums import AuditLogModel
 from .enums import FileStore
 from .enums import OwnerInferencePriority
@@ -122,21 +129,44 @@ from .input_types import UuidsBoundITUserFilter
 from .input_types import UuidsBoundLeaveFilter
 from .input_types import UuidsBoundOrganisationUnitFilter
 from .input_types import ValidityInput
-from .manager_engagements import ManagerEngagements
-from .manager_engagements import ManagerEngagementsManagers
-from .manager_engagements import ManagerEngagementsManagersObjects
-from .manager_engagements import ManagerEngagementsManagersObjectsCurrent
-from .manager_engagements import ManagerEngagementsManagersObjectsCurrentEmployee
-from .manager_engagements import (
-    ManagerEngagementsManagersObjectsCurrentEmployeeEngagements,
+from .manager_elevation import ManagerElevation
+from .manager_elevation import ManagerElevationManagers
+from .manager_elevation import ManagerElevationManagersObjects
+from .manager_elevation import ManagerElevationManagersObjectsCurrent
+from .manager_elevation import ManagerElevationManagersObjectsCurrentEmployee
+from .manager_elevation import (
+    ManagerElevationManagersObjectsCurrentEmployeeEngagements,
+)
+from .manager_elevation import (
+    ManagerElevationManagersObjectsCurrentEmployeeEngagementsOrgUnit,
+)
+from .manager_elevation import ManagerElevationManagersObjectsCurrentOrgUnit
+from .manager_elevation import ManagerElevationManagersObjectsCurrentOrgUnitManagers
+from .manager_elevation import (
+    ManagerElevationManagersObjectsCurrentOrgUnitManagersValidity,
+)
+from .manager_page import ManagerPage
+from .manager_page import ManagerPageManagers
+from .manager_page import ManagerPageManagersObjects
+from .manager_page import ManagerPageManagersPageInfo
+from .manager_snapshot import ManagerSnapshot
+from .manager_snapshot import ManagerSnapshotManagers
+from .manager_snapshot import ManagerSnapshotManagersObjects
+from .manager_snapshot import ManagerSnapshotManagersObjectsCurrent
+from .manager_snapshot import ManagerSnapshotManagersObjectsCurrentEmployee
+from .manager_snapshot import ManagerSnapshotManagersObjectsCurrentEmployeeEngagements
+from .manager_snapshot import (
+    ManagerSnapshotManagersObjectsCurrentEmployeeEngagementsOrgUnit,
 )
+from .manager_snapshot import ManagerSnapshotManagersObjectsCurrentOrgUnit
+from .manager_snapshot import ManagerSnapshotManagersObjectsCurrentValidity
+from .manager_snapshot import ManagerSnapshotManagersPageInfo
 from .move_engagement import MoveEngagement
 from .move_engagement import MoveEngagementEngagementUpdate
-from .org_unit_managers import OrgUnitManagers
-from .org_unit_managers import OrgUnitManagersOrgUnits
-from .org_unit_managers import OrgUnitManagersOrgUnitsObjects
-from .org_unit_managers import OrgUnitManagersOrgUnitsObjectsCurrent
-from .org_unit_managers import OrgUnitManagersOrgUnitsObjectsCurrentManagers
+from .registrations import Registrations
+from .registrations import RegistrationsRegistrations
+from .registrations import RegistrationsRegistrationsObjects
+from .registrations import RegistrationsRegistrationsPageInfo
 from .terminate_manager import TerminateManager
 from .terminate_manager import TerminateManagerManagerTerminate
 
@@ -174,6 +204,11 @@ __all__ = [
     "EmployeesBoundLeaveFilter",
     "EmployeesBoundManagerFilter",
     "EngagementCreateInput",
+    "EngagementEmployees",
+    "EngagementEmployeesEngagements",
+    "EngagementEmployeesEngagementsObjects",
+    "EngagementEmployeesEngagementsObjectsValidities",
+    "EngagementEmployeesEngagementsObjectsValiditiesEmployee",
     "EngagementFilter",
     "EngagementRegistrationFilter",
     "EngagementTerminateInput",
@@ -219,24 +254,37 @@ __all__ = [
     "LeaveTerminateInput",
     "LeaveUpdateInput",
     "ManagerCreateInput",
-    "ManagerEngagements",
-    "ManagerEngagementsManagers",
-    "ManagerEngagementsManagersObjects",
-    "ManagerEngagementsManagersObjectsCurrent",
-    "ManagerEngagementsManagersObjectsCurrentEmployee",
-    "ManagerEngagementsManagersObjectsCurrentEmployeeEngagements",
+    "ManagerElevation",
+    "ManagerElevationManagers",
+    "ManagerElevationManagersObjects",
+    "ManagerElevationManagersObjectsCurrent",
+    "ManagerElevationManagersObjectsCurrentEmployee",
+    "ManagerElevationManagersObjectsCurrentEmployeeEngagements",
+    "ManagerElevationManagersObjectsCurrentEmployeeEngagementsOrgUnit",
+    "ManagerElevationManagersObjectsCurrentOrgUnit",
+    "ManagerElevationManagersObjectsCurrentOrgUnitManagers",
+    "ManagerElevationManagersObjectsCurrentOrgUnitManagersValidity",
     "ManagerFilter",
+    "ManagerPage",
+    "ManagerPageManagers",
+    "ManagerPageManagersObjects",
+    "ManagerPageManagersPageInfo",
     "ManagerRegistrationFilter",
+    "ManagerSnapshot",
+    "ManagerSnapshotManagers",
+    "ManagerSnapshotManagersObjects",
+    "ManagerSnapshotManagersObjectsCurrent",
+    "ManagerSnapshotManagersObjectsCurrentEmployee",
+    "ManagerSnapshotManagersObjectsCurrentEmployeeEngagements",
+    "ManagerSnapshotManagersObjectsCurrentEmployeeEngagementsOrgUnit",
+    "ManagerSnapshotManagersObjectsCurrentOrgUnit",
+    "ManagerSnapshotManagersObjectsCurrentValidity",
+    "ManagerSnapshotManagersPageInfo",
     "ManagerTerminateInput",
     "ManagerUpdateInput",
     "ModelsUuidsBoundRegistrationFilter",
     "MoveEngagement",
     "MoveEngagementEngagementUpdate",
-    "OrgUnitManagers",
-    "OrgUnitManagersOrgUnits",
-    "OrgUnitManagersOrgUnitsObjects",
-    "OrgUnitManagersOrgUnitsObjectsCurrent",
-    "OrgUnitManagersOrgUnitsObjectsCurrentManagers",
     "OrgUnitsboundaddressfilter",
     "OrgUnitsboundassociationfilter",
     "OrgUnitsboundengagementfilter",
@@ -261,6 +309,10 @@ __all__ = [
     "RAOpenValidityInput",
     "RAValidityInput",
     "RegistrationFilter",
+    "Registrations",
+    "RegistrationsRegistrations",
+    "RegistrationsRegistrationsObjects",
+    "RegistrationsRegistrationsPageInfo",
     "RelatedUnitFilter",
     "RelatedUnitsUpdateInput",
     "RoleBindingCreateInput",
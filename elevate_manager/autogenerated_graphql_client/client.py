@@ -1,18 +1,26 @@
 # Generated by ariadne-codegen on 2025-02-18 09:26
 # Source: queries.graphql
+from datetime import datetime
+from typing import Any
 from uuid import UUID
 
 from .async_base_client import AsyncBaseClient
 from .base_model import UNSET
 from .base_model import UnsetType
+from .engagement_employees import EngagementEmployees
+from .engagement_employees import EngagementEmployeesEngagements
 from .input_types import EngagementUpdateInput
 from .input_types import ManagerTerminateInput
-from .manager_engagements import ManagerEngagements
-from .manager_engagements import ManagerEngagementsManagers
+from .manager_elevation import ManagerElevation
+from .manager_elevation import ManagerElevationManagers
+from .manager_page import ManagerPage
+from .manager_page import ManagerPageManagers
+from .manager_snapshot import ManagerSnapshot
+from .manager_snapshot import ManagerSnapshotManagers
 from .move_engagement import MoveEngagement
 from .move_engagement import MoveEngagementEngagementUpdate
-from .org_unit_managers import OrgUnitManagers
-from .org_unit_managers import OrgUnitManagersOrgUnits
+from .registrations import Registrations
+from .registrations import RegistrationsRegistrations
 from .terminate_manager import TerminateManager
 from .terminate_manager import TerminateManagerManagerTerminate
 
@@ -22,44 +30,162 @@ def gql(q: str) -> str:
 
 
 class GraphQLClient(AsyncBaseClient):
-    async def manager_engagements(
-        self, manager_uuid: list[UUID] | None | UnsetType = UNSET
-    ) -> ManagerEngagementsManagers:
+    async def manager_elevation(
+        self, manager_uuids: list[UUID] | None | UnsetType = UNSET
+    ) -> ManagerElevationManagers:
         query = gql(
             """
-            query ManagerEngagements($manager_uuid: [UUID!]) {
-              managers(filter: {uuids: $manager_uuid}) {
+            query ManagerElevation($manager_uuids: [UUID!]) {
+              managers(filter: {uuids: $manager_uuids}) {
                 objects {
+                  uuid
                   current {
                     employee {
                       engagements {
                         uuid
+                        org_unit {
+                          uuid
+                        }
+                      }
+                    }
+                    org_unit {
+                      uuid
+                      managers {
+                        uuid
+                        validity {
+                          from
+                        }
                       }
                     }
-                    org_unit_uuid
                   }
                 }
               }
             }
             """
         )
-        variables: dict[str, object] = {"manager_uuid": manager_uuid}
+        variables: dict[str, object] = {"manager_uuids": manager_uuids}
         response = await self.execute(query=query, variables=variables)
         data = self.get_data(response)
-        return ManagerEngagements.parse_obj(data).managers
+        return ManagerElevation.parse_obj(data).managers
 
-    async def org_unit_managers(
-        self, uuids: list[UUID] | None | UnsetType = UNSET
-    ) -> OrgUnitManagersOrgUnits:
+    async def manager_page(
+        self,
+        cursor: Any | None | UnsetType = UNSET,
+        limit: Any | None | UnsetType = UNSET,
+    ) -> ManagerPageManagers:
         query = gql(
             """
-            query OrgUnitManagers($uuids: [UUID!]) {
-              org_units(filter: {uuids: $uuids}) {
+            query ManagerPage($cursor: Cursor, $limit: int) {
+              managers(cursor: $cursor, limit: $limit) {
                 objects {
+                  uuid
+                }
+                page_info {
+                  next_cursor
+                }
+              }
+            }
+            """
+        )
+        variables: dict[str, object] = {"cursor": cursor, "limit": limit}
+        response = await self.execute(query=query, variables=variables)
+        data = self.get_data(response)
+        return ManagerPage.parse_obj(data).managers
+
+    async def manager_snapshot(
+        self,
+        uuids: list[UUID] | None | UnsetType = UNSET,
+        cursor: Any | None | UnsetType = UNSET,
+        limit: Any | None | UnsetType = UNSET,
+    ) -> ManagerSnapshotManagers:
+        query = gql(
+            """
+            query ManagerSnapshot($uuids: [UUID!], $cursor: Cursor, $limit: int) {
+              managers(filter: {uuids: $uuids}, cursor: $cursor, limit: $limit) {
+                objects {
+                  uuid
                   current {
-                    name
-                    uuid
-                    managers {
+                    employee {
+                      uuid
+                      engagements {
+                        uuid
+                        org_unit {
+                          uuid
+                        }
+                      }
+                    }
+                    org_unit {
+                      uuid
+                    }
+                    validity {
+                      from
+                      to
+                    }
+                  }
+                }
+                page_info {
+                  next_cursor
+                }
+              }
+            }
+            """
+        )
+        variables: dict[str, object] = {
+            "uuids": uuids,
+            "cursor": cursor,
+            "limit": limit,
+        }
+        response = await self.execute(query=query, variables=variables)
+        data = self.get_data(response)
+        return ManagerSnapshot.parse_obj(data).managers
+
+    async def registrations(
+        self,
+        models: list[str] | None | UnsetType = UNSET,
+        start: datetime | None | UnsetType = UNSET,
+        cursor: Any | None | UnsetType = UNSET,
+        limit: Any | None | UnsetType = UNSET,
+    ) -> RegistrationsRegistrations:
+        query = gql(
+            """
+            query Registrations($models: [String!], $start: DateTime, $cursor: Cursor, $limit: int) {
+              registrations(
+                filter: {models: $models, start: $start}
+                cursor: $cursor
+                limit: $limit
+              ) {
+                objects {
+                  uuid
+                  model
+                  start
+                }
+                page_info {
+                  next_cursor
+                }
+              }
+            }
+            """
+        )
+        variables: dict[str, object] = {
+            "models": models,
+            "start": start,
+            "cursor": cursor,
+            "limit": limit,
+        }
+        response = await self.execute(query=query, variables=variables)
+        data = self.get_data(response)
+        return Registrations.parse_obj(data).registrations
+
+    async def engagement_employees(
+        self, uuids: list[UUID] | None | UnsetType = UNSET
+    ) -> EngagementEmployeesEngagements:
+        query = gql(
+            """
+            query EngagementEmployees($uuids: [UUID!]) {
+              engagements(filter: {uuids: $uuids, from_date: null, to_date: null}) {
+                objects {
+                  validities {
+                    employee {
                       uuid
                     }
                   }
@@ -71,7 +197,7 @@ class GraphQLClient(AsyncBaseClient):
         variables: dict[str, object] = {"uuids": uuids}
         response = await self.execute(query=query, variables=variables)
         data = self.get_data(response)
-        return OrgUnitManagers.parse_obj(data).org_units
+        return EngagementEmployees.parse_obj(data).engagements
 
     async def terminate_manager(
         self, input: ManagerTerminateInput
@@ -0,0 +1,32 @@
+# Generated by ariadne-codegen on 2025-02-18 09:26
+# Source: queries.graphql
+from uuid import UUID
+
+from .base_model import BaseModel
+
+
+class EngagementEmployees(BaseModel):
+    engagements: "EngagementEmployeesEngagements"
+
+
+class EngagementEmployeesEngagements(BaseModel):
+    objects: list["EngagementEmployeesEngagementsObjects"]
+
+
+class EngagementEmployeesEngagementsObjects(BaseModel):
+    validities: list["EngagementEmployeesEngagementsObjectsValidities"]
+
+
+class EngagementEmployeesEngagementsObjectsValidities(BaseModel):
+    employee: list["EngagementEmployeesEngagementsObjectsValiditiesEmployee"]
+
+
+class EngagementEmployeesEngagementsObjectsValiditiesEmployee(BaseModel):
+    uuid: UUID
+
+
+EngagementEmployees.update_forward_refs()
+EngagementEmployeesEngagements.update_forward_refs()
+EngagementEmployeesEngagementsObjects.update_forward_refs()
+EngagementEmployeesEngagementsObjectsValidities.update_forward_refs()
+EngagementEmployeesEngagementsObjectsValiditiesEmployee.update_forward_refs()
@@ -0,0 +1,66 @@
+# Generated by ariadne-codegen on 2025-02-18 09:26
+# Source: queries.graphql
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from pydantic import Field
+
+from .base_model import BaseModel
+
+
+class ManagerElevation(BaseModel):
+    managers: "ManagerElevationManagers"
+
+
+class ManagerElevationManagers(BaseModel):
+    objects: list["ManagerElevationManagersObjects"]
+
+
+class ManagerElevationManagersObjects(BaseModel):
+    uuid: UUID
+    current: Optional["ManagerElevationManagersObjectsCurrent"]
+
+
+class ManagerElevationManagersObjectsCurrent(BaseModel):
+    employee: list["ManagerElevationManagersObjectsCurrentEmployee"] | None
+    org_unit: list["ManagerElevationManagersObjectsCurrentOrgUnit"]
+
+
+class ManagerElevationManagersObjectsCurrentEmployee(BaseModel):
+    engagements: list["ManagerElevationManagersObjectsCurrentEmployeeEngagements"]
+
+
+class ManagerElevationManagersObjectsCurrentEmployeeEngagements(BaseModel):
+    uuid: UUID
+    org_unit: list["ManagerElevationManagersObjectsCurrentEmployeeEngagementsOrgUnit"]
+
+
+class ManagerElevationManagersObjectsCurrentEmployeeEngagementsOrgUnit(BaseModel):
+    uuid: UUID
+
+
+class ManagerElevationManagersObjectsCurrentOrgUnit(BaseModel):
+    uuid: UUID
+    managers: list["ManagerElevationManagersObjectsCurrentOrgUnitManagers"]
+
+
+class ManagerElevationManagersObjectsCurrentOrgUnitManagers(BaseModel):
+    uuid: UUID
+    validity: "ManagerElevationManagersObjectsCurrentOrgUnitManagersValidity"
+
+
+class ManagerElevationManagersObjectsCurrentOrgUnitManagersValidity(BaseModel):
+    from_: datetime = Field(alias="from")
+
+
+ManagerElevation.update_forward_refs()
+ManagerElevationManagers.update_forward_refs()
+ManagerElevationManagersObjects.update_forward_refs()
+ManagerElevationManagersObjectsCurrent.update_forward_refs()
+ManagerElevationManagersObjectsCurrentEmployee.update_forward_refs()
+ManagerElevationManagersObjectsCurrentEmployeeEngagements.update_forward_refs()
+ManagerElevationManagersObjectsCurrentEmployeeEngagementsOrgUnit.update_forward_refs()
+ManagerElevationManagersObjectsCurrentOrgUnit.update_forward_refs()
+ManagerElevationManagersObjectsCurrentOrgUnitManagers.update_forward_refs()
+ManagerElevationManagersObjectsCurrentOrgUnitManagersValidity.update_forward_refs()
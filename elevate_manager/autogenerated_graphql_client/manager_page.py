@@ -0,0 +1,29 @@
+# Generated by ariadne-codegen on 2025-02-18 09:26
+# Source: queries.graphql
+from typing import Any
+from uuid import UUID
+
+from .base_model import BaseModel
+
+
+class ManagerPage(BaseModel):
+    managers: "ManagerPageManagers"
+
+
+class ManagerPageManagers(BaseModel):
+    objects: list["ManagerPageManagersObjects"]
+    page_info: "ManagerPageManagersPageInfo"
+
+
+class ManagerPageManagersObjects(BaseModel):
+    uuid: UUID
+
+
+class ManagerPageManagersPageInfo(BaseModel):
+    next_cursor: Any | None
+
+
+ManagerPage.update_forward_refs()
+ManagerPageManagers.update_forward_refs()
+ManagerPageManagersObjects.update_forward_refs()
+ManagerPageManagersPageInfo.update_forward_refs()
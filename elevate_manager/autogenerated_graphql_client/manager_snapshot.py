@@ -0,0 +1,69 @@
+# Generated by ariadne-codegen on 2025-02-18 09:26
+# Source: queries.graphql
+from datetime import datetime
+from typing import Any
+from typing import Optional
+from uuid import UUID
+
+from pydantic import Field
+
+from .base_model import BaseModel
+
+
+class ManagerSnapshot(BaseModel):
+    managers: "ManagerSnapshotManagers"
+
+
+class ManagerSnapshotManagers(BaseModel):
+    objects: list["ManagerSnapshotManagersObjects"]
+    page_info: "ManagerSnapshotManagersPageInfo"
+
+
+class ManagerSnapshotManagersObjects(BaseModel):
+    uuid: UUID
+    current: Optional["ManagerSnapshotManagersObjectsCurrent"]
+
+
+class ManagerSnapshotManagersObjectsCurrent(BaseModel):
+    employee: list["ManagerSnapshotManagersObjectsCurrentEmployee"] | None
+    org_unit: list["ManagerSnapshotManagersObjectsCurrentOrgUnit"]
+    validity: "ManagerSnapshotManagersObjectsCurrentValidity"
+
+
+class ManagerSnapshotManagersObjectsCurrentEmployee(BaseModel):
+    uuid: UUID
+    engagements: list["ManagerSnapshotManagersObjectsCurrentEmployeeEngagements"]
+
+
+class ManagerSnapshotManagersObjectsCurrentEmployeeEngagements(BaseModel):
+    uuid: UUID
+    org_unit: list["ManagerSnapshotManagersObjectsCurrentEmployeeEngagementsOrgUnit"]
+
+
+class ManagerSnapshotManagersObjectsCurrentEmployeeEngagementsOrgUnit(BaseModel):
+    uuid: UUID
+
+
+class ManagerSnapshotManagersObjectsCurrentOrgUnit(BaseModel):
+    uuid: UUID
+
+
+class ManagerSnapshotManagersObjectsCurrentValidity(BaseModel):
+    from_: datetime = Field(alias="from")
+    to: datetime | None
+
+
+class ManagerSnapshotManagersPageInfo(BaseModel):
+    next_cursor: Any | None
+
+
+ManagerSnapshot.update_forward_refs()
+ManagerSnapshotManagers.update_forward_refs()
+ManagerSnapshotManagersObjects.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrent.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrentEmployee.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrentEmployeeEngagements.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrentEmployeeEngagementsOrgUnit.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrentOrgUnit.update_forward_refs()
+ManagerSnapshotManagersObjectsCurrentValidity.update_forward_refs()
+ManagerSnapshotManagersPageInfo.update_forward_refs()
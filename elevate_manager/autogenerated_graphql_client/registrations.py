@@ -0,0 +1,32 @@
+# Generated by ariadne-codegen on 2025-02-18 09:26
+# Source: queries.graphql
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from .base_model import BaseModel
+
+
+class Registrations(BaseModel):
+    registrations: "RegistrationsRegistrations"
+
+
+class RegistrationsRegistrations(BaseModel):
+    objects: list["RegistrationsRegistrationsObjects"]
+    page_info: "RegistrationsRegistrationsPageInfo"
+
+
+class RegistrationsRegistrationsObjects(BaseModel):
+    uuid: UUID
+    model: str
+    start: datetime
+
+
+class RegistrationsRegistrationsPageInfo(BaseModel):
+    next_cursor: Any | None
+
+
+Registrations.update_forward_refs()
+RegistrationsRegistrations.update_forward_refs()
+RegistrationsRegistrationsObjects.update_forward_refs()
+RegistrationsRegistrationsPageInfo.update_forward_refs()
@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for collecting concurrent lookups into batched MO requests
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+from typing import Generic
+from typing import TypeVar
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+BatchLoadFunction = Callable[[list[K]], Awaitable[dict[K, V]]]
+
+
+class Batcher(Generic[K, V]):
+    """
+    Collect keys requested by concurrent callers and load them in one batch.
+
+    Keys are collected until either `max_delay` seconds have passed since the
+    first pending key or `max_size` distinct keys are pending. The collected keys
+    are then handed to `load_batch` in a single call, and every waiting caller
+    receives the value for its own key.
+
+    Args:
+        load_batch: Coroutine function loading values for a list of keys.
+        max_delay: Maximum number of seconds to wait for more keys.
+        max_size: Maximum number of distinct keys in a single batch.
+    """
+
+    def __init__(
+        self,
+        load_batch: BatchLoadFunction[K, V],
+        max_delay: float,
+        max_size: int,
+    ) -> None:
+        self.load_batch = load_batch
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self._pending: dict[K, list[asyncio.Future[V]]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> V:
+        """
+        Load the value of a single key as part of the next batch.
+
+        Args:
+            key: The key to load.
+
+        Returns:
+            The value loaded for the key.
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[V] = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+
+        if len(self._pending) >= self.max_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._dispatch)
+
+        return await future
+
+    async def close(self) -> None:
+        """Dispatch any pending keys and wait for all running batches."""
+        self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        task = asyncio.create_task(self._run(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: dict[K, list[asyncio.Future[V]]]) -> None:
+        logger.debug("Loading batch", batch_size=len(pending))
+        try:
+            results = await self.load_batch(list(pending))
+        except Exception as error:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+            return
+
+        for key, futures in pending.items():
+            for future in futures:
+                if future.done():
+                    # The caller has given up waiting, e.g. due to cancellation.
+                    continue
+                if key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(KeyError(key))
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for failing fast while MO is unavailable
+import time
+from collections.abc import Awaitable
+from collections.abc import Callable
+from enum import Enum
+
+import httpx
+import structlog
+
+from .exceptions import CircuitOpenError
+
+logger = structlog.get_logger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker failing requests immediately while the server is down,
+    rather than having each of them wait for a timeout.
+
+    The circuit opens after `failure_threshold` consecutive requests failed to
+    connect, timed out or were answered with a 5xx status. While it is open,
+    requests raise `CircuitOpenError` without being sent. After `reset_timeout`
+    seconds, the circuit is half-open: a single probe request is sent, and the
+    circuit closes if it succeeds, or opens again if it fails.
+
+    Args:
+        failure_threshold: Number of consecutive failures opening the circuit.
+        reset_timeout: Number of seconds to keep the circuit open before probing.
+        clock: Monotonic clock returning seconds.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> CircuitState:
+        """The current state of the circuit."""
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+        if self._probing or self.clock() - self._opened_at >= self.reset_timeout:
+            return CircuitState.HALF_OPEN
+        return CircuitState.OPEN
+
+    async def run(
+        self, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Send a request unless the circuit is open, and track its outcome.
+
+        Args:
+            send: Function sending the request.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or another request is
+                probing it.
+
+        Returns:
+            The response to the request.
+        """
+        probe = self._admit()
+        try:
+            try:
+                response = await send()
+            except httpx.TransportError:
+                self._failed(probe)
+                raise
+            if response.is_server_error:
+                self._failed(probe)
+            else:
+                self._succeeded(probe)
+            return response
+        finally:
+            if probe:
+                self._probing = False
+
+    def _admit(self) -> bool:
+        if self._opened_at is None:
+            return False
+        retry_in = self._opened_at + self.reset_timeout - self.clock()
+        if self._probing or retry_in > 0:
+            raise CircuitOpenError(retry_in=max(retry_in, 0))
+        self._probing = True
+        return True
+
+    def _failed(self, probe: bool) -> None:
+        self._failures += 1
+        if probe or (
+            self._opened_at is None and self._failures >= self.failure_threshold
+        ):
+            logger.warning("Opening circuit to MO", failures=self._failures)
+            self._opened_at = self.clock()
+
+    def _succeeded(self, probe: bool) -> None:
+        self._failures = 0
+        if probe:
+            logger.info("Closing circuit to MO")
+            self._opened_at = None
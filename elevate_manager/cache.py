@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for remembering the current managers of organisation units
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterable
+from uuid import UUID
+
+from .metrics import org_unit_managers_cache_hits
+from .metrics import org_unit_managers_cache_misses
+
+
+class OrgUnitManagersCache:
+    """
+    Remember the current managers of the organisation units we elevated managers
+    in, so an event which waited for another event of the same unit need not
+    read the manager from MO again.
+
+    Entries are written after our own mutations, and must be invalidated when an
+    event tells that the managers of a unit changed: both the unit the event is
+    about, and every unit listing the manager of the event, as the manager may
+    have been moved, vacated or terminated. As a safety net against changes we
+    are not told about, entries are forgotten after `ttl` seconds. At most
+    `max_size` units are remembered; the least recently used are forgotten first.
+
+    Args:
+        ttl: Number of seconds to remember the managers of a unit for.
+        max_size: Maximum number of units to remember.
+        clock: Monotonic clock returning seconds.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # Expiry time and current managers per unit, least recently used first
+        self._managers: OrderedDict[UUID, tuple[float, frozenset[UUID]]] = OrderedDict()
+        # Units listing each manager, to invalidate them by manager
+        self._org_units: dict[UUID, set[UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+    def get(self, org_unit_uuid: UUID) -> frozenset[UUID] | None:
+        """
+        Get the current managers of the organisation unit.
+
+        Args:
+            org_unit_uuid: UUID of the organisation unit.
+
+        Returns:
+            UUIDs of the current managers, or None if not known.
+        """
+        expires, managers = self._managers.get(org_unit_uuid, (0.0, None))
+        if managers is None or expires <= self.clock():
+            self.invalidate(org_unit_uuid)
+            org_unit_managers_cache_misses.inc()
+            return None
+        self._managers.move_to_end(org_unit_uuid)
+        org_unit_managers_cache_hits.inc()
+        return managers
+
+    def put(self, org_unit_uuid: UUID, manager_uuids: Iterable[UUID]) -> None:
+        """
+        Remember the current managers of the organisation unit.
+
+        Args:
+            org_unit_uuid: UUID of the organisation unit.
+            manager_uuids: UUIDs of its current managers.
+        """
+        self.invalidate(org_unit_uuid)
+        managers = frozenset(manager_uuids)
+        self._managers[org_unit_uuid] = (self.clock() + self.ttl, managers)
+        for manager_uuid in managers:
+            self._org_units.setdefault(manager_uuid, set()).add(org_unit_uuid)
+        while len(self._managers) > self.max_size:
+            self.invalidate(next(iter(self._managers)))
+
+    def invalidate(self, org_unit_uuid: UUID) -> None:
+        """
+        Forget the managers of the organisation unit, e.g. because they changed.
+
+        Args:
+            org_unit_uuid: UUID of the organisation unit.
+        """
+        _, managers = self._managers.pop(org_unit_uuid, (0.0, frozenset()))
+        for manager_uuid in managers:
+            org_units = self._org_units[manager_uuid]
+            org_units.discard(org_unit_uuid)
+            if not org_units:
+                del self._org_units[manager_uuid]
+
+    def invalidate_manager(self, manager_uuid: UUID) -> None:
+        """
+        Forget the managers of every organisation unit listing the manager, e.g.
+        because the manager was edited.
+
+        Args:
+            manager_uuid: UUID of the manager.
+        """
+        for org_unit_uuid in list(self._org_units.get(manager_uuid, ())):
+            self.invalidate(org_unit_uuid)
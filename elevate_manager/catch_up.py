@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for catching up on the manager changes registered in MO
+import os
+from collections.abc import AsyncIterator
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from pathlib import Path
+from uuid import UUID
+
+import structlog
+
+from .client import GraphQLClient
+from .echo import EchoFilter
+from .mo import get_registration_pages
+from .reconcile import ReconciliationResult
+from .reconcile import reconcile
+from .scheduling import KeyedLocks
+from .snapshot import OrgStructureIndex
+
+logger = structlog.get_logger(__name__)
+
+# Registrations are made visible when their transaction commits, which may be
+# after registrations starting later, so each catch-up starts this much earlier.
+_CATCH_UP_MARGIN = timedelta(minutes=5)
+
+
+class Checkpoint:
+    """
+    The time in MO up to which all manager changes have been caught up on,
+    persisted in a file so it survives restarts.
+
+    Args:
+        path: The file the checkpoint is kept in.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def load(self) -> datetime | None:
+        """
+        Load the checkpoint.
+
+        Returns:
+            The time of the checkpoint, or None if there is none yet.
+        """
+        try:
+            return datetime.fromisoformat(self.path.read_text().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self, timestamp: datetime) -> None:
+        """
+        Save the checkpoint, replacing the previous one atomically.
+
+        Args:
+            timestamp: The time in MO all changes have been caught up on until.
+        """
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(timestamp.isoformat())
+        os.replace(temporary, self.path)
+
+
+async def catch_up(
+    gql_client: GraphQLClient,
+    checkpoint: Checkpoint,
+    page_size: int,
+    concurrency: int,
+    single_request: bool = True,
+    termination_concurrency: int = 1,
+    org_unit_locks: KeyedLocks[UUID] | None = None,
+    echo_filter: EchoFilter | None = None,
+    org_structure: OrgStructureIndex | None = None,
+) -> ReconciliationResult:
+    """
+    Apply the missing elevations of the managers changed in MO since the
+    checkpoint, e.g. because their events were lost during an AMQP outage.
+
+    The changed managers are read from the manager registrations a page at a
+    time, and each page is reconciled as a batch. The checkpoint is advanced as
+    the pages are applied, but not past a page with failed elevations, so those
+    are retried by the next catch-up.
+
+    Args:
+        gql_client: A GraphQL client to perform the queries and mutations
+        checkpoint: The checkpoint to catch up from, and to advance
+        page_size: Number of registrations to read per page
+        concurrency: Maximum number of elevations applied at once
+        single_request: Whether to apply all mutations of an elevation in a
+            single request
+        termination_concurrency: Maximum number of concurrent terminations when
+            the mutations are not applied in a single request
+        org_unit_locks: Optional locks shared with the event listener, so that
+            elevations of the same organisation unit are applied one at a time
+        echo_filter: Optional filter to tell about the managers we terminate
+        org_structure: Optional snapshot of the org structure shared with the
+            event listener, to apply the elevations to
+    Returns:
+        The number of managers read, and of elevations found and applied
+    """
+    started = datetime.now(timezone.utc)
+    since = checkpoint.load()
+    if since is None:
+        # Without a checkpoint, the changes already missed are not known; a full
+        # reconciliation is needed for those.
+        logger.info("No catch-up checkpoint, catching up from now on")
+        checkpoint.save(started)
+        return ReconciliationResult()
+
+    # Latest registration of each page of managers
+    page_ends: list[datetime] = []
+    failed = False
+
+    async def changed_manager_pages() -> AsyncIterator[list[UUID]]:
+        seen: set[UUID] = set()
+        async for registrations in get_registration_pages(
+            gql_client, ["manager"], since - _CATCH_UP_MARGIN, page_size
+        ):
+            # Managers changed several times are only elevated once.
+            manager_uuids = list(
+                dict.fromkeys(r.uuid for r in registrations if r.uuid not in seen)
+            )
+            seen.update(manager_uuids)
+            end = max(r.start for r in registrations)
+            if not manager_uuids:
+                continue
+            page_ends.append(end)
+            yield manager_uuids
+
+    def page_applied(page: int, page_failed: int) -> None:
+        nonlocal failed
+        failed = failed or page_failed > 0
+        if not failed:
+            checkpoint.save(page_ends[page])
+
+    result = await reconcile(
+        gql_client,
+        page_size=page_size,
+        concurrency=concurrency,
+        single_request=single_request,
+        termination_concurrency=termination_concurrency,
+        org_unit_locks=org_unit_locks,
+        echo_filter=echo_filter,
+        org_structure=org_structure,
+        manager_pages=changed_manager_pages(),
+        page_applied=page_applied,
+    )
+    if not failed:
+        checkpoint.save(started)
+    logger.info("Caught up on manager changes", since=since.isoformat(), failed=failed)
+    return result
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module containing the command line interface
+import asyncio
+import sys
+
+import click
+from authlib.integrations.httpx_client import AsyncOAuth2Client  # type: ignore[import-untyped]
+
+from .client import GraphQLClient
+from .config import Settings
+from .dry_run import PlanWriter
+from .main import GRAPHQL_VERSION
+from .reconcile import reconcile
+from .retry import RetryPolicy
+
+
+async def run_reconcile(
+    settings: Settings, page_size: int, concurrency: int, dry_run: bool
+) -> None:
+    fastramqpi = settings.fastramqpi
+    # Authenticated the same way as the GraphQL client of FastRAMQPI.
+    mo_client = AsyncOAuth2Client(
+        base_url=fastramqpi.mo_url,
+        client_id=fastramqpi.client_id,
+        client_secret=fastramqpi.client_secret.get_secret_value(),
+        grant_type="client_credentials",
+        token_endpoint=f"{fastramqpi.auth_server}/realms/{fastramqpi.auth_realm}/protocol/openid-connect/token",
+        token={"expires_at": -1, "access_token": ""},
+        timeout=fastramqpi.graphql_timeout,
+    )
+    async with (
+        mo_client,
+        GraphQLClient(
+            url=f"{fastramqpi.mo_url}/graphql/v{GRAPHQL_VERSION}",
+            http_client=mo_client,
+        ) as gql_client,
+    ):
+        gql_client.retry_policy = RetryPolicy(
+            attempts=settings.mo_retry_attempts,
+            base_delay=settings.mo_retry_base_delay,
+            max_delay=settings.mo_retry_max_delay,
+        )
+        result = await reconcile(
+            gql_client,
+            page_size=page_size,
+            concurrency=concurrency,
+            single_request=settings.single_request_elevation,
+            termination_concurrency=settings.termination_concurrency,
+            plan_writer=PlanWriter(sys.stdout) if dry_run else None,
+        )
+    # The planned operations of a dry run are written to stdout.
+    click.echo(
+        f"Read {result.managers} managers, applied {result.elevated} of "
+        f"{result.planned} missing elevations ({result.skipped} no longer needed, "
+        f"{result.failed} failed)",
+        err=True,
+    )
+
+
+@click.group()
+def cli() -> None:
+    """Elevate managers in OS2mo."""
+
+
+@cli.command("reconcile")
+@click.option("--page-size", type=int, help="Number of managers read per query.")
+@click.option("--concurrency", type=int, help="Maximum concurrent elevations.")
+@click.option(
+    "--dry-run", is_flag=True, help="Write the planned operations as JSON lines."
+)
+def reconcile_command(
+    page_size: int | None, concurrency: int | None, dry_run: bool
+) -> None:
+    """
+    Elevate all managers whose elevation is missing in MO, e.g. because their
+    events were lost during an outage.
+
+    Should not run while the AMQP listener processes a large backlog of events,
+    as events for the same org units are not held back.
+    """
+    settings = Settings()
+    asyncio.run(
+        run_reconcile(
+            settings,
+            page_size=page_size or settings.reconcile_page_size,
+            concurrency=concurrency or settings.reconcile_concurrency,
+            dry_run=dry_run,
+        )
+    )
+
+
+if __name__ == "__main__":
+    cli()
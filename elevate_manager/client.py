@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module extending the autogenerated GraphQL client
+import re
+from dataclasses import dataclass
+from dataclasses import field
+from functools import partial
+from typing import Any
+from typing import NamedTuple
+from uuid import UUID
+
+import httpx
+from pydantic import BaseModel
+
+from .autogenerated_graphql_client import GraphQLClient as _GraphQLClient
+from .autogenerated_graphql_client import GraphQLClientGraphQLError
+from .autogenerated_graphql_client import GraphQLClientGraphQLMultiError
+from .autogenerated_graphql_client import GraphQLClientHttpError
+from .autogenerated_graphql_client import GraphQlClientInvalidResponseError
+from .breaker import CircuitBreaker
+from .limiting import AdaptiveLimiter
+from .retry import RetryPolicy
+from .tracing import span
+from .tracing import traceparent
+
+# Type and name of the operation of a GraphQL document
+_OPERATION = re.compile(r"\b(query|mutation)\s+(\w+)")
+
+
+async def _add_trace_header(request: httpx.Request) -> None:
+    header = traceparent()
+    if header is not None:
+        request.headers["traceparent"] = header
+
+
+class AliasedMutation(NamedTuple):
+    """A single mutation field to send as part of an aliased mutation document."""
+
+    # Name of the mutation field, e.g. "manager_terminate"
+    field: str
+    # Name of the GraphQL input type, e.g. "ManagerTerminateInput"
+    input_type: str
+    input: BaseModel
+
+
+@dataclass
+class AliasedMutationResult:
+    """The outcome of each alias in an aliased mutation document."""
+
+    # UUIDs returned by the mutations which succeeded
+    uuids: dict[str, UUID] = field(default_factory=dict)
+    # Errors reported by MO for the mutations which failed
+    errors: dict[str, GraphQLClientGraphQLError] = field(default_factory=dict)
+
+
+class GraphQLClient(_GraphQLClient):
+    """The autogenerated GraphQL client, extended with hand-written operations."""
+
+    # Optional circuit breaker and limit on the concurrent requests to MO, set up
+    # after the client is created by FastRAMQPI
+    circuit_breaker: CircuitBreaker | None = None
+    concurrency_limiter: AdaptiveLimiter | None = None
+    # Retries of the requests failing with transient errors. Each request is
+    # retried on its own, so the requests which succeeded before it are not sent
+    # again.
+    retry_policy: RetryPolicy = RetryPolicy()
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Requests carry the trace of the event, so that slow events can be
+        # matched with the logs of MO.
+        self.http_client.event_hooks["request"].append(_add_trace_header)
+
+    async def execute(
+        self, query: str, variables: dict[str, Any] | None = None
+    ) -> httpx.Response:
+        operation = _OPERATION.search(query)
+        with span(
+            "graphql", operation=operation.group(2) if operation else None
+        ) as current:
+            response = await self._execute(query, variables)
+            if current is not None:
+                current.attributes["status_code"] = response.status_code
+                current.attributes["response_size"] = len(response.content)
+            return response
+
+    async def _execute(
+        self, query: str, variables: dict[str, Any] | None
+    ) -> httpx.Response:
+        send = partial(super().execute, query, variables)
+        if self.concurrency_limiter is not None:
+            send = partial(self.concurrency_limiter.run, send)
+        # Requests are rejected while the circuit is open without waiting for the
+        # concurrency limit.
+        if self.circuit_breaker is not None:
+            send = partial(self.circuit_breaker.run, send)
+        return await send()
+
+    async def aliased_mutations(
+        self, mutations: dict[str, AliasedMutation]
+    ) -> AliasedMutationResult:
+        """
+        Send several mutations in a single GraphQL document using aliases.
+
+        GraphQL executes mutation fields serially, in order. The result of every
+        mutation in MO's schema is non-null, so when one of the fields fails, the
+        error nulls the whole `data` of the response. The failing alias is then
+        reported as an error, while the aliases before it, which may well have
+        been applied, and those after it, which are not executed by a
+        spec-compliant server, are reported as neither UUID nor error. Callers
+        must treat such aliases as of unknown outcome.
+
+        Args:
+            mutations: The mutations to send, by alias.
+
+        Returns:
+            The returned UUID or error for each alias whose outcome is known.
+        """
+        definitions = ", ".join(
+            f"${alias}: {mutation.input_type}!" for alias, mutation in mutations.items()
+        )
+        fields = "\n".join(
+            f"  {alias}: {mutation.field}(input: ${alias}) {{ uuid }}"
+            for alias, mutation in mutations.items()
+        )
+        query = f"mutation AliasedMutations({definitions}) {{\n{fields}\n}}"
+        variables: dict[str, object] = {
+            alias: mutation.input for alias, mutation in mutations.items()
+        }
+        response = await self.execute(query=query, variables=variables)
+
+        # Unlike `get_data`, errors which belong to a single alias do not fail the
+        # whole request, as the other aliases may still have been applied.
+        if not response.is_success:
+            raise GraphQLClientHttpError(
+                status_code=response.status_code, response=response
+            )
+        try:
+            response_json = response.json()
+        except ValueError as exc:
+            raise GraphQlClientInvalidResponseError(response=response) from exc
+        if (not isinstance(response_json, dict)) or ("data" not in response_json):
+            raise GraphQlClientInvalidResponseError(response=response)
+
+        data: dict[str, Any] = response_json["data"] or {}
+        errors = [
+            GraphQLClientGraphQLError.from_dict(error)
+            for error in response_json.get("errors") or []
+        ]
+
+        result = AliasedMutationResult()
+        for error in errors:
+            alias = error.path[0] if error.path else None
+            if alias is None or alias not in mutations:
+                # Errors without an alias, such as validation errors, concern the
+                # document as a whole.
+                raise GraphQLClientGraphQLMultiError(errors=errors, data=data)
+            result.errors[alias] = error
+        for alias in mutations:
+            if data.get(alias) is not None:
+                result.uuids[alias] = UUID(data[alias]["uuid"])
+        return result
@@ -1,5 +1,7 @@
 # SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
+from pathlib import Path
+
 from fastramqpi.config import Settings as FastRAMQPISettings
 from pydantic import BaseSettings
 
@@ -9,6 +11,107 @@ class Settings(BaseSettings):
 
     log_level: str = "INFO"
 
+    # Concurrent lookups are collected for up to `batch_max_delay` seconds, or
+    # until `batch_max_size` UUIDs are pending, and sent to MO as one query.
+    batch_max_delay: float = 0.05
+    batch_max_size: int = 100
+
+    # Apply the terminations and the engagement move of an elevation as aliased
+    # mutations in a single request, rather than one request per mutation.
+    single_request_elevation: bool = True
+
+    # Adapt the number of concurrent requests to MO to its health: starting from
+    # `mo_concurrency_initial`, the limit grows by one per round of requests
+    # answered within `mo_latency_target` seconds, up to `mo_concurrency_max`, and
+    # is halved when MO is slower, overloaded (429 or 5xx) or unreachable.
+    mo_adaptive_concurrency: bool = False
+    mo_concurrency_initial: int = 10
+    mo_concurrency_min: int = 1
+    mo_concurrency_max: int = 100
+    mo_latency_target: float = 2.0
+
+    # Requests to MO fail immediately for `mo_circuit_reset_timeout` seconds after
+    # `mo_circuit_failure_threshold` consecutive requests failed with a 5xx status
+    # or a connection error, after which a single request probes whether MO is up.
+    mo_circuit_breaker: bool = True
+    mo_circuit_failure_threshold: int = 5
+    mo_circuit_reset_timeout: float = 30
+
+    # Requests to MO failing with timeouts, connection errors or 429/502/503/504
+    # are attempted up to `mo_retry_attempts` times, waiting a random delay of up
+    # to `mo_retry_base_delay` seconds, doubled per retry up to `mo_retry_max_delay`.
+    mo_retry_attempts: int = 3
+    mo_retry_base_delay: float = 0.5
+    mo_retry_max_delay: float = 10
+
+    # Maximum number of concurrent manager terminations when the elevation is
+    # not applied in a single request.
+    termination_concurrency: int = 5
+
+    # If positive, bursts of events for the same manager, e.g. a create followed by
+    # edits, are processed once no new event arrived for `debounce_quiet_period`
+    # seconds. Each event then waits that long, holding one of the prefetched
+    # messages, so debouncing is only worth it where such bursts are common.
+    debounce_quiet_period: float = 0
+
+    # Events for the same org unit are processed one at a time. The number of
+    # recently processed org units remembered to detect stale reads.
+    org_unit_lock_history_size: int = 10_000
+
+    # The managers of an org unit are remembered after an elevation, so waiting
+    # events for the same org unit need not read them again. Entries expire after
+    # `org_unit_cache_ttl` seconds; at most `org_unit_cache_max_size` are kept.
+    org_unit_cache_ttl: float = 60
+    org_unit_cache_max_size: int = 10_000
+
+    # Events for managers we terminated ourselves are dropped if they arrive
+    # within `echo_ttl` seconds. At most `echo_max_size` managers are remembered.
+    echo_ttl: float = 300
+    echo_max_size: int = 10_000
+
+    # Reconciliation reads `reconcile_page_size` managers per query, and applies
+    # up to `reconcile_concurrency` missing elevations at once.
+    reconcile_page_size: int = 500
+    reconcile_concurrency: int = 10
+
+    # If set, the managers changed in MO since the checkpoint kept in this file are
+    # elevated every `catch_up_interval` seconds, `catch_up_page_size` at a time,
+    # so events lost e.g. during an AMQP outage need not be replayed. Catching up is
+    # off while running dry.
+    catch_up_checkpoint_path: Path | None = None
+    catch_up_interval: float = 300
+    catch_up_page_size: int = 1000
+
+    # If set, elevations are recorded in this SQLite database while they are
+    # applied, and those interrupted by a crash are resumed on startup.
+    outbox_path: Path | None = None
+
+    # If set, the traces of the events, from the listener down to each request to
+    # MO, are appended to this file as JSON lines, e.g. to /dev/stdout. Requests
+    # to MO carry the trace in a W3C `traceparent` header.
+    tracing_path: Path | None = None
+
+    # The delay of a callback scheduled on the event loop every
+    # `loop_monitor_interval` seconds is exported as a histogram, and the stack of
+    # the loop is logged once it has been blocked for `loop_slow_threshold` seconds.
+    loop_monitor: bool = True
+    loop_monitor_interval: float = 0.1
+    loop_slow_threshold: float = 0.5
+
+    # Load the current managers of all org units, and the engagements of their
+    # employees, into memory at startup, `snapshot_page_size` managers per query.
+    # The snapshot is kept current from events, which then only read the manager
+    # itself, rather than its whole org unit.
+    snapshot_enabled: bool = False
+    snapshot_page_size: int = 500
+    # If set, the snapshot is saved to this file on shutdown. On startup, it is
+    # loaded from the file, and only the changes registered in MO since are read.
+    snapshot_path: Path | None = None
+
+    # If set, events are planned but not applied, and the planned operations are
+    # appended to this file as JSON lines.
+    dry_run_path: Path | None = None
+
     class Config:
         """Settings are frozen."""
 
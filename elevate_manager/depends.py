@@ -1,16 +1,56 @@
 # SPDX-FileCopyrightText: 2023 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
 from typing import Annotated
+from uuid import UUID
 
 from fastapi import Depends
 from fastramqpi.depends import from_user_context
 from fastramqpi.ramqp.depends import from_context
 
-from .autogenerated_graphql_client import (
-    GraphQLClient as _GraphQLClient,
-)
+from .cache import OrgUnitManagersCache as _OrgUnitManagersCache
+from .client import GraphQLClient as _GraphQLClient
 from .config import Settings as _Settings
+from .dry_run import PlanWriter as _PlanWriter
+from .echo import EchoFilter as _EchoFilter
+from .mo import ManagerElevationBatcher as _ManagerElevationBatcher
+from .outbox import Outbox as _Outbox
+from .profiling import Profiler as _Profiler
+from .reconcile import ReconciliationJobs as _ReconciliationJobs
+from .snapshot import OrgStructureIndex as _OrgStructureIndex
+from .scheduling import Debouncer
+from .scheduling import KeyedLocks
 
 GraphQLClient = Annotated[_GraphQLClient, Depends(from_context("graphql_client"))]
 
 Settings = Annotated[_Settings, Depends(from_user_context("settings"))]
+
+ManagerElevationBatcher = Annotated[
+    _ManagerElevationBatcher,
+    Depends(from_user_context("manager_elevation_batcher")),
+]
+
+ManagerDebouncer = Annotated[
+    Debouncer[UUID] | None, Depends(from_user_context("manager_debouncer"))
+]
+
+OrgUnitLocks = Annotated[KeyedLocks[UUID], Depends(from_user_context("org_unit_locks"))]
+
+OrgUnitManagersCache = Annotated[
+    _OrgUnitManagersCache, Depends(from_user_context("org_unit_managers_cache"))
+]
+
+EchoFilter = Annotated[_EchoFilter, Depends(from_user_context("echo_filter"))]
+
+PlanWriter = Annotated[_PlanWriter | None, Depends(from_user_context("plan_writer"))]
+
+ReconciliationJobs = Annotated[
+    _ReconciliationJobs, Depends(from_user_context("reconciliation_jobs"))
+]
+
+OrgStructure = Annotated[
+    _OrgStructureIndex | None, Depends(from_user_context("org_structure"))
+]
+
+Outbox = Annotated[_Outbox | None, Depends(from_user_context("outbox"))]
+
+Profiler = Annotated[_Profiler, Depends(from_user_context("profiler"))]
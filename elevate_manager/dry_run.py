@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for writing elevation plans instead of applying them
+import json
+from typing import Any
+from typing import TextIO
+
+from .models import ElevationPlan
+
+
+class PlanWriter:
+    """
+    Write the operations of elevation plans as JSON lines, so the read cost and
+    write volume of e.g. a large import can be measured without mutating MO.
+
+    Each line is a `TerminateManager` or `MoveEngagement` operation, along with
+    the number of seconds spent reading MO to plan it.
+
+    Args:
+        stream: Text stream to write the JSON lines to.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.operations = 0
+
+    def write(self, plan: ElevationPlan, read_seconds: float) -> None:
+        """
+        Write the operations of the plan.
+
+        Args:
+            plan: The plan of changes which would have been made in MO.
+            read_seconds: Number of seconds spent reading MO to make the plan.
+        """
+        common = {
+            "manager_uuid": str(plan.manager_uuid),
+            "org_unit_uuid": str(plan.org_unit_uuid),
+            "read_seconds": read_seconds,
+        }
+        for uuid in plan.managers_to_terminate:
+            self._write({"operation": "TerminateManager", "uuid": str(uuid), **common})
+        if plan.move_engagement:
+            self._write(
+                {
+                    "operation": "MoveEngagement",
+                    "uuid": str(plan.engagement_uuid),
+                    **common,
+                }
+            )
+        self.stream.flush()
+
+    def _write(self, operation: dict[str, Any]) -> None:
+        self.stream.write(json.dumps(operation) + "\n")
+        self.operations += 1
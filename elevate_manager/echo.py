@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for recognising events caused by our own mutations
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterable
+from uuid import UUID
+
+
+class EchoFilter:
+    """
+    Remember the managers we are about to mutate, so the events MO publishes in
+    response to our own mutations can be dropped without querying MO.
+
+    Each expected echo is consumed by the first matching event, and forgotten
+    after `ttl` seconds if no such event arrives. At most `max_size` managers are
+    remembered; the oldest are forgotten first.
+
+    Args:
+        ttl: Number of seconds to expect an echo for.
+        max_size: Maximum number of managers to remember.
+        clock: Monotonic clock returning seconds.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # Expiry time and number of expected echoes per manager, oldest first
+        self._expected: OrderedDict[UUID, tuple[float, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._expected)
+
+    def expect(self, manager_uuids: Iterable[UUID]) -> None:
+        """
+        Expect an echo for each of the managers.
+
+        Args:
+            manager_uuids: UUIDs of the managers about to be mutated.
+        """
+        now = self.clock()
+        for uuid in manager_uuids:
+            _, count = self._expected.pop(uuid, (0.0, 0))
+            self._expected[uuid] = (now + self.ttl, count + 1)
+        self._evict(now)
+
+    def forget(self, manager_uuids: Iterable[UUID]) -> None:
+        """
+        Stop expecting an echo for each of the managers, e.g. because the
+        mutation failed and no event will be published.
+
+        Args:
+            manager_uuids: UUIDs of the managers which were not mutated.
+        """
+        for uuid in manager_uuids:
+            self._consume(uuid)
+
+    def is_echo(self, manager_uuid: UUID) -> bool:
+        """
+        Whether an event for the manager is the echo of our own mutation.
+
+        Args:
+            manager_uuid: UUID of the manager the event is about.
+
+        Returns:
+            True if an echo was expected, in which case it is consumed.
+        """
+        self._evict(self.clock())
+        return self._consume(manager_uuid)
+
+    def _consume(self, manager_uuid: UUID) -> bool:
+        if manager_uuid not in self._expected:
+            return False
+        expires, count = self._expected[manager_uuid]
+        if count > 1:
+            self._expected[manager_uuid] = (expires, count - 1)
+        else:
+            del self._expected[manager_uuid]
+        return True
+
+    def _evict(self, now: float) -> None:
+        while self._expected:
+            uuid, (expires, _) = next(iter(self._expected.items()))
+            if expires > now and len(self._expected) <= self.max_size:
+                break
+            del self._expected[uuid]
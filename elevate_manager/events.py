@@ -1,67 +1,92 @@
 # SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
+import time
+from enum import Enum
 from uuid import UUID
 
 import structlog
 from more_itertools import one
 
-from .autogenerated_graphql_client import GraphQLClient
-from .mo import get_existing_managers
-from .mo import get_manager_engagements
+from .autogenerated_graphql_client.manager_elevation import ManagerElevationManagers
+from .cache import OrgUnitManagersCache
+from .client import GraphQLClient
+from .dry_run import PlanWriter
+from .echo import EchoFilter
+from .exceptions import ElevationError
+from .metrics import elevations_skipped
+from .metrics import engagement_moves_skipped
+from .metrics import events_collapsed
+from .metrics import events_debounced
+from .metrics import events_processed
+from .metrics import stage_seconds
+from .mo import ManagerElevationBatcher
+from .mo import apply_elevation
+from .mo import get_manager_elevation
 from .mo import move_engagement
-from .mo import terminate_existing_managers
+from .mo import terminate_managers
+from .models import ElevationPlan
+from .outbox import Outbox
+from .scheduling import Debouncer
+from .scheduling import KeyedLocks
+from .snapshot import OrgStructureIndex
+from .snapshot import refresh_managers
+from .tracing import set_attributes
+from .tracing import span
 
 logger = structlog.get_logger(__name__)
 
 
-async def process_manager_event(
-    gql_client: GraphQLClient,
+class EventOutcome(str, Enum):
+    """How the processing of a manager event ended, as counted in the metrics."""
+
+    ELEVATED = "elevated"
+    NOTHING_TO_DO = "nothing_to_do"
+    # The manager cannot be elevated, e.g. as it has no employee
+    SKIPPED = "skipped"
+    ECHO = "echo"
+    DEBOUNCED = "debounced"
+    COLLAPSED = "collapsed"
+    MOVED = "moved"
+    DRY_RUN = "dry_run"
+    FAILED = "failed"
+
+
+def plan_elevation(
     manager_uuid: UUID,
-) -> None:
+    manager_elevation: ManagerElevationManagers,
+) -> ElevationPlan | None:
     """
-    We process the various events made to an organisation unit and its manager.
-    This includes finding the managers potential engagement, terminating existing
-    manager(s) if the organisation unit has pre-existing manager(s) occupying the
-    position and transferring the new managers engagement so that it sits
-    appropriately in the same organisation unit where the manager role resides.
+    Decide which changes are required to elevate the manager, based on the
+    manager, the employee's engagements and the current managers of the
+    organisation unit as returned by a single ManagerElevation query.
 
     Args:
-        gql_client: A GraphQL client to perform the various queries
         manager_uuid: UUID of the new manager
+        manager_elevation: The ManagerElevation query response for the manager
     Returns:
-        A successful transfer of an engagement or None
+        The plan of changes to make in MO, or None if nothing can be done
     """
-    logger.debug(
-        "Processing manager event",
-        manager_uuid=manager_uuid,
-    )
-
-    # Trying to handle the possibility of the manager not being an employee.
-    try:
-        manager_engagements = await get_manager_engagements(gql_client, manager_uuid)
-    # Return None gracefully, if the manager object has no employee attached to it.
-    except ValueError:
-        logger.error("No employee was found in the manager object")
-        return None
-
     try:
         # Extracting manager objects.
-        manager_objects = one(manager_engagements.objects).current
+        manager_objects = one(manager_elevation.objects).current
     except ValueError:
         logger.error("No manager objects found")
+        elevations_skipped.labels(reason="no_manager").inc()
         return None
 
     if manager_objects is None:
         logger.error("No current manager object found")
+        elevations_skipped.labels(reason="no_current_manager").inc()
         return None
 
     if manager_objects.employee is None:
         logger.error("No employee object found")
+        elevations_skipped.labels(reason="no_employee").inc()
         return None
 
-    # This should always return one employee.
+    # This should always return one employee and one organisation unit.
     employee = one(manager_objects.employee)
-    manager_ou_uuid = manager_objects.org_unit_uuid
+    org_unit = one(manager_objects.org_unit)
 
     # Trying to handle the possibility of multiple engagements attached to the manager.
     try:
@@ -72,24 +97,510 @@ async def process_manager_event(
         logger.error(
             "Manager does not have exactly one engagement, and engagement can not be moved"
         )
+        elevations_skipped.labels(reason="not_one_engagement").inc()
         return None
-    # Uuid of engagement to move to the managers new organisation unit.
-    engagement_uuid_to_be_moved = employee_engagement.uuid
+
+    engagement_org_units = {ou.uuid for ou in employee_engagement.org_unit}
+
+    return ElevationPlan(
+        manager_uuid=manager_uuid,
+        org_unit_uuid=org_unit.uuid,
+        # Uuid of engagement to move to the managers new organisation unit.
+        engagement_uuid=employee_engagement.uuid,
+        # Pre-existing managers occupying the position.
+        managers_to_terminate=[
+            m.uuid for m in org_unit.managers if m.uuid != manager_uuid
+        ],
+        # Moving the engagement to where it already is would only add a new
+        # registration in MO.
+        move_engagement=org_unit.uuid not in engagement_org_units,
+    )
+
+
+async def get_elevation_plan(
+    gql_client: GraphQLClient,
+    manager_uuid: UUID,
+    manager_elevation_batcher: ManagerElevationBatcher | None = None,
+) -> ElevationPlan | None:
+    """
+    Read the manager from MO and decide which changes are required to elevate it.
+
+    Args:
+        gql_client: A GraphQL client to perform the query
+        manager_uuid: UUID of the new manager
+        manager_elevation_batcher: Optional batcher merging the manager lookup
+            with those of concurrent events
+    Returns:
+        The plan of changes to make in MO, or None if nothing can be done
+    """
+    # Trying to handle the possibility of the manager not being an employee.
+    try:
+        manager_elevation = await get_manager_elevation(
+            gql_client, manager_uuid, manager_elevation_batcher
+        )
+    # Return None gracefully, if the manager object has no employee attached to it.
+    except ValueError:
+        logger.error("No employee was found in the manager object")
+        elevations_skipped.labels(reason="invalid_manager").inc()
+        return None
+
+    return plan_elevation(manager_uuid, manager_elevation)
+
+
+async def execute_elevation_plan(
+    gql_client: GraphQLClient,
+    plan: ElevationPlan,
+    single_request: bool = True,
+    termination_concurrency: int = 1,
+    echo_filter: EchoFilter | None = None,
+    outbox: Outbox | None = None,
+    org_structure: OrgStructureIndex | None = None,
+) -> bool:
+    """
+    Terminate the existing managers and move the new managers engagement.
+
+    In a single request, the mutations are executed in order and the first
+    failure stops the rest, so neither the remaining terminations nor the move
+    are applied. Otherwise, all terminations are attempted, even if some fail,
+    and the engagement is only moved once every termination succeeded.
+
+    Args:
+        gql_client: A GraphQL client to perform the mutations
+        plan: The plan of changes to make in MO
+        single_request: Whether to apply all mutations in a single request
+        termination_concurrency: Maximum number of concurrent terminations when
+            the mutations are not applied in a single request
+        echo_filter: Optional filter to tell about the managers we terminate
+        outbox: Optional outbox to record the elevation in while it is applied
+        org_structure: Optional snapshot of the org structure to apply the
+            elevation to, as the echo filter drops the events telling about it
+    Returns:
+        Whether any changes were made, i.e. the manager was not elevated already
+    """
+    if not plan.move_engagement:
+        engagement_moves_skipped.inc()
+        if not plan.managers_to_terminate:
+            logger.info("Manager engagement already in place, nothing to do")
+            return False
 
     logger.info(
         "Moving manager engagement and terminate old manager(s)",
-        new_ou_for_eng=str(manager_ou_uuid),
+        new_ou_for_eng=str(plan.org_unit_uuid),
     )
 
-    # Finding potential existing managers.
-    existing_managers = await get_existing_managers(manager_ou_uuid, gql_client)
+    # Recorded before the first mutation, so an elevation interrupted by a crash
+    # can be resumed from the operations not applied yet.
+    elevation = outbox.add(plan) if outbox is not None else None
+    try:
+        await _apply_elevation_plan(
+            gql_client,
+            plan,
+            single_request,
+            termination_concurrency,
+            echo_filter,
+            outbox,
+            elevation,
+        )
+    except Exception:
+        # Some of the mutations may have been applied, so the managers involved
+        # are read again.
+        if org_structure is not None:
+            await refresh_managers(
+                gql_client,
+                org_structure,
+                [plan.manager_uuid, *plan.managers_to_terminate],
+            )
+        raise
+    finally:
+        if outbox is not None and elevation is not None:
+            outbox.remove(elevation)
+    if org_structure is not None:
+        org_structure.apply(plan)
+    return True
+
+
+async def _apply_elevation_plan(
+    gql_client: GraphQLClient,
+    plan: ElevationPlan,
+    single_request: bool,
+    termination_concurrency: int,
+    echo_filter: EchoFilter | None,
+    outbox: Outbox | None,
+    elevation: int | None,
+) -> None:
+    # MO may publish the events for the terminations before we get a response, so
+    # the echoes are expected up front, and forgotten again if the mutation fails.
+    if echo_filter is not None:
+        echo_filter.expect(plan.managers_to_terminate)
+
+    if single_request:
+        try:
+            result = await apply_elevation(gql_client, plan)
+        except Exception:
+            if echo_filter is not None:
+                echo_filter.forget(plan.managers_to_terminate)
+            raise
+        # Terminations of unknown outcome are forgotten as well. Should they have
+        # been applied after all, their echo is processed as a regular event,
+        # which finds no current manager to elevate.
+        if echo_filter is not None:
+            echo_filter.forget(
+                uuid
+                for index, uuid in enumerate(plan.managers_to_terminate)
+                if f"terminate_{index}" not in result.uuids
+            )
+        if result.errors:
+            raise ElevationError(plan.manager_uuid, result.errors)
+        logger.info(
+            "Existing managers terminated and manager engagement moved",
+            terminated=len(plan.managers_to_terminate),
+        )
+        return None
+
     # Terminating pre-existing managers.
-    await terminate_existing_managers(
-        gql_client,
-        existing_managers,
-        manager_uuid,
+    termination = await terminate_managers(
+        gql_client, plan.managers_to_terminate, termination_concurrency
     )
+    if echo_filter is not None:
+        echo_filter.forget(termination.failed)
+    if outbox is not None and elevation is not None:
+        outbox.done(elevation, terminated=termination.terminated)
+    # The engagement is not moved until all existing managers are terminated.
+    if termination.failed:
+        raise ElevationError(
+            plan.manager_uuid,
+            {str(uuid): error for uuid, error in termination.failed.items()},
+        )
     logger.info("All existing managers now terminated")
+    if not plan.move_engagement:
+        return None
     # Moving engagement to managers new organisation unit.
-    await move_engagement(gql_client, manager_ou_uuid, engagement_uuid_to_be_moved)
+    await move_engagement(gql_client, plan.org_unit_uuid, plan.engagement_uuid)
     logger.info("Manager engagement successfully moved")
+
+
+async def resume_elevations(
+    gql_client: GraphQLClient,
+    outbox: Outbox,
+    single_request: bool = True,
+    termination_concurrency: int = 1,
+    echo_filter: EchoFilter | None = None,
+) -> None:
+    """
+    Apply the remaining operations of the elevations interrupted by a crash.
+
+    The elevations are resumed as recorded in the outbox, without reading MO.
+    Elevations which fail again are left to the next event of the manager, or
+    to a reconciliation.
+
+    Args:
+        gql_client: A GraphQL client to perform the mutations
+        outbox: The outbox the elevations were recorded in
+        single_request: Whether to apply all mutations in a single request
+        termination_concurrency: Maximum number of concurrent terminations when
+            the mutations are not applied in a single request
+        echo_filter: Optional filter to tell about the managers we terminate
+    """
+    for elevation, plan in outbox.pending():
+        logger.info(
+            "Resuming interrupted elevation", manager_uuid=str(plan.manager_uuid)
+        )
+        # The remaining operations are recorded again as a new elevation.
+        outbox.remove(elevation)
+        try:
+            await execute_elevation_plan(
+                gql_client,
+                plan,
+                single_request,
+                termination_concurrency,
+                echo_filter,
+                outbox,
+            )
+        except Exception:
+            logger.exception(
+                "Unable to resume elevation", manager_uuid=str(plan.manager_uuid)
+            )
+
+
+async def process_manager_event(
+    gql_client: GraphQLClient,
+    manager_uuid: UUID,
+    manager_elevation_batcher: ManagerElevationBatcher | None = None,
+    single_request: bool = True,
+    termination_concurrency: int = 1,
+    org_unit_locks: KeyedLocks[UUID] | None = None,
+    echo_filter: EchoFilter | None = None,
+    manager_debouncer: Debouncer[UUID] | None = None,
+    plan_writer: PlanWriter | None = None,
+    org_unit_managers_cache: OrgUnitManagersCache | None = None,
+    org_structure: OrgStructureIndex | None = None,
+    outbox: Outbox | None = None,
+) -> None:
+    """
+    We process the various events made to an organisation unit and its manager.
+    This includes finding the managers potential engagement, terminating existing
+    manager(s) if the organisation unit has pre-existing manager(s) occupying the
+    position and transferring the new managers engagement so that it sits
+    appropriately in the same organisation unit where the manager role resides.
+
+    Args:
+        gql_client: A GraphQL client to perform the various queries
+        manager_uuid: UUID of the new manager
+        manager_elevation_batcher: Optional batcher merging the manager lookup
+            with those of concurrent events
+        single_request: Whether to apply all mutations in a single request
+        termination_concurrency: Maximum number of concurrent terminations when
+            the mutations are not applied in a single request
+        org_unit_locks: Optional locks ensuring that events for the same
+            organisation unit are processed one at a time
+        echo_filter: Optional filter dropping the events caused by our own
+            terminations
+        manager_debouncer: Optional debouncer processing only the last of a
+            burst of events for the same manager
+        plan_writer: Optional writer of the planned operations, in which case
+            nothing is changed in MO
+        org_unit_managers_cache: Optional cache of the managers of the
+            organisation units, sparing the re-read when waiting for another
+            event of the same organisation unit
+        org_structure: Optional snapshot of the org structure, from which the
+            elevation is planned rather than from the organisation unit in MO
+        outbox: Optional outbox to record the elevations in while they are
+            applied
+    """
+    start = time.monotonic()
+    with span("process_manager_event", manager_uuid=str(manager_uuid)) as current:
+        try:
+            outcome = await _process_manager_event(
+                gql_client,
+                manager_uuid,
+                manager_elevation_batcher,
+                single_request,
+                termination_concurrency,
+                org_unit_locks,
+                echo_filter,
+                manager_debouncer,
+                plan_writer,
+                org_unit_managers_cache,
+                org_structure,
+                outbox,
+            )
+        except Exception:
+            events_processed.labels(outcome=EventOutcome.FAILED.value).inc()
+            raise
+        finally:
+            stage_seconds.labels(stage="event").observe(time.monotonic() - start)
+        if current is not None:
+            current.attributes["outcome"] = outcome.value
+    events_processed.labels(outcome=outcome.value).inc()
+
+
+async def _process_manager_event(
+    gql_client: GraphQLClient,
+    manager_uuid: UUID,
+    manager_elevation_batcher: ManagerElevationBatcher | None,
+    single_request: bool,
+    termination_concurrency: int,
+    org_unit_locks: KeyedLocks[UUID] | None,
+    echo_filter: EchoFilter | None,
+    manager_debouncer: Debouncer[UUID] | None,
+    plan_writer: PlanWriter | None,
+    org_unit_managers_cache: OrgUnitManagersCache | None,
+    org_structure: OrgStructureIndex | None,
+    outbox: Outbox | None,
+) -> EventOutcome:
+    logger.debug(
+        "Processing manager event",
+        manager_uuid=manager_uuid,
+    )
+
+    if echo_filter is not None and echo_filter.is_echo(manager_uuid):
+        logger.debug("Ignoring event caused by our own termination")
+        return EventOutcome.ECHO
+
+    # The manager may have been vacated, moved or terminated, so any organisation
+    # unit remembered to have it as manager can no longer be trusted.
+    if org_unit_managers_cache is not None:
+        org_unit_managers_cache.invalidate_manager(manager_uuid)
+
+    # The superseded events are acknowledged without reading MO; the last event
+    # of the burst reads the final state of the manager.
+    if manager_debouncer is not None and not await manager_debouncer.settle(
+        manager_uuid
+    ):
+        logger.debug("Ignoring event superseded by a newer event for the manager")
+        events_debounced.inc()
+        return EventOutcome.DEBOUNCED
+
+    if org_structure is not None:
+        return await _process_from_org_structure(
+            gql_client,
+            manager_uuid,
+            org_structure,
+            single_request,
+            termination_concurrency,
+            org_unit_locks,
+            echo_filter,
+            plan_writer,
+            outbox,
+        )
+
+    generation = org_unit_locks.generation if org_unit_locks is not None else 0
+    read_start = time.monotonic()
+    plan = await get_elevation_plan(gql_client, manager_uuid, manager_elevation_batcher)
+    if plan is None:
+        return EventOutcome.SKIPPED
+    set_attributes(org_unit_uuid=str(plan.org_unit_uuid))
+
+    if plan_writer is not None:
+        plan_writer.write(plan, read_seconds=time.monotonic() - read_start)
+        return EventOutcome.DRY_RUN
+
+    if org_unit_locks is None:
+        elevated = await execute_elevation_plan(
+            gql_client,
+            plan,
+            single_request,
+            termination_concurrency,
+            echo_filter,
+            outbox,
+        )
+        return _elevation_outcome(elevated)
+
+    # The manager may be new to the organisation unit it is now in.
+    if org_unit_managers_cache is not None:
+        org_unit_managers_cache.invalidate(plan.org_unit_uuid)
+
+    # The organisation unit is only known after reading the manager, so the read
+    # happens outside the lock. If another event for the same organisation unit
+    # finished in the meantime, our view of its managers is stale and is re-read,
+    # unless the other event left the managers it ended up with in the cache.
+    async with org_unit_locks.hold(plan.org_unit_uuid) as lock:
+        # Only the newest manager of the organisation unit survives, and it will
+        # terminate this one, so there is no point in elevating this one first.
+        if lock.superseded():
+            logger.info(
+                "Ignoring manager superseded by a newer manager of the org unit",
+                org_unit_uuid=str(plan.org_unit_uuid),
+            )
+            events_collapsed.inc()
+            return EventOutcome.COLLAPSED
+        cached_managers = None
+        if lock.released_since(generation) and org_unit_managers_cache is not None:
+            cached_managers = org_unit_managers_cache.get(plan.org_unit_uuid)
+        if cached_managers is not None:
+            plan = plan.copy(
+                update={
+                    "managers_to_terminate": [
+                        m for m in cached_managers if m != manager_uuid
+                    ]
+                }
+            )
+        elif lock.released_since(generation):
+            logger.debug("Organisation unit changed, re-reading manager")
+            locked_org_unit_uuid = plan.org_unit_uuid
+            plan = await get_elevation_plan(
+                gql_client, manager_uuid, manager_elevation_batcher
+            )
+            if plan is None:
+                return EventOutcome.SKIPPED
+            # The lock only covers the organisation unit read the first time. A
+            # manager moved since then is left to the event of that move.
+            if plan.org_unit_uuid != locked_org_unit_uuid:
+                logger.info(
+                    "Manager moved to another org unit while waiting",
+                    org_unit_uuid=str(plan.org_unit_uuid),
+                )
+                return EventOutcome.MOVED
+
+        try:
+            elevated = await execute_elevation_plan(
+                gql_client,
+                plan,
+                single_request,
+                termination_concurrency,
+                echo_filter,
+                outbox,
+            )
+        except Exception:
+            if org_unit_managers_cache is not None:
+                org_unit_managers_cache.invalidate(plan.org_unit_uuid)
+            raise
+        # All other managers of the organisation unit are now terminated.
+        if org_unit_managers_cache is not None:
+            org_unit_managers_cache.put(plan.org_unit_uuid, [plan.manager_uuid])
+        return _elevation_outcome(elevated)
+
+
+async def _process_from_org_structure(
+    gql_client: GraphQLClient,
+    manager_uuid: UUID,
+    org_structure: OrgStructureIndex,
+    single_request: bool,
+    termination_concurrency: int,
+    org_unit_locks: KeyedLocks[UUID] | None,
+    echo_filter: EchoFilter | None,
+    plan_writer: PlanWriter | None,
+    outbox: Outbox | None,
+) -> EventOutcome:
+    # Events only tell the UUID of the manager, so the manager itself is read
+    # again; the rest of its organisation unit is taken from the snapshot.
+    read_start = time.monotonic()
+    with stage_seconds.labels(stage="snapshot_read").time():
+        await refresh_managers(gql_client, org_structure, [manager_uuid])
+    plan = plan_elevation(manager_uuid, org_structure.manager_elevation(manager_uuid))
+    if plan is None:
+        return EventOutcome.SKIPPED
+    set_attributes(org_unit_uuid=str(plan.org_unit_uuid))
+
+    if plan_writer is not None:
+        plan_writer.write(plan, read_seconds=time.monotonic() - read_start)
+        return EventOutcome.DRY_RUN
+
+    if org_unit_locks is None:
+        elevated = await execute_elevation_plan(
+            gql_client,
+            plan,
+            single_request,
+            termination_concurrency,
+            echo_filter,
+            outbox,
+            org_structure,
+        )
+        return _elevation_outcome(elevated)
+
+    async with org_unit_locks.hold(plan.org_unit_uuid) as lock:
+        if lock.superseded():
+            logger.info(
+                "Ignoring manager superseded by a newer manager of the org unit",
+                org_unit_uuid=str(plan.org_unit_uuid),
+            )
+            events_collapsed.inc()
+            return EventOutcome.COLLAPSED
+        # The snapshot includes the elevations of the events we waited for, so
+        # the plan is made again without reading MO.
+        locked_org_unit_uuid = plan.org_unit_uuid
+        plan = plan_elevation(
+            manager_uuid, org_structure.manager_elevation(manager_uuid)
+        )
+        if plan is None:
+            return EventOutcome.SKIPPED
+        if plan.org_unit_uuid != locked_org_unit_uuid:
+            logger.info(
+                "Manager moved to another org unit while waiting",
+                org_unit_uuid=str(plan.org_unit_uuid),
+            )
+            return EventOutcome.MOVED
+        elevated = await execute_elevation_plan(
+            gql_client,
+            plan,
+            single_request,
+            termination_concurrency,
+            echo_filter,
+            outbox,
+            org_structure,
+        )
+        return _elevation_outcome(elevated)
+
+
+def _elevation_outcome(elevated: bool) -> EventOutcome:
+    return EventOutcome.ELEVATED if elevated else EventOutcome.NOTHING_TO_DO
@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from collections.abc import Mapping
+from uuid import UUID
+
+
+class ElevationError(Exception):
+    """Raised when one or more of the mutations of an elevation failed.
+
+    The errors are keyed by the alias of the failed mutation, or by the UUID of
+    the manager which could not be terminated.
+    """
+
+    def __init__(self, manager_uuid: UUID, errors: Mapping[str, Exception]) -> None:
+        self.manager_uuid = manager_uuid
+        self.errors = errors
+
+    def __str__(self) -> str:
+        return "; ".join(f"{alias}: {error}" for alias, error in self.errors.items())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to MO while the circuit is open."""
+
+    def __init__(self, retry_in: float) -> None:
+        self.retry_in = retry_in
+
+    def __str__(self) -> str:
+        return f"MO is unavailable, retrying in {self.retry_in:.0f} seconds"
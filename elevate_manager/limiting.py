@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for adapting the number of concurrent requests to the health of MO
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+import httpx
+
+from .metrics import mo_concurrency_limit
+
+
+def _overloaded(response: httpx.Response) -> bool:
+    return (
+        response.status_code == httpx.codes.TOO_MANY_REQUESTS
+        or response.is_server_error
+    )
+
+
+class AdaptiveLimiter:
+    """
+    Limit on the number of concurrent requests, adapted to the health of the
+    server by additive increase and multiplicative decrease (AIMD).
+
+    Every request answered within `latency_target` seconds raises the limit by
+    `1 / limit`, i.e. by one per round of requests, up to `max_limit`. A request
+    which is slower, answered with 429 or a 5xx status, or fails to connect or
+    time out, multiplies the limit by `backoff`, down to `min_limit`. Only
+    requests started after the last decrease may decrease it again, so that a
+    burst of failures among the requests in flight backs off only once.
+
+    Args:
+        initial_limit: Number of concurrent requests allowed at first.
+        min_limit: Lowest number of concurrent requests to back off to.
+        max_limit: Highest number of concurrent requests to grow to.
+        latency_target: Number of seconds beyond which a request is too slow.
+        backoff: Factor to multiply the limit by when backing off.
+        clock: Monotonic clock returning seconds.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.clock = clock
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._last_decrease = float("-inf")
+        mo_concurrency_limit.set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        """The number of concurrent requests currently allowed."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests currently sent."""
+        return self._in_flight
+
+    async def run(
+        self, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Send a request once the limit allows, and adapt the limit to its outcome.
+
+        Args:
+            send: Function sending the request.
+
+        Returns:
+            The response to the request.
+        """
+        await self._acquire()
+        try:
+            started = self.clock()
+            try:
+                response = await send()
+            except httpx.TransportError:
+                self._decrease(started)
+                raise
+            if _overloaded(response) or self.clock() - started > self.latency_target:
+                self._decrease(started)
+            else:
+                self._increase()
+            return response
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation.
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Slots are handed over to the waiters in order, so newcomers cannot
+        # overtake them.
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _increase(self) -> None:
+        self._limit = min(self._limit + 1 / self._limit, float(self.max_limit))
+        mo_concurrency_limit.set(self.limit)
+        self._wake()
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._last_decrease = self.clock()
+        self._limit = max(self._limit * self.backoff, float(self.min_limit))
+        mo_concurrency_limit.set(self.limit)
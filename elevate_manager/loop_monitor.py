@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for detecting synchronous work blocking the event loop
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from contextlib import suppress
+
+import structlog
+
+from .metrics import event_loop_lag_seconds
+
+logger = structlog.get_logger(__name__)
+
+
+class LoopMonitor:
+    """
+    Measure how late the event loop runs a callback scheduled every `interval`
+    seconds, and log the stack of the loop while it is blocked.
+
+    The lag is the time all in-flight events waited for a synchronous callback,
+    such as parsing a large response, to finish. A thread watches the heartbeat
+    of the sampler, and once the loop has been blocked for longer than
+    `slow_threshold` seconds, logs what the loop is running, once per stall.
+
+    Args:
+        interval: Number of seconds between the samples.
+        slow_threshold: Number of seconds the loop may be blocked before the
+            blocking stack is logged.
+    """
+
+    def __init__(self, interval: float, slow_threshold: float) -> None:
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self._heartbeat = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start sampling the loop this is called on."""
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(threading.get_ident(),), daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+
+    async def _sample(self) -> None:
+        while True:
+            scheduled = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            event_loop_lag_seconds.observe(max(self._heartbeat - scheduled, 0))
+
+    def _watch(self, loop_thread_id: int) -> None:
+        reported = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked <= self.slow_threshold or heartbeat == reported:
+                continue
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            logger.warning(
+                "Event loop blocked",
+                blocked_seconds=round(blocked, 3),
+                stack="".join(traceback.format_stack(frame)),
+            )
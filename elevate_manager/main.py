@@ -1,19 +1,77 @@
 # SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
+import asyncio
+import os
+import tempfile
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextlib import suppress
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Annotated
+from typing import Any
+from typing import Literal
+from uuid import UUID
+
 import structlog
 from fastapi import APIRouter
 from fastapi import FastAPI
+from fastapi import HTTPException
+from fastapi import Query
+from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse
+from fastapi.responses import Response
+from fastramqpi.context import Context
 from fastramqpi.main import FastRAMQPI
+from fastramqpi.ramqp import RequeueMessage
 from fastramqpi.ramqp.depends import RateLimit
 from fastramqpi.ramqp.mo import MORouter
 from fastramqpi.ramqp.mo import PayloadType
 
 from . import depends
-from .autogenerated_graphql_client import GraphQLClient
+from .breaker import CircuitBreaker
+from .breaker import CircuitState
+from .cache import OrgUnitManagersCache
+from .catch_up import Checkpoint
+from .catch_up import catch_up
+from .client import GraphQLClient
 from .depends import Settings
+from .dry_run import PlanWriter
+from .echo import EchoFilter
 from .events import process_manager_event
+from .events import resume_elevations
+from .exceptions import CircuitOpenError
+from .limiting import AdaptiveLimiter
+from .loop_monitor import LoopMonitor
+from .metrics import current_event_lag_seconds
+from .metrics import event_lag_seconds
+from .mo import manager_elevation_batcher
+from .outbox import Outbox
+from .profiling import Profiler
+from .profiling import collapse
+from .profiling import dump
+from .profiling import report
+from .reconcile import ReconciliationJob
+from .reconcile import ReconciliationJobs
+from .reconcile import ReconciliationResult
+from .reconcile import reconcile
+from .retry import RetryPolicy
+from .scheduling import Debouncer
+from .scheduling import KeyedLocks
+from .snapshot import refresh_managers
+from .snapshot import restore_org_structure
+from .tracing import JSONLinesExporter
+from .tracing import set_exporter
+from .tracing import span
+
+# Version of the MO GraphQL API the queries are written against
+GRAPHQL_VERSION = 22
 
 amqp_router = MORouter()
+# Events keeping the org structure snapshot current, if enabled
+snapshot_router = MORouter()
 fastapi_router = APIRouter()
 
 logger = structlog.get_logger(__name__)
@@ -22,7 +80,19 @@ logger = structlog.get_logger(__name__)
 @amqp_router.register("org_unit.manager.create")
 @amqp_router.register("org_unit.manager.edit")
 async def listener(
-    gql_client: depends.GraphQLClient, payload: PayloadType, _: RateLimit
+    gql_client: depends.GraphQLClient,
+    settings: depends.Settings,
+    manager_elevation_batcher: depends.ManagerElevationBatcher,
+    manager_debouncer: depends.ManagerDebouncer,
+    org_unit_locks: depends.OrgUnitLocks,
+    org_unit_managers_cache: depends.OrgUnitManagersCache,
+    echo_filter: depends.EchoFilter,
+    plan_writer: depends.PlanWriter,
+    org_structure: depends.OrgStructure,
+    outbox: depends.Outbox,
+    profiler: depends.Profiler,
+    payload: PayloadType,
+    _: RateLimit,
 ) -> None:
     """
     This function listens on changes made to:
@@ -33,7 +103,402 @@ async def listener(
     We receive a payload, of type Payload, with content of:
     Manager uuid - payload.object_uuid
     """
-    await process_manager_event(gql_client, payload.object_uuid)
+    try:
+        with span("listener", manager_uuid=str(payload.object_uuid)):
+            await process_manager_event(
+                gql_client,
+                payload.object_uuid,
+                manager_elevation_batcher,
+                single_request=settings.single_request_elevation,
+                termination_concurrency=settings.termination_concurrency,
+                org_unit_locks=org_unit_locks,
+                echo_filter=echo_filter,
+                manager_debouncer=manager_debouncer,
+                plan_writer=plan_writer,
+                org_unit_managers_cache=org_unit_managers_cache,
+                org_structure=org_structure,
+                outbox=outbox,
+            )
+    except CircuitOpenError as error:
+        # Redeliveries of the message are held back by the rate limit.
+        raise RequeueMessage(str(error)) from error
+    finally:
+        profiler.event_processed()
+    # The lag includes the time spent in the queue. Clocks may be slightly out of
+    # sync, so it is never negative.
+    lag = max(time.time() - payload.time.timestamp(), 0)
+    event_lag_seconds.observe(lag)
+    current_event_lag_seconds.set(lag)
+
+
+@snapshot_router.register("org_unit.manager.terminate")
+async def manager_terminated(
+    gql_client: depends.GraphQLClient,
+    org_structure: depends.OrgStructure,
+    payload: PayloadType,
+    _: RateLimit,
+) -> None:
+    """Remove terminated managers from the org structure snapshot."""
+    # Managers we terminated ourselves are already removed.
+    if org_structure is not None and payload.object_uuid in org_structure:
+        await refresh_managers(gql_client, org_structure, [payload.object_uuid])
+
+
+@snapshot_router.register("employee.engagement.*")
+async def engagement_changed(
+    gql_client: depends.GraphQLClient,
+    org_structure: depends.OrgStructure,
+    payload: PayloadType,
+    _: RateLimit,
+) -> None:
+    """Update the engagements of managers in the org structure snapshot."""
+    if org_structure is None:
+        return
+    # The engagements of employees not holding any manager are not in the snapshot.
+    manager_uuids = org_structure.employee_managers(payload.uuid)
+    if manager_uuids:
+        await refresh_managers(gql_client, org_structure, sorted(manager_uuids))
+
+
+@fastapi_router.post("/reconcile", status_code=202)
+async def reconcile_managers(
+    gql_client: depends.GraphQLClient,
+    settings: depends.Settings,
+    org_unit_locks: depends.OrgUnitLocks,
+    echo_filter: depends.EchoFilter,
+    org_structure: depends.OrgStructure,
+    reconciliation_jobs: depends.ReconciliationJobs,
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    """
+    Start elevating all managers in MO whose elevation is missing, e.g. because
+    their events were lost. Events for the same org units are held back meanwhile.
+
+    The reconciliation takes minutes on large tenants, so it runs in the
+    background; its status is available from `GET /reconcile/{id}`. On a dry run,
+    nothing is changed in MO, and the planned operations are available as JSON
+    lines from `GET /reconcile/{id}/plan`.
+    """
+    plan_path = None
+    if dry_run:
+        fd, name = tempfile.mkstemp(prefix="reconcile-", suffix=".jsonl")
+        os.close(fd)
+        plan_path = Path(name)
+
+    async def run() -> ReconciliationResult:
+        kwargs: dict[str, Any] = dict(
+            page_size=settings.reconcile_page_size,
+            concurrency=settings.reconcile_concurrency,
+            single_request=settings.single_request_elevation,
+            termination_concurrency=settings.termination_concurrency,
+            org_unit_locks=org_unit_locks,
+            echo_filter=echo_filter,
+            org_structure=org_structure,
+        )
+        if plan_path is None:
+            return await reconcile(gql_client, plan_writer=None, **kwargs)
+        with plan_path.open("w") as stream:
+            return await reconcile(gql_client, plan_writer=PlanWriter(stream), **kwargs)
+
+    job = reconciliation_jobs.start(run(), plan_path)
+    return job.status()
+
+
+def _get_job(
+    reconciliation_jobs: ReconciliationJobs, job_id: UUID
+) -> ReconciliationJob:
+    job = reconciliation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown reconciliation")
+    return job
+
+
+@fastapi_router.get("/reconcile/{job_id}")
+async def reconciliation_status(
+    reconciliation_jobs: depends.ReconciliationJobs, job_id: UUID
+) -> dict[str, Any]:
+    """The status of a reconciliation, and its result once finished."""
+    return _get_job(reconciliation_jobs, job_id).status()
+
+
+@fastapi_router.get("/reconcile/{job_id}/plan")
+async def reconciliation_plan(
+    reconciliation_jobs: depends.ReconciliationJobs, job_id: UUID
+) -> FileResponse:
+    """The operations planned by a dry run so far, as JSON lines."""
+    job = _get_job(reconciliation_jobs, job_id)
+    if job.plan_path is None:
+        raise HTTPException(status_code=404, detail="Not a dry run")
+    return FileResponse(job.plan_path, media_type="application/jsonl")
+
+
+# Longest profile, so a forgotten profile does not slow down the service for long
+MAX_PROFILE_SECONDS = 300
+
+ProfileSeconds = Annotated[float, Query(gt=0, le=MAX_PROFILE_SECONDS)]
+ProfileEvents = Annotated[int | None, Query(gt=0)]
+
+
+def _check_profiler(profiler: Profiler) -> None:
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Already profiling")
+
+
+@fastapi_router.post("/profile/deterministic")
+async def profile_deterministic(
+    profiler: depends.Profiler,
+    seconds: ProfileSeconds = 10,
+    events: ProfileEvents = None,
+    format: Literal["pstats", "text"] = "pstats",
+) -> Response:
+    """
+    Record every function call for `seconds`, or until `events` events have been
+    processed. The result is returned as a binary pstats file, e.g. for snakeviz,
+    or as text sorted by cumulative time.
+    """
+    _check_profiler(profiler)
+    profile = await profiler.deterministic(seconds, events)
+    if format == "pstats":
+        return Response(dump(profile), media_type="application/octet-stream")
+    return PlainTextResponse(report(profile, limit=100))
+
+
+@fastapi_router.post("/profile/statistical")
+async def profile_statistical(
+    profiler: depends.Profiler,
+    seconds: ProfileSeconds = 10,
+    events: ProfileEvents = None,
+    interval: Annotated[float, Query(ge=0.001, le=1)] = 0.005,
+) -> PlainTextResponse:
+    """
+    Sample the stack of the event loop every `interval` seconds for `seconds`, or
+    until `events` events have been processed. The result is returned as collapsed
+    stacks, e.g. for flamegraph.pl or speedscope.
+    """
+    _check_profiler(profiler)
+    stacks = await profiler.statistical(seconds, events, interval)
+    return PlainTextResponse(collapse(stacks))
+
+
+@asynccontextmanager
+async def mo_circuit_breaker(
+    context: Context, settings: Settings
+) -> AsyncIterator[None]:
+    """
+    Fail requests to MO immediately while it is unavailable, if enabled.
+
+    The circuit breaker wraps the GraphQL client, and must therefore be set up
+    after it.
+    """
+    if settings.mo_circuit_breaker:
+        context["graphql_client"].circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.mo_circuit_failure_threshold,
+            reset_timeout=settings.mo_circuit_reset_timeout,
+        )
+    yield
+
+
+async def healthcheck_mo_circuit(context: Context) -> bool:
+    """Whether requests are sent to MO, i.e. the circuit to MO is not open."""
+    circuit_breaker = context["graphql_client"].circuit_breaker
+    return circuit_breaker is None or circuit_breaker.state != CircuitState.OPEN
+
+
+@asynccontextmanager
+async def mo_retry_policy(context: Context, settings: Settings) -> AsyncIterator[None]:
+    """
+    Retry the requests to MO failing with transient errors, as configured.
+
+    The policy is used by the GraphQL client, and must therefore be set up after
+    it.
+    """
+    context["graphql_client"].retry_policy = RetryPolicy(
+        attempts=settings.mo_retry_attempts,
+        base_delay=settings.mo_retry_base_delay,
+        max_delay=settings.mo_retry_max_delay,
+    )
+    yield
+
+
+@asynccontextmanager
+async def mo_concurrency_limiter(
+    context: Context, settings: Settings
+) -> AsyncIterator[None]:
+    """
+    Limit the concurrent requests to MO adaptively, if enabled.
+
+    The limiter wraps the GraphQL client, and must therefore be set up after it.
+    """
+    if settings.mo_adaptive_concurrency:
+        context["graphql_client"].concurrency_limiter = AdaptiveLimiter(
+            initial_limit=settings.mo_concurrency_initial,
+            min_limit=settings.mo_concurrency_min,
+            max_limit=settings.mo_concurrency_max,
+            latency_target=settings.mo_latency_target,
+        )
+    yield
+
+
+@asynccontextmanager
+async def batchers(context: Context, settings: Settings) -> AsyncIterator[None]:
+    """
+    Set up the batchers merging concurrent MO lookups.
+
+    The batchers wrap the GraphQL client, and must therefore be started after it.
+    Any pending lookups are flushed on shutdown.
+    """
+    manager_batcher = manager_elevation_batcher(
+        context["graphql_client"],
+        max_delay=settings.batch_max_delay,
+        max_size=settings.batch_max_size,
+    )
+    context["user_context"]["manager_elevation_batcher"] = manager_batcher
+    yield
+    await manager_batcher.close()
+
+
+@asynccontextmanager
+async def dry_run_writer(context: Context, settings: Settings) -> AsyncIterator[None]:
+    """Set up the writer of planned operations, if running dry."""
+    if settings.dry_run_path is None:
+        context["user_context"]["plan_writer"] = None
+        yield
+        return
+    with settings.dry_run_path.open("a") as stream:
+        context["user_context"]["plan_writer"] = PlanWriter(stream)
+        yield
+
+
+@asynccontextmanager
+async def elevation_outbox(context: Context, settings: Settings) -> AsyncIterator[None]:
+    """
+    Open the outbox of elevations, if enabled, and resume those interrupted.
+
+    The interrupted elevations are resumed with the GraphQL client, and before
+    events are received, so they are not applied concurrently with newer ones.
+    While running dry, they are left in the outbox.
+    """
+    if settings.outbox_path is None:
+        context["user_context"]["outbox"] = None
+        yield
+        return
+    outbox = Outbox(settings.outbox_path)
+    try:
+        if settings.dry_run_path is not None:
+            logger.info("Not resuming interrupted elevations while running dry")
+        else:
+            await resume_elevations(
+                context["graphql_client"],
+                outbox,
+                single_request=settings.single_request_elevation,
+                termination_concurrency=settings.termination_concurrency,
+                echo_filter=context["user_context"]["echo_filter"],
+            )
+        context["user_context"]["outbox"] = outbox
+        yield
+    finally:
+        outbox.close()
+
+
+@asynccontextmanager
+async def event_loop_monitor(settings: Settings) -> AsyncIterator[None]:
+    """Measure the lag of the event loop, and log what blocks it, if enabled."""
+    if not settings.loop_monitor:
+        yield
+        return
+    monitor = LoopMonitor(
+        interval=settings.loop_monitor_interval,
+        slow_threshold=settings.loop_slow_threshold,
+    )
+    monitor.start()
+    try:
+        yield
+    finally:
+        await monitor.stop()
+
+
+@asynccontextmanager
+async def span_exporter(settings: Settings) -> AsyncIterator[None]:
+    """Export the traces of the events as JSON lines, if enabled."""
+    if settings.tracing_path is None:
+        yield
+        return
+    with settings.tracing_path.open("a") as stream:
+        set_exporter(JSONLinesExporter(stream))
+        try:
+            yield
+        finally:
+            set_exporter(None)
+
+
+@asynccontextmanager
+async def org_structure_snapshot(
+    context: Context, settings: Settings
+) -> AsyncIterator[None]:
+    """
+    Load the org structure snapshot, if enabled, and save it on shutdown.
+
+    The snapshot is read with the GraphQL client, and must therefore be loaded
+    after it is started, but before events are received.
+    """
+    if not settings.snapshot_enabled:
+        context["user_context"]["org_structure"] = None
+        yield
+        return
+    org_structure = await restore_org_structure(
+        context["graphql_client"], settings.snapshot_path, settings.snapshot_page_size
+    )
+    context["user_context"]["org_structure"] = org_structure
+    yield
+    # The events after this point are not acknowledged and will be redelivered, so
+    # the snapshot is current as of now.
+    if settings.snapshot_path is not None:
+        org_structure.save(settings.snapshot_path, as_of=datetime.now(timezone.utc))
+
+
+@asynccontextmanager
+async def catch_up_worker(context: Context, settings: Settings) -> AsyncIterator[None]:
+    """
+    Catch up on the manager changes registered in MO periodically, if enabled.
+
+    The worker shares the org unit locks, the echo filter and the org structure
+    snapshot with the listener, and must therefore be started after they are set
+    up. It is not started while
+    running dry, as the checkpoint only advances past changes which were applied.
+    """
+    if settings.catch_up_checkpoint_path is None:
+        yield
+        return
+    if settings.dry_run_path is not None:
+        logger.info("Not catching up on manager changes while running dry")
+        yield
+        return
+    checkpoint = Checkpoint(settings.catch_up_checkpoint_path)
+    user_context = context["user_context"]
+
+    async def run() -> None:
+        while True:
+            try:
+                await catch_up(
+                    context["graphql_client"],
+                    checkpoint,
+                    page_size=settings.catch_up_page_size,
+                    concurrency=settings.reconcile_concurrency,
+                    single_request=settings.single_request_elevation,
+                    termination_concurrency=settings.termination_concurrency,
+                    org_unit_locks=user_context["org_unit_locks"],
+                    echo_filter=user_context["echo_filter"],
+                    org_structure=user_context["org_structure"],
+                )
+            except Exception:
+                logger.exception("Unable to catch up on manager changes")
+            await asyncio.sleep(settings.catch_up_interval)
+
+    task = asyncio.create_task(run())
+    yield
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
 
 
 def create_app() -> FastAPI:
@@ -41,13 +506,62 @@ def create_app() -> FastAPI:
     fastramqpi = FastRAMQPI(
         application_name="os2mo-manager-elevator",
         settings=settings.fastramqpi,
-        graphql_version=22,
+        graphql_version=GRAPHQL_VERSION,
         graphql_client_cls=GraphQLClient,
     )
     fastramqpi.add_context(settings=settings)
+    fastramqpi.add_context(
+        org_unit_locks=KeyedLocks(history_size=settings.org_unit_lock_history_size),
+        org_unit_managers_cache=OrgUnitManagersCache(
+            ttl=settings.org_unit_cache_ttl, max_size=settings.org_unit_cache_max_size
+        ),
+        echo_filter=EchoFilter(ttl=settings.echo_ttl, max_size=settings.echo_max_size),
+        reconciliation_jobs=ReconciliationJobs(),
+        profiler=Profiler(),
+        manager_debouncer=(
+            Debouncer(quiet_period=settings.debounce_quiet_period)
+            if settings.debounce_quiet_period > 0
+            else None
+        ),
+    )
+    # FastRAMQPI starts the lifespans of the same priority in no particular order.
+    # After the GraphQL client (200), the client is set up and the independent
+    # helpers are started (250). Interrupted elevations are then resumed (260),
+    # before the snapshot is loaded (270), so it includes them. Catching up needs
+    # the snapshot (280), and all of it is done before events are received (1000).
+    fastramqpi.add_lifespan_manager(
+        mo_circuit_breaker(fastramqpi.get_context(), settings), priority=250
+    )
+    fastramqpi.add_healthcheck(name="MO circuit", healthcheck=healthcheck_mo_circuit)
+    fastramqpi.add_lifespan_manager(
+        mo_retry_policy(fastramqpi.get_context(), settings), priority=250
+    )
+    fastramqpi.add_lifespan_manager(
+        mo_concurrency_limiter(fastramqpi.get_context(), settings), priority=250
+    )
+    fastramqpi.add_lifespan_manager(
+        batchers(fastramqpi.get_context(), settings), priority=250
+    )
+    fastramqpi.add_lifespan_manager(
+        dry_run_writer(fastramqpi.get_context(), settings), priority=250
+    )
+    fastramqpi.add_lifespan_manager(event_loop_monitor(settings), priority=250)
+    fastramqpi.add_lifespan_manager(span_exporter(settings), priority=250)
+    fastramqpi.add_lifespan_manager(
+        elevation_outbox(fastramqpi.get_context(), settings), priority=260
+    )
+    fastramqpi.add_lifespan_manager(
+        org_structure_snapshot(fastramqpi.get_context(), settings), priority=270
+    )
+    fastramqpi.add_lifespan_manager(
+        catch_up_worker(fastramqpi.get_context(), settings), priority=280
+    )
 
     app = fastramqpi.get_app()
+    app.include_router(fastapi_router)
     mo_amqp_system = fastramqpi.get_amqpsystem()
     mo_amqp_system.router.registry.update(amqp_router.registry)
+    if settings.snapshot_enabled:
+        mo_amqp_system.router.registry.update(snapshot_router.registry)
 
     return app
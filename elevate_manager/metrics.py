@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module containing the Prometheus metrics exposed on /metrics by FastRAMQPI
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+
+engagement_moves_skipped = Counter(
+    "elevate_manager_engagement_moves_skipped",
+    "Engagement moves skipped because the engagement already is in the org unit.",
+)
+
+events_debounced = Counter(
+    "elevate_manager_events_debounced",
+    "Manager events superseded by a newer event for the same manager.",
+)
+
+events_collapsed = Counter(
+    "elevate_manager_events_collapsed",
+    "Manager events superseded by a newer manager of the same org unit.",
+)
+
+org_unit_managers_cache_hits = Counter(
+    "elevate_manager_org_unit_managers_cache_hits",
+    "Re-reads after waiting for an org unit answered from the cache.",
+)
+
+org_unit_managers_cache_misses = Counter(
+    "elevate_manager_org_unit_managers_cache_misses",
+    "Re-reads after waiting for an org unit which had to read MO.",
+)
+
+snapshot_memory_bytes = Gauge(
+    "elevate_manager_snapshot_memory_bytes",
+    "Estimated memory held by the org structure snapshot when it was loaded.",
+)
+
+mo_concurrency_limit = Gauge(
+    "elevate_manager_mo_concurrency_limit",
+    "Number of concurrent requests to MO currently allowed by the adaptive limit.",
+)
+
+mo_request_retries = Counter(
+    "elevate_manager_mo_request_retries",
+    "Requests to MO sent again after failing with a transient error.",
+    ["operation"],
+)
+
+events_processed = Counter(
+    "elevate_manager_events_processed",
+    "Manager events processed, by outcome.",
+    ["outcome"],
+)
+
+elevations_skipped = Counter(
+    "elevate_manager_elevations_skipped",
+    "Managers which cannot be elevated, by reason.",
+    ["reason"],
+)
+
+stage_seconds = Histogram(
+    "elevate_manager_stage_seconds",
+    "Time spent in each stage of processing a manager event.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+event_lag_seconds = Histogram(
+    "elevate_manager_event_lag_seconds",
+    "Time from a manager change in MO until its event was processed.",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+current_event_lag_seconds = Gauge(
+    "elevate_manager_current_event_lag_seconds",
+    "Time from a manager change in MO until its event was processed, for the "
+    "most recently processed event.",
+)
+
+event_loop_lag_seconds = Histogram(
+    "elevate_manager_event_loop_lag_seconds",
+    "Delay of a callback scheduled on the event loop, i.e. the time every "
+    "in-flight event waited for synchronous work to finish.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
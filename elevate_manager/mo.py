@@ -1,15 +1,31 @@
 # SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
 # Module containing GraphQL functions to interact with MO
+import asyncio
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from dataclasses import field
 from datetime import datetime, time, timezone, timedelta
+from functools import partial
 from uuid import UUID
 
 import structlog
-from more_itertools import one
 
-from .autogenerated_graphql_client import GraphQLClient
-from .autogenerated_graphql_client.manager_engagements import ManagerEngagementsManagers
-from .autogenerated_graphql_client.org_unit_managers import OrgUnitManagersOrgUnits
+from .autogenerated_graphql_client.manager_elevation import ManagerElevationManagers
+from .autogenerated_graphql_client.manager_snapshot import (
+    ManagerSnapshotManagersObjects,
+)
+from .autogenerated_graphql_client.registrations import (
+    RegistrationsRegistrationsObjects,
+)
+from .batching import Batcher
+from .client import AliasedMutation
+from .client import AliasedMutationResult
+from .client import GraphQLClient
+from .metrics import stage_seconds
+from .models import ElevationPlan
+from .retry import retry
+from .tracing import traced
 from elevate_manager.autogenerated_graphql_client.input_types import (
     EngagementUpdateInput,
 )
@@ -21,74 +37,306 @@ from elevate_manager.autogenerated_graphql_client.input_types import RAValidityI
 logger = structlog.get_logger()
 
 
-async def get_manager_engagements(
-    gql_client: GraphQLClient, manager_uuid: UUID
-) -> ManagerEngagementsManagers:
+def _start_of_today() -> datetime:
+    return datetime.combine(
+        datetime.now(), time.min, tzinfo=timezone(timedelta(hours=1))
+    )
+
+
+ManagerElevationBatcher = Batcher[UUID, ManagerElevationManagers]
+
+
+def manager_elevation_batcher(
+    gql_client: GraphQLClient, max_delay: float, max_size: int
+) -> ManagerElevationBatcher:
     """
-    Get the engagement(s) and Organisation Units uuid(s) for the manager.
+    Create a batcher which merges concurrent manager elevation lookups.
 
     Args:
-        manager_uuid: UUID of the manager to find potential engagements of
-        gql_client: The GraphQL client to perform the query.
+        gql_client: The GraphQL client to perform the batched queries.
+        max_delay: Maximum number of seconds to wait for more manager UUIDs.
+        max_size: Maximum number of manager UUIDs in a single query.
 
     Returns:
-        Manager objects consisting of engagements and org units uuids
+        Batcher loading everything needed to elevate a single manager at a time
     """
-    return await gql_client.manager_engagements([manager_uuid])
 
+    async def load_batch(
+        manager_uuids: list[UUID],
+    ) -> dict[UUID, ManagerElevationManagers]:
+        managers = await retry(
+            lambda: gql_client.manager_elevation(manager_uuids),
+            gql_client.retry_policy,
+            "manager_elevation",
+        )
+        objects = {obj.uuid: obj for obj in managers.objects}
+        return {
+            manager_uuid: ManagerElevationManagers(
+                objects=[objects[manager_uuid]] if manager_uuid in objects else []
+            )
+            for manager_uuid in manager_uuids
+        }
+
+    return Batcher(load_batch, max_delay=max_delay, max_size=max_size)
 
-async def get_existing_managers(
-    org_unit_uuid: UUID,
+
+@traced
+async def get_manager_elevation(
     gql_client: GraphQLClient,
-) -> OrgUnitManagersOrgUnits:
+    manager_uuid: UUID,
+    batcher: ManagerElevationBatcher | None = None,
+) -> ManagerElevationManagers:
+    """
+    Get the manager, the employee's engagements and the current managers of the
+    manager's organisation unit in a single query.
+
+    Args:
+        gql_client: The GraphQL client to perform the query.
+        manager_uuid: UUID of the manager to be elevated
+        batcher: Optional batcher to merge the query with concurrent lookups.
+
+    Returns:
+        Manager objects consisting of engagements and the org unit with its managers
+    """
+    with stage_seconds.labels(stage="read").time():
+        if batcher is not None:
+            return await batcher.load(manager_uuid)
+        return await retry(
+            lambda: gql_client.manager_elevation([manager_uuid]),
+            gql_client.retry_policy,
+            "manager_elevation",
+        )
+
+
+@traced
+async def get_manager_elevations(
+    gql_client: GraphQLClient, manager_uuids: list[UUID]
+) -> ManagerElevationManagers:
+    """
+    Get the managers, the engagements of their employees and the current managers
+    of their organisation units in a single query, e.g. for a page of managers.
+
+    Args:
+        gql_client: The GraphQL client to perform the query.
+        manager_uuids: UUIDs of the managers.
+
+    Returns:
+        The manager objects found in MO
+    """
+    with stage_seconds.labels(stage="read").time():
+        return await retry(
+            lambda: gql_client.manager_elevation(manager_uuids),
+            gql_client.retry_policy,
+            "manager_elevation",
+        )
+
+
+async def get_manager_pages(
+    gql_client: GraphQLClient, page_size: int
+) -> AsyncIterator[list[UUID]]:
+    """
+    Page through the UUIDs of all managers in MO.
+
+    Only a single page is held at a time, and the next page is not requested
+    until the caller is done with the current one.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        page_size: Maximum number of managers per page.
+
+    Yields:
+        UUIDs of the managers of each page
+    """
+    cursor = None
+    while True:
+        page = await retry(
+            partial(gql_client.manager_page, cursor=cursor, limit=page_size),
+            gql_client.retry_policy,
+            "manager_page",
+        )
+        # MO may return short or even empty pages before the last one.
+        if page.objects:
+            yield [obj.uuid for obj in page.objects]
+        cursor = page.page_info.next_cursor
+        if cursor is None:
+            return
+
+
+async def get_manager_snapshot_pages(
+    gql_client: GraphQLClient, page_size: int
+) -> AsyncIterator[list[ManagerSnapshotManagersObjects]]:
+    """
+    Page through all managers in MO, along with their org unit and the engagements
+    of their employee.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        page_size: Maximum number of managers per page.
+
+    Yields:
+        The managers of each page
+    """
+    cursor = None
+    while True:
+        page = await retry(
+            partial(gql_client.manager_snapshot, cursor=cursor, limit=page_size),
+            gql_client.retry_policy,
+            "manager_snapshot",
+        )
+        if page.objects:
+            yield page.objects
+        cursor = page.page_info.next_cursor
+        if cursor is None:
+            return
+
+
+@traced
+async def get_manager_snapshots(
+    gql_client: GraphQLClient, manager_uuids: list[UUID]
+) -> list[ManagerSnapshotManagersObjects]:
+    """
+    Get the managers, along with their org unit and the engagements of their
+    employee.
+
+    Args:
+        gql_client: The GraphQL client to perform the query.
+        manager_uuids: UUIDs of the managers.
+
+    Returns:
+        The managers found in MO
+    """
+    managers = await retry(
+        partial(gql_client.manager_snapshot, uuids=manager_uuids),
+        gql_client.retry_policy,
+        "manager_snapshot",
+    )
+    return managers.objects
+
+
+async def get_registration_pages(
+    gql_client: GraphQLClient, models: list[str], since: datetime, page_size: int
+) -> AsyncIterator[list[RegistrationsRegistrationsObjects]]:
+    """
+    Page through the registrations of the given models made since a point in time.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        models: Names of the models, e.g. `manager`.
+        since: Only registrations starting at or after this time are returned.
+        page_size: Maximum number of registrations per page.
+
+    Yields:
+        The registrations of each page
     """
-    Get existing managers of the given OU.
+    cursor = None
+    while True:
+        page = await retry(
+            partial(
+                gql_client.registrations,
+                models=models,
+                start=since,
+                cursor=cursor,
+                limit=page_size,
+            ),
+            gql_client.retry_policy,
+            "registrations",
+        )
+        registrations = [r for r in page.objects if r.start >= since]
+        if registrations:
+            yield registrations
+        cursor = page.page_info.next_cursor
+        if cursor is None:
+            return
+
+
+@traced
+async def get_engagement_employees(
+    gql_client: GraphQLClient, engagement_uuids: list[UUID]
+) -> set[UUID]:
+    """
+    Get the employees the engagements belong or have belonged to.
 
     Args:
-        org_unit_uuid: UUID of the organisation unit to find managers of
         gql_client: The GraphQL client to perform the query.
+        engagement_uuids: UUIDs of the engagements.
 
     Returns:
-        UUIDs of the org unit managers
+        UUIDs of the employees
     """
-    return await gql_client.org_unit_managers([org_unit_uuid])
+    engagements = await retry(
+        partial(gql_client.engagement_employees, uuids=engagement_uuids),
+        gql_client.retry_policy,
+        "engagement_employees",
+    )
+    return {
+        employee.uuid
+        for engagement in engagements.objects
+        for validity in engagement.validities
+        for employee in validity.employee
+    }
+
 
+@dataclass
+class TerminationResult:
+    """The outcome of terminating a number of managers."""
 
-async def terminate_existing_managers(
+    # UUIDs of the managers which were terminated
+    terminated: list[UUID] = field(default_factory=list)
+    # Errors raised for the managers which could not be terminated
+    failed: dict[UUID, Exception] = field(default_factory=dict)
+
+
+@traced
+async def terminate_managers(
     gql_client: GraphQLClient,
-    existing_managers: OrgUnitManagersOrgUnits,
-    manager_uuid: UUID,
-) -> None:
+    manager_uuids: list[UUID],
+    concurrency: int = 1,
+) -> TerminationResult:
     """
-    This function will:
-    Terminate any existing managers.
+    Terminate the given managers as of today.
+
+    Up to `concurrency` terminations are sent to MO at once. A failing termination
+    does not stop the others; all failures are reported in the result instead.
 
     Args:
         gql_client: The GraphQL client
-        existing_managers: The managers already existing in the OU.
-        manager_uuid: UUID of the new manager to be elevated.
-    """
-    # Get previous manager(s) UUID(s)
-    previous_managers = one(existing_managers.objects)
-    if previous_managers.current is not None:
-        previous_managers_uuids = [
-            m.uuid for m in previous_managers.current.managers if m.uuid != manager_uuid
-        ]
-    else:
-        previous_managers_uuids = []
-
-    # Terminate all previous managers
-    for uuid in previous_managers_uuids:
-        await gql_client.terminate_manager(
-            input=ManagerTerminateInput(
-                uuid=uuid,
-                to=datetime.combine(
-                    datetime.now(), time.min, tzinfo=timezone(timedelta(hours=1))
-                ),
-            )
-        )
+        manager_uuids: UUIDs of the managers to terminate.
+        concurrency: Maximum number of terminations in flight at once.
+
+    Returns:
+        The managers which were terminated, and those which failed
+    """
+    semaphore = asyncio.Semaphore(concurrency)
 
+    async def terminate(uuid: UUID) -> None:
+        async with semaphore:
+            with stage_seconds.labels(stage="terminate").time():
+                await retry(
+                    partial(
+                        gql_client.terminate_manager,
+                        input=ManagerTerminateInput(uuid=uuid, to=_start_of_today()),
+                    ),
+                    gql_client.retry_policy,
+                    "terminate_manager",
+                )
+
+    outcomes = await asyncio.gather(
+        *(terminate(uuid) for uuid in manager_uuids), return_exceptions=True
+    )
 
+    result = TerminationResult()
+    for uuid, outcome in zip(manager_uuids, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Unable to terminate manager", uuid=uuid, error=str(outcome))
+            result.failed[uuid] = outcome
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            result.terminated.append(uuid)
+    return result
+
+
+@traced
 async def move_engagement(
     gql_client: GraphQLClient,
     org_unit_uuid: UUID,
@@ -104,14 +352,61 @@ async def move_engagement(
         engagement_uuid: UUID of the engagement to be transfered.
     """
 
-    await gql_client.move_engagement(
-        input=EngagementUpdateInput(
-            uuid=engagement_uuid,
-            validity=RAValidityInput(
-                from_=datetime.combine(
-                    datetime.now(), time.min, tzinfo=timezone(timedelta(hours=1))
-                )
+    with stage_seconds.labels(stage="move").time():
+        await retry(
+            partial(
+                gql_client.move_engagement,
+                input=EngagementUpdateInput(
+                    uuid=engagement_uuid,
+                    validity=RAValidityInput(from_=_start_of_today()),
+                    org_unit=org_unit_uuid,
+                ),
             ),
-            org_unit=org_unit_uuid,
+            gql_client.retry_policy,
+            "move_engagement",
+        )
+
+
+@traced
+async def apply_elevation(
+    gql_client: GraphQLClient,
+    plan: ElevationPlan,
+) -> AliasedMutationResult:
+    """
+    Apply a whole elevation in a single request, by sending the termination of
+    the existing managers and the move of the engagement as aliased mutations.
+
+    Args:
+        gql_client: The GraphQL client
+        plan: The elevation to apply.
+
+    Returns:
+        The result of each mutation, by alias. The existing managers are aliased
+        as `terminate_<index>` and the engagement move, if any, as `move`.
+    """
+    mutations = {
+        f"terminate_{index}": AliasedMutation(
+            field="manager_terminate",
+            input_type="ManagerTerminateInput",
+            input=ManagerTerminateInput(uuid=uuid, to=_start_of_today()),
+        )
+        for index, uuid in enumerate(plan.managers_to_terminate)
+    }
+    if plan.move_engagement:
+        mutations["move"] = AliasedMutation(
+            field="engagement_update",
+            input_type="EngagementUpdateInput",
+            input=EngagementUpdateInput(
+                uuid=plan.engagement_uuid,
+                validity=RAValidityInput(from_=_start_of_today()),
+                org_unit=plan.org_unit_uuid,
+            ),
+        )
+    # The mutations end the managers and move the engagement as of today, so the
+    # document leads to the same state if sent again after a timed out attempt.
+    with stage_seconds.labels(stage="apply").time():
+        return await retry(
+            partial(gql_client.aliased_mutations, mutations),
+            gql_client.retry_policy,
+            "aliased_mutations",
         )
-    )
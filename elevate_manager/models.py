@@ -0,0 +1,26 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module containing the models shared between the event processing stages
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class ElevationPlan(BaseModel):
+    """The MO changes required to elevate a single manager."""
+
+    class Config:
+        """Plans are frozen."""
+
+        frozen = True
+
+    # UUID of the new manager
+    manager_uuid: UUID
+    # UUID of the organisation unit the manager has been made manager of
+    org_unit_uuid: UUID
+    # UUID of the managers engagement to be moved into the organisation unit
+    engagement_uuid: UUID
+    # UUIDs of the pre-existing managers of the organisation unit
+    managers_to_terminate: list[UUID]
+    # Whether the engagement is not already in the organisation unit
+    move_engagement: bool = True
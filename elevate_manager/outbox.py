@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for recording elevations while they are applied, to resume after crashes
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+from uuid import UUID
+
+from .models import ElevationPlan
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS elevations (
+    id INTEGER PRIMARY KEY,
+    plan TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS operations (
+    elevation INTEGER NOT NULL REFERENCES elevations (id) ON DELETE CASCADE,
+    operation TEXT NOT NULL,
+    PRIMARY KEY (elevation, operation)
+);
+"""
+
+
+def _terminate(manager_uuid: UUID) -> str:
+    return f"terminate:{manager_uuid}"
+
+
+class Outbox:
+    """
+    Write-ahead log of the elevations being applied, kept in SQLite.
+
+    Each elevation is recorded before its first mutation is sent, its
+    terminations are marked as done once they are applied, and it is removed
+    once it is done with, whether it succeeded or failed. Elevations left in the
+    outbox were interrupted by a crash, and their remaining operations can be
+    applied on restart without reading MO again.
+
+    Args:
+        path: The SQLite database file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def add(self, plan: ElevationPlan) -> int:
+        """
+        Record an elevation about to be applied.
+
+        Args:
+            plan: The elevation.
+
+        Returns:
+            The ID of the elevation in the outbox.
+        """
+        cursor = self._db.execute(
+            "INSERT INTO elevations (plan) VALUES (?)", (plan.json(),)
+        )
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def done(self, elevation: int, terminated: Iterable[UUID]) -> None:
+        """
+        Mark terminations of an elevation as applied.
+
+        Args:
+            elevation: The ID of the elevation in the outbox.
+            terminated: UUIDs of the managers which were terminated.
+        """
+        self._db.executemany(
+            "INSERT OR IGNORE INTO operations (elevation, operation) VALUES (?, ?)",
+            [(elevation, _terminate(uuid)) for uuid in terminated],
+        )
+
+    def remove(self, elevation: int) -> None:
+        """
+        Forget an elevation which is done with.
+
+        Args:
+            elevation: The ID of the elevation in the outbox.
+        """
+        self._db.execute("DELETE FROM elevations WHERE id = ?", (elevation,))
+
+    def pending(self) -> list[tuple[int, ElevationPlan]]:
+        """
+        Get the elevations left in the outbox, reduced to their remaining
+        operations.
+
+        Returns:
+            The ID of each elevation in the outbox, and its remaining operations.
+        """
+        done: dict[int, set[str]] = {}
+        for elevation, operation in self._db.execute(
+            "SELECT elevation, operation FROM operations"
+        ):
+            done.setdefault(elevation, set()).add(operation)
+        pending = []
+        for elevation, raw_plan in self._db.execute(
+            "SELECT id, plan FROM elevations ORDER BY id"
+        ):
+            plan = ElevationPlan.parse_raw(raw_plan)
+            operations = done.get(elevation, set())
+            remaining = plan.copy(
+                update={
+                    "managers_to_terminate": [
+                        uuid
+                        for uuid in plan.managers_to_terminate
+                        if _terminate(uuid) not in operations
+                    ]
+                }
+            )
+            pending.append((elevation, remaining))
+        return pending
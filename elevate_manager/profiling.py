@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for profiling the service on demand, while it is processing events
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import suppress
+from types import FrameType
+
+
+def _label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_qualname}"
+
+
+def _sample(
+    thread_id: int, interval: float, stop: threading.Event, stacks: Counter[str]
+) -> None:
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(_label(frame))
+            frame = frame.f_back
+        stacks[";".join(reversed(labels))] += 1
+
+
+def collapse(stacks: Counter[str]) -> str:
+    """
+    Format sampled stacks in the collapsed format of flame graph tools, one
+    line per stack, root first, followed by the number of samples.
+
+    Args:
+        stacks: The number of samples of each stack.
+
+    Returns:
+        The collapsed stacks, most sampled first.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def dump(profile: cProfile.Profile) -> bytes:
+    """
+    Serialise a profile like `pstats.Stats.dump_stats`, so it can be loaded with
+    `pstats` or tools such as snakeviz.
+
+    Args:
+        profile: The recorded profile.
+
+    Returns:
+        The statistics of the profile in the binary pstats format.
+    """
+    stats = pstats.Stats(profile)
+    return marshal.dumps(stats.stats)  # type: ignore[attr-defined]
+
+
+def report(profile: cProfile.Profile, limit: int) -> str:
+    """
+    Format the functions taking the most time, including their callees.
+
+    Args:
+        profile: The recorded profile.
+        limit: Number of functions to include.
+
+    Returns:
+        The statistics of the functions, as text.
+    """
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+class Profiler:
+    """
+    Profile the event loop for a number of seconds, or until a number of events
+    have been processed, one profile at a time.
+
+    All events are processed on the thread of the event loop, which is the one
+    profiled. The deterministic profiler records every function call, at some
+    cost to throughput; the statistical profiler samples the stack of the loop
+    from another thread, at little cost.
+    """
+
+    def __init__(self) -> None:
+        self._lock = asyncio.Lock()
+        self._remaining_events: int | None = None
+        self._done: asyncio.Event | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether a profile is being recorded."""
+        return self._lock.locked()
+
+    def event_processed(self) -> None:
+        """Tell that an event was processed, ending a profile by events."""
+        if self._remaining_events is None or self._done is None:
+            return
+        self._remaining_events -= 1
+        if self._remaining_events <= 0:
+            self._done.set()
+
+    async def deterministic(
+        self, seconds: float, events: int | None
+    ) -> cProfile.Profile:
+        """
+        Record every function call.
+
+        Args:
+            seconds: Number of seconds to profile for, at most.
+            events: Number of events to profile, if the profile should end once
+                they are processed.
+
+        Returns:
+            The recorded profile.
+        """
+        async with self._lock:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await self._wait(seconds, events)
+            finally:
+                profile.disable()
+        return profile
+
+    async def statistical(
+        self, seconds: float, events: int | None, interval: float
+    ) -> Counter[str]:
+        """
+        Sample the stack of the event loop.
+
+        Args:
+            seconds: Number of seconds to profile for, at most.
+            events: Number of events to profile, if the profile should end once
+                they are processed.
+            interval: Number of seconds between the samples.
+
+        Returns:
+            The number of samples of each stack.
+        """
+        async with self._lock:
+            stacks: Counter[str] = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=_sample,
+                args=(threading.get_ident(), interval, stop, stacks),
+                daemon=True,
+            )
+            sampler.start()
+            try:
+                await self._wait(seconds, events)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+        return stacks
+
+    async def _wait(self, seconds: float, events: int | None) -> None:
+        self._done = asyncio.Event()
+        self._remaining_events = events
+        try:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self._done.wait(), seconds)
+        finally:
+            self._done = None
+            self._remaining_events = None
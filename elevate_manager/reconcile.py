@@ -0,0 +1,294 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for elevating the managers whose events were missed
+import asyncio
+import time
+from collections.abc import AsyncIterable
+from collections.abc import Callable
+from collections.abc import Coroutine
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+from uuid import uuid4
+
+import structlog
+
+from .autogenerated_graphql_client.manager_elevation import ManagerElevationManagers
+from .autogenerated_graphql_client.manager_elevation import (
+    ManagerElevationManagersObjects,
+)
+from .client import GraphQLClient
+from .dry_run import PlanWriter
+from .echo import EchoFilter
+from .events import execute_elevation_plan
+from .events import get_elevation_plan
+from .events import plan_elevation
+from .mo import get_manager_elevations
+from .mo import get_manager_pages
+from .models import ElevationPlan
+from .scheduling import KeyedLocks
+from .snapshot import OrgStructureIndex
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class ReconciliationResult:
+    """The outcome of reconciling all managers in MO."""
+
+    # Number of managers read from MO
+    managers: int = 0
+    # Number of missing elevations found
+    planned: int = 0
+    # Number of missing elevations which were applied
+    elevated: int = 0
+    # Number of missing elevations which were no longer needed when applied, e.g.
+    # because an event elevated the manager in the meantime
+    skipped: int = 0
+    # Number of missing elevations which could not be applied
+    failed: int = 0
+
+
+def is_newest_manager(manager: ManagerElevationManagersObjects) -> bool:
+    """
+    Whether the manager is the newest manager of its organisation unit.
+
+    When several managers of an organisation unit are current, the one with the
+    latest start survived the events and should be elevated; the others should
+    be terminated by that elevation.
+
+    Args:
+        manager: The manager as returned by the ManagerElevation query
+    Returns:
+        True if the manager started after all other managers of its org unit
+    """
+    if manager.current is None or len(manager.current.org_unit) != 1:
+        return False
+    (org_unit,) = manager.current.org_unit
+    starts = {m.uuid: m.validity.from_ for m in org_unit.managers}
+    start = starts.pop(manager.uuid, None)
+    if start is None:
+        return False
+    latest_other = max(starts.values(), default=None)
+    if latest_other is None or latest_other < start:
+        return True
+    if latest_other == start:
+        logger.warning(
+            "Several managers of the org unit started at the same time",
+            manager_uuid=str(manager.uuid),
+            org_unit_uuid=str(org_unit.uuid),
+        )
+    return False
+
+
+def plan_missing_elevations(managers: ManagerElevationManagers) -> list[ElevationPlan]:
+    """
+    Decide which of the managers have not been elevated yet, and how.
+
+    Args:
+        managers: The ManagerElevation query response for a page of managers
+    Returns:
+        The plans of the elevations which are missing in MO
+    """
+    plans = []
+    for manager in managers.objects:
+        if not is_newest_manager(manager):
+            continue
+        plan = plan_elevation(manager.uuid, ManagerElevationManagers(objects=[manager]))
+        if plan is None:
+            continue
+        if plan.managers_to_terminate or plan.move_engagement:
+            plans.append(plan)
+    return plans
+
+
+async def reconcile(
+    gql_client: GraphQLClient,
+    page_size: int,
+    concurrency: int,
+    single_request: bool = True,
+    termination_concurrency: int = 1,
+    org_unit_locks: KeyedLocks[UUID] | None = None,
+    echo_filter: EchoFilter | None = None,
+    org_structure: OrgStructureIndex | None = None,
+    plan_writer: PlanWriter | None = None,
+    manager_pages: AsyncIterable[list[UUID]] | None = None,
+    page_applied: Callable[[int, int], None] | None = None,
+) -> ReconciliationResult:
+    """
+    Stream over all managers in MO and apply the elevations which are missing,
+    e.g. because the events were lost during an outage.
+
+    Each page of managers is read in a single ManagerElevation query, and its
+    missing elevations are applied with up to `concurrency` elevations in flight,
+    while the next page is read. At most two pages are held at a time.
+
+    Args:
+        gql_client: A GraphQL client to perform the queries and mutations
+        page_size: Number of managers to read per page
+        concurrency: Maximum number of elevations applied at once
+        single_request: Whether to apply all mutations of an elevation in a
+            single request
+        termination_concurrency: Maximum number of concurrent terminations when
+            the mutations are not applied in a single request
+        org_unit_locks: Optional locks shared with the event listener, so that
+            elevations of the same organisation unit are applied one at a time
+        echo_filter: Optional filter to tell about the managers we terminate
+        org_structure: Optional snapshot of the org structure shared with the
+            event listener, to apply the elevations to
+        plan_writer: Optional writer of the planned operations, in which case
+            nothing is changed in MO
+        manager_pages: Optional pages of the managers to reconcile, instead of
+            all managers in MO
+        page_applied: Optional callback told the number of each page, counting
+            from zero, and its number of failed elevations once it is applied
+    Returns:
+        The number of managers read, and of elevations found and applied
+    """
+    result = ReconciliationResult()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def elevate(plan: ElevationPlan, generation: int) -> None:
+        async with semaphore:
+            try:
+                if org_unit_locks is None:
+                    elevated = await execute_elevation_plan(
+                        gql_client,
+                        plan,
+                        single_request,
+                        termination_concurrency,
+                        echo_filter,
+                        org_structure=org_structure,
+                    )
+                else:
+                    elevated = await elevate_locked(plan, generation, org_unit_locks)
+            except Exception:
+                logger.exception(
+                    "Unable to elevate manager", manager_uuid=str(plan.manager_uuid)
+                )
+                result.failed += 1
+                return None
+            if elevated:
+                result.elevated += 1
+            else:
+                result.skipped += 1
+
+    async def elevate_locked(
+        plan: ElevationPlan, generation: int, locks: KeyedLocks[UUID]
+    ) -> bool:
+        # The page was read without holding the lock, so the manager is re-read if
+        # an event for the organisation unit was processed in the meantime.
+        async with locks.hold(plan.org_unit_uuid) as lock:
+            if lock.released_since(generation):
+                fresh_plan = await get_elevation_plan(gql_client, plan.manager_uuid)
+                # A manager moved to another unit is left to the event of the move.
+                if fresh_plan is None or fresh_plan.org_unit_uuid != plan.org_unit_uuid:
+                    return False
+                plan = fresh_plan
+            return await execute_elevation_plan(
+                gql_client,
+                plan,
+                single_request,
+                termination_concurrency,
+                echo_filter,
+                org_structure=org_structure,
+            )
+
+    async def apply(plans: list[ElevationPlan], generation: int, page: int) -> None:
+        failed = result.failed
+        await asyncio.gather(*(elevate(plan, generation) for plan in plans))
+        if page_applied is not None:
+            page_applied(page, result.failed - failed)
+
+    if manager_pages is None:
+        manager_pages = get_manager_pages(gql_client, page_size)
+    applying: asyncio.Task | None = None
+    page = -1
+    try:
+        async for manager_uuids in manager_pages:
+            page += 1
+            generation = org_unit_locks.generation if org_unit_locks is not None else 0
+            read_start = time.monotonic()
+            managers = await get_manager_elevations(gql_client, manager_uuids)
+            plans = plan_missing_elevations(managers)
+            read_seconds = time.monotonic() - read_start
+            result.managers += len(manager_uuids)
+            result.planned += len(plans)
+            if plan_writer is not None:
+                # The read of the page is shared by all of its plans.
+                for plan in plans:
+                    plan_writer.write(plan, read_seconds)
+            else:
+                # Keep memory bounded by never applying more than one page at a time.
+                if applying is not None:
+                    await applying
+                applying = asyncio.create_task(apply(plans, generation, page))
+            logger.info(
+                "Reconciled page of managers",
+                managers=result.managers,
+                planned=result.planned,
+            )
+    finally:
+        # The page being applied is finished even if reading the next one failed,
+        # rather than being left running unobserved.
+        if applying is not None:
+            await applying
+
+    logger.info("Reconciliation finished", **vars(result))
+    return result
+
+
+@dataclass
+class ReconciliationJob:
+    """A reconciliation running in the background."""
+
+    id: UUID
+    task: asyncio.Task[ReconciliationResult]
+    # File the planned operations are written to, if running dry
+    plan_path: Path | None = None
+
+    def status(self) -> dict[str, Any]:
+        """The status of the job, and its result once finished."""
+        status: dict[str, Any] = {"id": str(self.id), "dry_run": bool(self.plan_path)}
+        if not self.task.done():
+            return status | {"status": "running"}
+        if self.task.cancelled():
+            return status | {"status": "cancelled"}
+        error = self.task.exception()
+        if error is not None:
+            return status | {"status": "failed", "error": str(error)}
+        return status | {"status": "finished", "result": asdict(self.task.result())}
+
+
+class ReconciliationJobs:
+    """The reconciliations started through the admin routes, by ID."""
+
+    def __init__(self) -> None:
+        self._jobs: dict[UUID, ReconciliationJob] = {}
+
+    def start(
+        self,
+        reconciliation: Coroutine[Any, Any, ReconciliationResult],
+        plan_path: Path | None = None,
+    ) -> ReconciliationJob:
+        """
+        Run the reconciliation in the background.
+
+        Args:
+            reconciliation: The reconciliation to run.
+            plan_path: File the planned operations are written to, if running dry.
+
+        Returns:
+            The job, which can be looked up by its ID later on.
+        """
+        job = ReconciliationJob(
+            id=uuid4(), task=asyncio.create_task(reconciliation), plan_path=plan_path
+        )
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: UUID) -> ReconciliationJob | None:
+        """Look up a job by its ID."""
+        return self._jobs.get(job_id)
@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for retrying requests to MO which failed with transient errors
+import asyncio
+import random
+from collections.abc import Awaitable
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+import httpx
+import structlog
+
+from .autogenerated_graphql_client import GraphQLClientHttpError
+from .metrics import mo_request_retries
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+# Statuses of MO being briefly overloaded or unavailable
+_TRANSIENT_STATUSES = {
+    httpx.codes.TOO_MANY_REQUESTS,
+    httpx.codes.BAD_GATEWAY,
+    httpx.codes.SERVICE_UNAVAILABLE,
+    httpx.codes.GATEWAY_TIMEOUT,
+}
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether a request which failed with the error may succeed if sent again.
+
+    Timeouts, connection errors and statuses of MO being overloaded or
+    unavailable are transient. Everything else, notably the GraphQL errors
+    reported by MO such as validation errors, is permanent. So is an open
+    circuit, which decides itself when MO is tried again.
+
+    Args:
+        error: The error the request failed with.
+
+    Returns:
+        Whether the request should be retried.
+    """
+    if isinstance(error, GraphQLClientHttpError):
+        return error.status_code in _TRANSIENT_STATUSES
+    return isinstance(
+        error,
+        (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError),
+    )
+
+
+def _retry_after(error: Exception) -> float | None:
+    if not isinstance(error, GraphQLClientHttpError):
+        return None
+    try:
+        return float(error.response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How often, and after how long, to retry requests failing with transient
+    errors.
+
+    The delays grow exponentially, and are drawn at random up to the grown delay
+    ("full jitter"), so that the retries of concurrent requests are spread out
+    rather than hitting MO at once.
+    """
+
+    # Number of attempts, including the first
+    attempts: int = 3
+    # Upper bound of the delay before the first retry, in seconds
+    base_delay: float = 0.5
+    # Upper bound of any delay, in seconds
+    max_delay: float = 10.0
+
+    def delay(self, retry: int, error: Exception) -> float:
+        """
+        The number of seconds to wait before a retry.
+
+        Args:
+            retry: Number of the retry, counting from zero.
+            error: The error the previous attempt failed with.
+
+        Returns:
+            The delay, at least as long as any `Retry-After` MO asked for, but no
+            longer than `max_delay`.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+async def retry(
+    operation: Callable[[], Awaitable[T]], policy: RetryPolicy, name: str
+) -> T:
+    """
+    Perform an operation, retrying it while it fails with transient errors.
+
+    Args:
+        operation: Function performing a single request to MO.
+        policy: How often, and after how long, to retry.
+        name: Name of the operation, for logging and metrics.
+
+    Returns:
+        The result of the first attempt which succeeded.
+    """
+    retries = 0
+    while True:
+        try:
+            return await operation()
+        except Exception as error:
+            if retries + 1 >= policy.attempts or not is_transient(error):
+                raise
+            delay = policy.delay(retries, error)
+            logger.warning(
+                "Retrying MO request", operation=name, error=str(error), delay=delay
+            )
+            mo_request_retries.labels(operation=name).inc()
+            await asyncio.sleep(delay)
+            retries += 1
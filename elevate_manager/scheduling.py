@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for ordering the processing of events touching the same MO objects
+import asyncio
+import itertools
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Generic
+from typing import Hashable
+from typing import TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class KeyedLock(Generic[K]):
+    """Handle for a key held by `KeyedLocks.hold`."""
+
+    def __init__(self, locks: "KeyedLocks[K]", key: K, ticket: int) -> None:
+        self._locks = locks
+        self._key = key
+        self._ticket = ticket
+
+    def released_since(self, generation: int) -> bool:
+        """
+        Whether another holder of the key released it after `generation`.
+
+        If so, anything read about the key before `generation` may be stale.
+        """
+        return self._locks._last_release(self._key) > generation
+
+    def superseded(self) -> bool:
+        """
+        Whether another caller started waiting for the key after this holder.
+
+        If so, the work of this holder may be left to the newest waiter.
+        """
+        _, _, newest = self._locks._locks[self._key]
+        return newest != self._ticket
+
+
+class KeyedLocks(Generic[K]):
+    """
+    Asynchronous locks per key, so that work on the same key runs in order while
+    work on different keys runs in parallel.
+
+    Locks only exist while they are held or waited for. To tell whether a key
+    changed while a caller was not holding it, the generation at which each key
+    was last released is remembered for the `history_size` most recently
+    released keys. Older keys are conservatively treated as just released.
+
+    Args:
+        history_size: Number of keys to remember the last release of.
+    """
+
+    def __init__(self, history_size: int) -> None:
+        self.history_size = history_size
+        self.generation = 0
+        self._tickets = itertools.count()
+        # Lock, number of holders and waiters, and ticket of the newest of them
+        self._locks: dict[K, tuple[asyncio.Lock, int, int]] = {}
+        self._releases: OrderedDict[K, int] = OrderedDict()
+        self._evicted_generation = 0
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: K) -> AsyncIterator[KeyedLock[K]]:
+        """
+        Hold the lock of the key, waiting for any current holder to release it.
+
+        Args:
+            key: The key to lock.
+
+        Yields:
+            Handle which can tell whether the key was released by others since a
+            given generation, and whether newer callers are waiting for it.
+        """
+        ticket = next(self._tickets)
+        lock, users, _ = self._locks.get(key, (asyncio.Lock(), 0, ticket))
+        self._locks[key] = (lock, users + 1, ticket)
+        try:
+            async with lock:
+                try:
+                    yield KeyedLock(self, key, ticket)
+                finally:
+                    self._record_release(key)
+        finally:
+            lock, users, newest = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1, newest)
+
+    def _record_release(self, key: K) -> None:
+        self.generation += 1
+        self._releases[key] = self.generation
+        self._releases.move_to_end(key)
+        while len(self._releases) > self.history_size:
+            _, generation = self._releases.popitem(last=False)
+            self._evicted_generation = max(self._evicted_generation, generation)
+
+    def _last_release(self, key: K) -> int:
+        return self._releases.get(key, self._evicted_generation)
+
+
+class Debouncer(Generic[K]):
+    """
+    Collapse bursts of work on the same key, so that only the last of a burst
+    is carried out once no new work arrived for `quiet_period` seconds.
+
+    Args:
+        quiet_period: Number of seconds without new work ending a burst.
+    """
+
+    def __init__(self, quiet_period: float) -> None:
+        self.quiet_period = quiet_period
+        self._tickets = itertools.count()
+        # Ticket of the latest work per key with a burst in progress
+        self._latest: dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    async def settle(self, key: K) -> bool:
+        """
+        Wait for the burst of work on the key to settle.
+
+        Args:
+            key: The key to work on.
+
+        Returns:
+            True if this is the last work of the burst, which should be carried
+            out. False if it was superseded by newer work on the same key.
+        """
+        ticket = next(self._tickets)
+        self._latest[key] = ticket
+        await asyncio.sleep(self.quiet_period)
+        if self._latest.get(key) != ticket:
+            return False
+        del self._latest[key]
+        return True
@@ -0,0 +1,511 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for keeping the org structure needed to plan elevations in memory
+import mmap
+import os
+import struct
+import sys
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from pathlib import Path
+from typing import Any
+from typing import NamedTuple
+from uuid import UUID
+
+import structlog
+from more_itertools import chunked
+
+from .autogenerated_graphql_client.manager_elevation import ManagerElevationManagers
+from .autogenerated_graphql_client.manager_snapshot import (
+    ManagerSnapshotManagersObjects,
+)
+from .client import GraphQLClient
+from .metrics import snapshot_memory_bytes
+from .mo import get_engagement_employees
+from .mo import get_manager_snapshot_pages
+from .mo import get_manager_snapshots
+from .mo import get_registration_pages
+from .models import ElevationPlan
+
+logger = structlog.get_logger(__name__)
+
+# Snapshot files consist of a header followed by fixed-size manager records and
+# engagement records, so they can be read straight from a memory map. Times are
+# stored as microseconds since the epoch, vacant managers have a zero employee and
+# managers without an end date have a zero end.
+_MAGIC = b"EMSNAP02"
+# Magic, time the snapshot is current as of, number of managers and engagements
+_HEADER = struct.Struct("<8sqII")
+# Manager, org unit, employee and the start and end of the manager's validity
+_MANAGER = struct.Struct("<16s16s16sqq")
+# Employee, engagement and org unit of the engagement
+_ENGAGEMENT = struct.Struct("<16s16s16s")
+_NO_UUID = bytes(16)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Changes registered in MO shortly before a snapshot was saved may not have reached
+# us yet, e.g. due to clock skew, so the catch-up starts this much earlier.
+_CATCH_UP_MARGIN = timedelta(minutes=5)
+
+
+class _Manager(NamedTuple):
+    org_unit_uuid: UUID
+    # None if the manager position is vacant
+    employee_uuid: UUID | None
+    valid_from: datetime
+    # Last day of the manager's validity, if it has an end date
+    valid_to: datetime | None
+
+    def ended(self, now: datetime) -> bool:
+        # The end date is inclusive, so the manager is current until the next day.
+        return self.valid_to is not None and now >= self.valid_to + timedelta(days=1)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _Engagement(NamedTuple):
+    uuid: UUID
+    org_unit_uuids: tuple[UUID, ...]
+
+
+class OrgStructureIndex:
+    """
+    The current managers of every organisation unit, and the engagements of the
+    employees holding them, so elevations can be planned without reading the
+    organisation unit from MO.
+
+    The index is loaded from MO at startup, and kept current by refreshing the
+    managers events are received for, and by applying our own elevations.
+    Managers whose validity ends are removed once it has ended, as no event tells
+    about that. Employees not holding any manager are not indexed; should they be
+    made manager, their engagements are read along with the manager.
+
+    Args:
+        clock: Clock returning the current time, to tell which managers ended.
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = _now) -> None:
+        self.clock = clock
+        self._managers: dict[UUID, _Manager] = {}
+        # Current managers of each organisation unit
+        self._org_unit_managers: dict[UUID, set[UUID]] = {}
+        # Engagements of each employee holding a manager
+        self._engagements: dict[UUID, tuple[_Engagement, ...]] = {}
+        # Managers held by each employee, to refresh them on engagement changes
+        self._employee_managers: dict[UUID, set[UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+    def __contains__(self, manager_uuid: UUID) -> bool:
+        return manager_uuid in self._managers
+
+    @property
+    def org_units(self) -> int:
+        """Number of organisation units with current managers."""
+        return len(self._org_unit_managers)
+
+    def update(
+        self,
+        manager_uuids: Iterable[UUID],
+        objects: Iterable[ManagerSnapshotManagersObjects],
+    ) -> None:
+        """
+        Replace the managers with their current state as read from MO.
+
+        Args:
+            manager_uuids: UUIDs of the managers read from MO.
+            objects: The managers found in MO. Managers which were not found, or
+                are no longer current, are removed from the index.
+        """
+        found = {obj.uuid: obj for obj in objects}
+        for manager_uuid in manager_uuids:
+            self.remove(manager_uuid)
+            obj = found.get(manager_uuid)
+            if obj is not None:
+                self._add(obj)
+
+    def _add(self, obj: ManagerSnapshotManagersObjects) -> None:
+        current = obj.current
+        if current is None or len(current.org_unit) != 1:
+            return
+        employee = current.employee[0] if current.employee else None
+        self._add_manager(
+            obj.uuid,
+            _Manager(
+                org_unit_uuid=current.org_unit[0].uuid,
+                employee_uuid=employee.uuid if employee is not None else None,
+                valid_from=current.validity.from_,
+                valid_to=current.validity.to,
+            ),
+        )
+        if employee is not None:
+            self._engagements[employee.uuid] = tuple(
+                _Engagement(e.uuid, tuple(ou.uuid for ou in e.org_unit))
+                for e in employee.engagements
+            )
+
+    def _add_manager(self, manager_uuid: UUID, manager: _Manager) -> None:
+        self._managers[manager_uuid] = manager
+        self._org_unit_managers.setdefault(manager.org_unit_uuid, set()).add(
+            manager_uuid
+        )
+        if manager.employee_uuid is not None:
+            self._employee_managers.setdefault(manager.employee_uuid, set()).add(
+                manager_uuid
+            )
+
+    def remove(self, manager_uuid: UUID) -> None:
+        """
+        Remove the manager from the index, e.g. because it was terminated.
+
+        Args:
+            manager_uuid: UUID of the manager.
+        """
+        manager = self._managers.pop(manager_uuid, None)
+        if manager is None:
+            return
+        org_unit_managers = self._org_unit_managers[manager.org_unit_uuid]
+        org_unit_managers.discard(manager_uuid)
+        if not org_unit_managers:
+            del self._org_unit_managers[manager.org_unit_uuid]
+        if manager.employee_uuid is not None:
+            employee_managers = self._employee_managers[manager.employee_uuid]
+            employee_managers.discard(manager_uuid)
+            if not employee_managers:
+                del self._employee_managers[manager.employee_uuid]
+                del self._engagements[manager.employee_uuid]
+
+    def apply(self, plan: ElevationPlan) -> None:
+        """
+        Apply an elevation made in MO to the index.
+
+        Args:
+            plan: The elevation which was applied.
+        """
+        for manager_uuid in plan.managers_to_terminate:
+            self.remove(manager_uuid)
+        manager = self._managers.get(plan.manager_uuid)
+        if not plan.move_engagement or manager is None:
+            return
+        if manager.employee_uuid is None:
+            return
+        self._engagements[manager.employee_uuid] = tuple(
+            _Engagement(e.uuid, (plan.org_unit_uuid,))
+            if e.uuid == plan.engagement_uuid
+            else e
+            for e in self._engagements[manager.employee_uuid]
+        )
+
+    def employee_managers(self, employee_uuid: UUID) -> set[UUID]:
+        """
+        Get the managers held by the employee.
+
+        Args:
+            employee_uuid: UUID of the employee.
+
+        Returns:
+            UUIDs of the managers, if any.
+        """
+        return set(self._employee_managers.get(employee_uuid, ()))
+
+    def manager_elevation(self, manager_uuid: UUID) -> ManagerElevationManagers:
+        """
+        Get the manager as it would have been returned by the ManagerElevation
+        query, so it can be planned the same way.
+
+        Args:
+            manager_uuid: UUID of the manager.
+
+        Returns:
+            The manager, the employee's engagements and the current managers of
+            the organisation unit, with no objects if the manager is not current.
+        """
+        manager = self._managers.get(manager_uuid)
+        if manager is None:
+            return ManagerElevationManagers(objects=[])
+        self._remove_ended(manager.org_unit_uuid)
+        if manager_uuid not in self._managers:
+            return ManagerElevationManagers(objects=[])
+        employee = None
+        if manager.employee_uuid is not None:
+            employee = [
+                {
+                    "engagements": [
+                        {
+                            "uuid": e.uuid,
+                            "org_unit": [{"uuid": uuid} for uuid in e.org_unit_uuids],
+                        }
+                        for e in self._engagements[manager.employee_uuid]
+                    ]
+                }
+            ]
+        org_unit = {
+            "uuid": manager.org_unit_uuid,
+            "managers": [
+                {"uuid": uuid, "validity": {"from": self._managers[uuid].valid_from}}
+                for uuid in self._org_unit_managers[manager.org_unit_uuid]
+            ],
+        }
+        return ManagerElevationManagers.parse_obj(
+            {
+                "objects": [
+                    {
+                        "uuid": manager_uuid,
+                        "current": {"employee": employee, "org_unit": [org_unit]},
+                    }
+                ]
+            }
+        )
+
+    def _remove_ended(self, org_unit_uuid: UUID) -> None:
+        now = self.clock()
+        for manager_uuid in list(self._org_unit_managers.get(org_unit_uuid, ())):
+            if self._managers[manager_uuid].ended(now):
+                self.remove(manager_uuid)
+
+    def save(self, path: Path, as_of: datetime) -> None:
+        """
+        Save the index to a file, replacing it atomically.
+
+        Args:
+            path: The file to save the index to.
+            as_of: The time in MO the index is current as of.
+        """
+        managers = b"".join(
+            _MANAGER.pack(
+                manager_uuid.bytes,
+                manager.org_unit_uuid.bytes,
+                manager.employee_uuid.bytes if manager.employee_uuid else _NO_UUID,
+                _to_microseconds(manager.valid_from),
+                _to_microseconds(manager.valid_to) if manager.valid_to else 0,
+            )
+            for manager_uuid, manager in self._managers.items()
+        )
+        engagements = [
+            _ENGAGEMENT.pack(employee_uuid.bytes, engagement.uuid.bytes, org_unit.bytes)
+            for employee_uuid, employee_engagements in self._engagements.items()
+            for engagement in employee_engagements
+            for org_unit in engagement.org_unit_uuids
+        ]
+        header = _HEADER.pack(
+            _MAGIC, _to_microseconds(as_of), len(self._managers), len(engagements)
+        )
+        temporary = path.with_name(path.name + ".tmp")
+        temporary.write_bytes(header + managers + b"".join(engagements))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["OrgStructureIndex", datetime]:
+        """
+        Load an index saved to a file.
+
+        Args:
+            path: The file the index was saved to.
+
+        Raises:
+            ValueError: If the file is not a complete snapshot.
+
+        Returns:
+            The index, and the time in MO it is current as of.
+        """
+        index = cls()
+        with path.open("rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if len(data) < _HEADER.size:
+                    raise ValueError("Snapshot file is truncated")
+                magic, as_of, manager_count, engagement_count = _HEADER.unpack_from(
+                    data
+                )
+                managers_end = _HEADER.size + manager_count * _MANAGER.size
+                engagements_end = managers_end + engagement_count * _ENGAGEMENT.size
+                if magic != _MAGIC or len(data) != engagements_end:
+                    raise ValueError("Not a complete snapshot file")
+                managers = _MANAGER.iter_unpack(data[_HEADER.size : managers_end])
+                engagements = _ENGAGEMENT.iter_unpack(
+                    data[managers_end:engagements_end]
+                )
+                for manager, org_unit, employee, valid_from, valid_to in managers:
+                    index._add_manager(
+                        UUID(bytes=manager),
+                        _Manager(
+                            org_unit_uuid=UUID(bytes=org_unit),
+                            employee_uuid=(
+                                UUID(bytes=employee) if employee != _NO_UUID else None
+                            ),
+                            valid_from=_from_microseconds(valid_from),
+                            valid_to=_from_microseconds(valid_to) if valid_to else None,
+                        ),
+                    )
+                employee_engagements: dict[UUID, dict[UUID, list[UUID]]] = {}
+                for employee, engagement, org_unit in engagements:
+                    employee_engagements.setdefault(
+                        UUID(bytes=employee), {}
+                    ).setdefault(UUID(bytes=engagement), []).append(
+                        UUID(bytes=org_unit)
+                    )
+        for employee_uuid in index._employee_managers:
+            index._engagements[employee_uuid] = tuple(
+                _Engagement(uuid, tuple(org_units))
+                for uuid, org_units in employee_engagements.get(
+                    employee_uuid, {}
+                ).items()
+            )
+        return index, _from_microseconds(as_of)
+
+    def memory_footprint(self) -> int:
+        """
+        Estimate the memory held by the index.
+
+        Returns:
+            Number of bytes held by the index, counting shared objects once.
+        """
+        return _deep_sizeof(
+            (
+                self._managers,
+                self._org_unit_managers,
+                self._engagements,
+                self._employee_managers,
+            ),
+            set(),
+        )
+
+
+def _to_microseconds(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_microseconds(microseconds: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=microseconds)
+
+
+def _deep_sizeof(obj: Any, seen: set[int]) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, tuple | list | set | frozenset):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, UUID):
+        size += sys.getsizeof(obj.int)
+    return size
+
+
+async def load_org_structure(
+    gql_client: GraphQLClient, index: OrgStructureIndex, page_size: int
+) -> None:
+    """
+    Load all current managers from MO into the index, a page at a time.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        index: The index to load the managers into.
+        page_size: Maximum number of managers per query.
+    """
+    async for page in get_manager_snapshot_pages(gql_client, page_size):
+        index.update((obj.uuid for obj in page), page)
+
+
+async def catch_up_org_structure(
+    gql_client: GraphQLClient,
+    index: OrgStructureIndex,
+    since: datetime,
+    page_size: int,
+) -> None:
+    """
+    Read the managers changed in MO since a point in time into the index, along
+    with the managers of employees whose engagements changed.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        index: The index to update.
+        since: The time in MO the index is current as of.
+        page_size: Maximum number of registrations or managers per query.
+    """
+    manager_uuids: set[UUID] = set()
+    engagement_uuids: set[UUID] = set()
+    async for page in get_registration_pages(
+        gql_client, ["manager", "engagement"], since, page_size
+    ):
+        for registration in page:
+            if registration.model == "manager":
+                manager_uuids.add(registration.uuid)
+            else:
+                engagement_uuids.add(registration.uuid)
+    for engagement_chunk in chunked(sorted(engagement_uuids), page_size):
+        employee_uuids = await get_engagement_employees(gql_client, engagement_chunk)
+        for employee_uuid in employee_uuids:
+            manager_uuids |= index.employee_managers(employee_uuid)
+    for manager_chunk in chunked(sorted(manager_uuids), page_size):
+        await refresh_managers(gql_client, index, manager_chunk)
+    logger.info(
+        "Org structure snapshot caught up",
+        since=since.isoformat(),
+        managers=len(manager_uuids),
+    )
+
+
+async def restore_org_structure(
+    gql_client: GraphQLClient, path: Path | None, page_size: int
+) -> OrgStructureIndex:
+    """
+    Restore the index from the file it was saved to, and catch up on the changes
+    made in MO since. If there is no such file, the index is loaded from MO.
+
+    Args:
+        gql_client: The GraphQL client to perform the queries.
+        path: Optional file the index was saved to.
+        page_size: Maximum number of managers per query.
+
+    Returns:
+        The index, current as of now.
+    """
+    start = time.monotonic()
+    index = None
+    if path is not None and path.exists():
+        try:
+            index, as_of = OrgStructureIndex.load(path)
+        except (OSError, ValueError):
+            logger.exception("Unable to load org structure snapshot", path=str(path))
+    if index is not None:
+        await catch_up_org_structure(
+            gql_client, index, as_of - _CATCH_UP_MARGIN, page_size
+        )
+    else:
+        index = OrgStructureIndex()
+        await load_org_structure(gql_client, index, page_size)
+    footprint = index.memory_footprint()
+    snapshot_memory_bytes.set(footprint)
+    logger.info(
+        "Org structure snapshot loaded",
+        managers=len(index),
+        org_units=index.org_units,
+        bytes=footprint,
+        seconds=time.monotonic() - start,
+    )
+    return index
+
+
+async def refresh_managers(
+    gql_client: GraphQLClient, index: OrgStructureIndex, manager_uuids: list[UUID]
+) -> None:
+    """
+    Read the managers from MO again, e.g. because an event told they changed.
+
+    Args:
+        gql_client: The GraphQL client to perform the query.
+        index: The index to update.
+        manager_uuids: UUIDs of the managers to read.
+    """
+    index.update(manager_uuids, await get_manager_snapshots(gql_client, manager_uuids))
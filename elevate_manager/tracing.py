@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+# Module for tracing the processing of events across the calls to MO
+import json
+import secrets
+import time
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from functools import wraps
+from typing import Any
+from typing import ParamSpec
+from typing import Protocol
+from typing import TextIO
+from typing import TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+@dataclass
+class Span:
+    """A timed operation, part of the trace of a single event."""
+
+    name: str
+    # 32 hex digits shared by all spans of the trace
+    trace_id: str
+    # 16 hex digits identifying the span within the trace
+    span_id: str
+    parent_id: str | None
+    # Wall clock time the span started, in seconds since the epoch
+    start: float
+    duration: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    # Representation of the exception the span failed with, if any
+    error: str | None = None
+
+
+class SpanExporter(Protocol):
+    """Destination of the spans once they end."""
+
+    def export(self, span: Span) -> None: ...
+
+
+class JSONLinesExporter:
+    """
+    Write the spans as JSON lines, e.g. to a file or to stdout.
+
+    Args:
+        stream: Text stream to write the JSON lines to.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+
+    def export(self, span: Span) -> None:
+        self.stream.write(json.dumps(asdict(span), default=str) + "\n")
+        self.stream.flush()
+
+
+_exporter: SpanExporter | None = None
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def set_exporter(exporter: SpanExporter | None) -> None:
+    """
+    Set where the spans are exported to.
+
+    Args:
+        exporter: The exporter, or None to stop tracing.
+    """
+    global _exporter
+    _exporter = exporter
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """
+    Trace an operation as a child of the current span, or as a new trace.
+
+    Spans follow the context, so operations in tasks started within the span,
+    e.g. with `asyncio.gather`, become its children. Nothing is traced without
+    an exporter.
+
+    Args:
+        name: Name of the operation.
+        attributes: Attributes of the span, e.g. the UUID of the manager.
+
+    Yields:
+        The span, or None if tracing is off.
+    """
+    exporter = _exporter
+    if exporter is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent is not None else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    start = time.monotonic()
+    try:
+        yield current
+    except BaseException as error:
+        current.error = repr(error)
+        raise
+    finally:
+        current.duration = time.monotonic() - start
+        _current_span.reset(token)
+        exporter.export(current)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """
+    Add attributes to the current span, e.g. once the org unit is known.
+
+    Args:
+        attributes: Attributes of the span.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def traceparent() -> str | None:
+    """
+    The W3C `traceparent` header of the current span, so requests can be found
+    again in the logs of MO.
+
+    Returns:
+        The header value, or None if no span is current.
+    """
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+def traced(
+    function: Callable[P, Awaitable[T]],
+) -> Callable[P, Awaitable[T]]:
+    """Trace each call of a coroutine function as a span named after it."""
+
+    @wraps(function)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        with span(function.__name__):
+            return await function(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from elevate_manager.batching import Batcher
+
+
+async def test_batcher_merges_concurrent_loads():
+    """Test that concurrent loads within the window are loaded in one batch"""
+    load_batch = AsyncMock(side_effect=lambda keys: {key: key * 2 for key in keys})
+    batcher = Batcher(load_batch, max_delay=0.01, max_size=10)
+
+    results = await asyncio.gather(
+        batcher.load(1), batcher.load(2), batcher.load(2), batcher.load(3)
+    )
+
+    assert results == [2, 4, 4, 6]
+    load_batch.assert_awaited_once_with([1, 2, 3])
+
+
+async def test_batcher_dispatches_when_full():
+    """Test that a full batch is dispatched without waiting for the window"""
+    load_batch = AsyncMock(side_effect=lambda keys: {key: key for key in keys})
+    batcher = Batcher(load_batch, max_delay=60, max_size=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.load(1), batcher.load(2)), timeout=1
+    )
+
+    assert results == [1, 2]
+    load_batch.assert_awaited_once_with([1, 2])
+
+
+async def test_batcher_propagates_errors():
+    """Test that a failing batch fails every waiting caller"""
+    load_batch = AsyncMock(side_effect=ValueError("MO is down"))
+    batcher = Batcher(load_batch, max_delay=0, max_size=10)
+
+    results = await asyncio.gather(
+        batcher.load(1), batcher.load(2), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def test_batcher_missing_key():
+    """Test that a key missing from the batch result raises KeyError"""
+    batcher = Batcher(AsyncMock(return_value={}), max_delay=0, max_size=10)
+
+    with pytest.raises(KeyError):
+        await batcher.load(1)
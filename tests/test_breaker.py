@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import httpx
+import pytest
+
+from elevate_manager.breaker import CircuitBreaker
+from elevate_manager.breaker import CircuitState
+from elevate_manager.exceptions import CircuitOpenError
+from tests.test_limiting import FakeClock
+from tests.test_limiting import respond
+
+
+async def unreachable() -> httpx.Response:
+    raise httpx.ConnectError("MO is down")
+
+
+async def test_circuit_opens_after_consecutive_failures():
+    """Test that requests are rejected without being sent once the circuit opens"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=FakeClock())
+
+    assert (await breaker.run(respond(503))).status_code == 503
+    await breaker.run(respond(200))
+    assert (await breaker.run(respond(502))).status_code == 502
+    assert breaker.state == CircuitState.CLOSED
+    with pytest.raises(httpx.ConnectError):
+        await breaker.run(unreachable)
+    assert breaker.state == CircuitState.OPEN
+
+    sent = []
+
+    async def send() -> httpx.Response:
+        sent.append(True)
+        return httpx.Response(200)
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        await breaker.run(send)
+    assert exc_info.value.retry_in == 30
+    assert sent == []
+
+
+async def test_half_open_circuit_probes():
+    """Test that a single probe closes or reopens the circuit after the timeout"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    await breaker.run(respond(500))
+    clock.now += 30
+    assert breaker.state == CircuitState.HALF_OPEN
+
+    await breaker.run(respond(500))
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now += 30
+
+    async def probe() -> httpx.Response:
+        # Other requests are rejected while the probe is in flight.
+        with pytest.raises(CircuitOpenError):
+            await breaker.run(respond(200))
+        return httpx.Response(200)
+
+    await breaker.run(probe)
+    assert breaker.state == CircuitState.CLOSED
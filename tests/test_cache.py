@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from uuid import uuid4
+
+from elevate_manager.cache import OrgUnitManagersCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_managers_are_cached_until_invalidated():
+    """Test that the managers are remembered until an event invalidates them"""
+    org_unit_uuid, manager_uuid = uuid4(), uuid4()
+    cache = OrgUnitManagersCache(ttl=60, max_size=10)
+
+    assert cache.get(org_unit_uuid) is None
+    cache.put(org_unit_uuid, [manager_uuid])
+    assert cache.get(org_unit_uuid) == {manager_uuid}
+    cache.invalidate(org_unit_uuid)
+    assert cache.get(org_unit_uuid) is None
+
+
+def test_managers_expire():
+    """Test that the managers are only remembered for the TTL"""
+    org_unit_uuid = uuid4()
+    clock = Clock()
+    cache = OrgUnitManagersCache(ttl=60, max_size=10, clock=clock)
+
+    cache.put(org_unit_uuid, [uuid4()])
+    clock.now = 60
+
+    assert cache.get(org_unit_uuid) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted():
+    """Test that at most max_size org units are remembered"""
+    first, second, third = uuid4(), uuid4(), uuid4()
+    cache = OrgUnitManagersCache(ttl=60, max_size=2)
+
+    cache.put(first, [])
+    cache.put(second, [])
+    cache.get(first)
+    cache.put(third, [])
+
+    assert cache.get(second) is None
+    assert cache.get(first) == frozenset()
+    assert len(cache) == 2
+
+
+def test_invalidated_by_manager():
+    """Test that every org unit listing an edited manager is forgotten"""
+    first, second, manager_uuid = uuid4(), uuid4(), uuid4()
+    cache = OrgUnitManagersCache(ttl=60, max_size=10)
+    cache.put(first, [manager_uuid])
+    cache.put(second, [uuid4()])
+
+    cache.invalidate_manager(manager_uuid)
+
+    assert cache.get(first) is None
+    assert cache.get(second) is not None
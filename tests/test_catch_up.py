@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from datetime import datetime
+from datetime import timezone
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+from uuid import uuid4
+
+from elevate_manager.autogenerated_graphql_client.manager_elevation import (
+    ManagerElevationManagers,
+)
+from elevate_manager.autogenerated_graphql_client.registrations import (
+    RegistrationsRegistrations,
+)
+from elevate_manager.catch_up import Checkpoint
+from elevate_manager.catch_up import catch_up
+from tests.test_reconcile import manager_object
+
+
+def registrations(manager_uuids, start, next_cursor) -> RegistrationsRegistrations:
+    return RegistrationsRegistrations.parse_obj(
+        {
+            "objects": [
+                {"uuid": str(uuid), "model": "manager", "start": start}
+                for uuid in manager_uuids
+            ],
+            "page_info": {"next_cursor": next_cursor},
+        }
+    )
+
+
+def test_checkpoint_is_persisted(tmp_path):
+    """Test that the checkpoint survives being loaded again"""
+    checkpoint = Checkpoint(tmp_path / "checkpoint")
+    timestamp = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+    assert checkpoint.load() is None
+    checkpoint.save(timestamp)
+
+    assert Checkpoint(tmp_path / "checkpoint").load() == timestamp
+
+
+async def test_catch_up_starts_from_now_without_checkpoint(tmp_path):
+    """Test that nothing is read from MO on the first catch-up"""
+    gql_client = AsyncMock()
+    checkpoint = Checkpoint(tmp_path / "checkpoint")
+
+    await catch_up(gql_client, checkpoint, page_size=10, concurrency=1)
+
+    gql_client.registrations.assert_not_awaited()
+    assert checkpoint.load() is not None
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_catch_up_elevates_changed_managers(
+    mock_execute_elevation_plan: AsyncMock, tmp_path
+):
+    """Test that each changed manager is reconciled once, a page at a time"""
+    start = "2000-01-01T00:00:00+01:00"
+    first, second = uuid4(), uuid4()
+    checkpoint = Checkpoint(tmp_path / "checkpoint")
+    since = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    checkpoint.save(since)
+    gql_client = AsyncMock()
+    gql_client.registrations.side_effect = [
+        registrations([first, first], "2000-01-02T00:00:00+00:00", "cursor"),
+        registrations([first, second], "2000-01-03T00:00:00+00:00", None),
+    ]
+    gql_client.manager_elevation.side_effect = (
+        lambda uuids: ManagerElevationManagers.parse_obj(
+            {
+                "objects": [
+                    manager_object(uuid, uuid4(), uuid4(), [(uuid, start)])
+                    for uuid in uuids
+                ]
+            }
+        )
+    )
+
+    result = await catch_up(gql_client, checkpoint, page_size=2, concurrency=1)
+
+    assert gql_client.registrations.await_args_list[0].kwargs["start"] < since
+    assert [args.args for args in gql_client.manager_elevation.await_args_list] == [
+        ([first],),
+        ([second],),
+    ]
+    assert (result.managers, result.elevated) == (2, 2)
+    checkpoint_time = checkpoint.load()
+    assert checkpoint_time is not None
+    assert checkpoint_time > datetime(2000, 1, 3, tzinfo=timezone.utc)
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_catch_up_checkpoint_not_advanced_past_failures(
+    mock_execute_elevation_plan: AsyncMock, tmp_path
+):
+    """Test that failed elevations are retried by the next catch-up"""
+    start = "2000-01-01T00:00:00+01:00"
+    first, second = uuid4(), uuid4()
+    checkpoint = Checkpoint(tmp_path / "checkpoint")
+    checkpoint.save(datetime(2000, 1, 1, tzinfo=timezone.utc))
+    gql_client = AsyncMock()
+    gql_client.registrations.side_effect = [
+        registrations([first], "2000-01-02T00:00:00+00:00", "cursor"),
+        registrations([second], "2000-01-03T00:00:00+00:00", None),
+    ]
+    gql_client.manager_elevation.side_effect = (
+        lambda uuids: ManagerElevationManagers.parse_obj(
+            {
+                "objects": [
+                    manager_object(uuid, uuid4(), uuid4(), [(uuid, start)])
+                    for uuid in uuids
+                ]
+            }
+        )
+    )
+
+    async def execute_elevation_plan(gql_client, plan, *args, **kwargs):
+        if plan.manager_uuid == second:
+            raise ValueError("MO is down")
+
+    mock_execute_elevation_plan.side_effect = execute_elevation_plan
+
+    result = await catch_up(gql_client, checkpoint, page_size=1, concurrency=1)
+
+    assert result.failed == 1
+    assert checkpoint.load() == datetime(2000, 1, 2, tzinfo=timezone.utc)
@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import json
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from elevate_manager.autogenerated_graphql_client import GraphQLClientGraphQLMultiError
+from elevate_manager.autogenerated_graphql_client import ManagerTerminateInput
+from elevate_manager.client import AliasedMutation
+from elevate_manager.client import GraphQLClient
+
+
+def graphql_client(response: dict, requests: list | None = None) -> GraphQLClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if requests is not None:
+            requests.append(json.loads(request.content))
+        return httpx.Response(200, json=response)
+
+    return GraphQLClient(
+        url="http://mo/graphql",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+def terminate(uuid) -> AliasedMutation:
+    return AliasedMutation(
+        field="manager_terminate",
+        input_type="ManagerTerminateInput",
+        input=ManagerTerminateInput(uuid=uuid, to="2000-01-01T00:00:00+01:00"),
+    )
+
+
+async def test_aliased_mutations_single_document():
+    """Test that all mutations are sent as aliases in one document"""
+    first, second = uuid4(), uuid4()
+    requests: list = []
+    client = graphql_client(
+        {
+            "data": {
+                "terminate_0": {"uuid": str(first)},
+                "terminate_1": {"uuid": str(second)},
+            }
+        },
+        requests,
+    )
+
+    result = await client.aliased_mutations(
+        {"terminate_0": terminate(first), "terminate_1": terminate(second)}
+    )
+
+    assert result.uuids == {"terminate_0": first, "terminate_1": second}
+    assert result.errors == {}
+    (request,) = requests
+    assert "terminate_0: manager_terminate(input: $terminate_0)" in request["query"]
+    assert "terminate_1: manager_terminate(input: $terminate_1)" in request["query"]
+    assert request["variables"]["terminate_1"]["uuid"] == str(second)
+
+
+async def test_aliased_mutations_maps_errors_to_aliases():
+    """Test that errors are reported on the alias they belong to"""
+    first, second, third = uuid4(), uuid4(), uuid4()
+    # The mutation results are non-null, so a failing alias nulls the whole data.
+    client = graphql_client(
+        {
+            "data": None,
+            "errors": [{"message": "Manager not found", "path": ["terminate_1"]}],
+        }
+    )
+
+    result = await client.aliased_mutations(
+        {
+            "terminate_0": terminate(first),
+            "terminate_1": terminate(second),
+            "terminate_2": terminate(third),
+        }
+    )
+
+    # The outcome of the aliases around the failing one is unknown.
+    assert result.uuids == {}
+    assert list(result.errors) == ["terminate_1"]
+    assert result.errors["terminate_1"].message == "Manager not found"
+
+
+async def test_aliased_mutations_document_errors():
+    """Test that errors concerning the whole document are raised"""
+    client = graphql_client(
+        {"data": None, "errors": [{"message": "Unknown type 'Foo'"}]}
+    )
+
+    with pytest.raises(GraphQLClientGraphQLMultiError):
+        await client.aliased_mutations({"terminate_0": terminate(uuid4())})
@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import io
+import json
+from uuid import uuid4
+
+from elevate_manager.dry_run import PlanWriter
+from elevate_manager.models import ElevationPlan
+
+
+def test_plan_written_as_operations():
+    """Test that each planned mutation is written as one JSON line"""
+    plan = ElevationPlan(
+        manager_uuid=uuid4(),
+        org_unit_uuid=uuid4(),
+        engagement_uuid=uuid4(),
+        managers_to_terminate=[uuid4(), uuid4()],
+    )
+    stream = io.StringIO()
+    writer = PlanWriter(stream)
+
+    writer.write(plan, read_seconds=0.25)
+
+    operations = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(o["operation"], o["uuid"]) for o in operations] == [
+        ("TerminateManager", str(plan.managers_to_terminate[0])),
+        ("TerminateManager", str(plan.managers_to_terminate[1])),
+        ("MoveEngagement", str(plan.engagement_uuid)),
+    ]
+    assert all(o["read_seconds"] == 0.25 for o in operations)
+    assert all(o["manager_uuid"] == str(plan.manager_uuid) for o in operations)
+    assert writer.operations == 3
+
+
+def test_plan_without_move():
+    """Test that an engagement already in place is not written as a move"""
+    plan = ElevationPlan(
+        manager_uuid=uuid4(),
+        org_unit_uuid=uuid4(),
+        engagement_uuid=uuid4(),
+        managers_to_terminate=[],
+        move_engagement=False,
+    )
+    stream = io.StringIO()
+
+    PlanWriter(stream).write(plan, read_seconds=0)
+
+    assert stream.getvalue() == ""
@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from uuid import uuid4
+
+from elevate_manager.echo import EchoFilter
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_echo_is_consumed_once():
+    """Test that each expected echo drops exactly one event"""
+    manager_uuid = uuid4()
+    echo_filter = EchoFilter(ttl=60, max_size=10)
+
+    echo_filter.expect([manager_uuid])
+
+    assert echo_filter.is_echo(manager_uuid)
+    assert not echo_filter.is_echo(manager_uuid)
+    assert not echo_filter.is_echo(uuid4())
+
+
+def test_echo_expires():
+    """Test that echoes are only expected for the TTL"""
+    manager_uuid = uuid4()
+    clock = Clock()
+    echo_filter = EchoFilter(ttl=60, max_size=10, clock=clock)
+
+    echo_filter.expect([manager_uuid])
+    clock.now = 61
+
+    assert not echo_filter.is_echo(manager_uuid)
+    assert len(echo_filter) == 0
+
+
+def test_echo_max_size():
+    """Test that the oldest managers are forgotten first"""
+    first, second, third = uuid4(), uuid4(), uuid4()
+    echo_filter = EchoFilter(ttl=60, max_size=2)
+
+    echo_filter.expect([first, second, third])
+
+    assert len(echo_filter) == 2
+    assert not echo_filter.is_echo(first)
+    assert echo_filter.is_echo(third)
+
+
+def test_echo_forget():
+    """Test that failed mutations are not expected to echo"""
+    manager_uuid = uuid4()
+    echo_filter = EchoFilter(ttl=60, max_size=10)
+
+    echo_filter.expect([manager_uuid])
+    echo_filter.forget([manager_uuid])
+
+    assert not echo_filter.is_echo(manager_uuid)
@@ -1,28 +1,75 @@
 # SPDX-FileCopyrightText: 2022 Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
+import asyncio
+import io
+import json
 import unittest.mock
 from unittest.mock import AsyncMock
 from uuid import uuid4
 
 import pytest
+from prometheus_client import REGISTRY
 
-from elevate_manager.autogenerated_graphql_client.get_manager_engagement import (
-    GetManagerEngagementManagersObjectsCurrentEmployeeEngagements,
-)
-from elevate_manager.autogenerated_graphql_client.manager_engagements import (
-    ManagerEngagementsManagers,
-)
-from elevate_manager.autogenerated_graphql_client.org_unit_managers import (
-    OrgUnitManagersOrgUnits,
+from elevate_manager.autogenerated_graphql_client import GraphQLClientGraphQLError
+
+from elevate_manager.autogenerated_graphql_client.manager_elevation import (
+    ManagerElevationManagers,
 )
+from elevate_manager.cache import OrgUnitManagersCache
+from elevate_manager.client import AliasedMutationResult
+from elevate_manager.dry_run import PlanWriter
+from elevate_manager.echo import EchoFilter
+from elevate_manager.events import execute_elevation_plan
+from elevate_manager.events import plan_elevation
 from elevate_manager.events import process_manager_event
+from elevate_manager.exceptions import ElevationError
+from elevate_manager.mo import TerminationResult
+from elevate_manager.models import ElevationPlan
+from elevate_manager.scheduling import Debouncer
+from elevate_manager.scheduling import KeyedLocks
+from elevate_manager.snapshot import OrgStructureIndex
+from tests.test_snapshot import snapshot_page
+
+
+def engagement(uuid=None, org_unit_uuid=None) -> dict:
+    return {
+        "uuid": str(uuid or uuid4()),
+        "org_unit": [{"uuid": str(org_unit_uuid or uuid4())}],
+    }
+
+
+def manager_elevation_response(
+    manager_uuid, org_unit_uuid, engagements, managers
+) -> ManagerElevationManagers:
+    return ManagerElevationManagers.parse_obj(
+        {
+            "objects": [
+                {
+                    "uuid": str(manager_uuid),
+                    "current": {
+                        "employee": [{"engagements": engagements}],
+                        "org_unit": [
+                            {
+                                "uuid": str(org_unit_uuid),
+                                "managers": [
+                                    {"validity": {"from": "2000-01-01T00:00:00+01:00"}}
+                                    | manager
+                                    for manager in managers
+                                ],
+                            }
+                        ],
+                    },
+                }
+            ]
+        }
+    )
 
 
 @pytest.mark.asyncio
-@unittest.mock.patch("elevate_manager.events.get_manager_engagements")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
 @unittest.mock.patch("elevate_manager.events.logger")
 async def test_process_manager_event_none_when_no_engagements_found_in_manager_obj(
-    mock_events_logger, mock_get_managers_function
+    mock_events_logger, mock_get_manager_elevation
 ):
     """
     Tests if:
@@ -33,7 +80,7 @@ async def test_process_manager_event_none_when_no_engagements_found_in_manager_o
     # ARRANGE
     manager_uuid = uuid4()
     mocked_gql_client = AsyncMock()
-    mock_get_managers_function.side_effect = ValueError()
+    mock_get_manager_elevation.side_effect = ValueError()
 
     # ACT
     result = await process_manager_event(
@@ -49,10 +96,10 @@ async def test_process_manager_event_none_when_no_engagements_found_in_manager_o
 
 
 @pytest.mark.asyncio
-@unittest.mock.patch("elevate_manager.events.get_manager_engagements")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
 @unittest.mock.patch("elevate_manager.events.logger")
 async def test_process_manager_event_none_when_no_manager_obj_found(
-    mock_events_logger, mock_get_managers_function
+    mock_events_logger, mock_get_manager_elevation
 ):
     """
     Tests if:
@@ -63,7 +110,7 @@ async def test_process_manager_event_none_when_no_manager_obj_found(
     # ARRANGE
     manager_no_objects = {"objects": []}
 
-    mock_get_managers_function.return_value = ManagerEngagementsManagers.parse_obj(
+    mock_get_manager_elevation.return_value = ManagerElevationManagers.parse_obj(
         manager_no_objects
     )
 
@@ -83,20 +130,14 @@ async def test_process_manager_event_none_when_no_manager_obj_found(
     "engagements",
     [
         [],
-        [
-            GetManagerEngagementManagersObjectsCurrentEmployeeEngagements(
-                uuid=str(uuid4())
-            ),
-            GetManagerEngagementManagersObjectsCurrentEmployeeEngagements(
-                uuid=str(uuid4())
-            ),
-        ],
+        [engagement(), engagement()],
     ],
 )
-@unittest.mock.patch("elevate_manager.events.get_manager_engagements")
+@unittest.mock.patch("elevate_manager.events.move_engagement")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
 @unittest.mock.patch("elevate_manager.events.logger")
 async def test_process_manager_event_none_when_manager_does_not_have_one_engagement(
-    mock_events_logger, mock_get_managers_function, engagements
+    mock_events_logger, mock_get_manager_elevation, mock_move_engagement, engagements
 ):
     """
     Tests if:
@@ -104,24 +145,15 @@ async def test_process_manager_event_none_when_manager_does_not_have_one_engagem
        one engagement.
     2) logging message gets properly logged with correct error level.
     """
-    manager_no_engagements: dict = {
-        "objects": [
-            {
-                "current": {
-                    "employee": [{"engagements": engagements}],
-                    "org_unit_uuid": str(uuid4()),
-                }
-            }
-        ]
-    }
-    mock_get_managers_function.return_value = ManagerEngagementsManagers.parse_obj(
-        manager_no_engagements
+    manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), engagements, []
     )
 
     # ACT
     result = await process_manager_event(
         gql_client=AsyncMock(),
-        manager_uuid=uuid4(),
+        manager_uuid=manager_uuid,
     )
 
     # ASSERT
@@ -129,78 +161,87 @@ async def test_process_manager_event_none_when_manager_does_not_have_one_engagem
     mock_events_logger.error.assert_any_call(
         "Manager does not have exactly one engagement, and engagement can not be moved"
     )
+    mock_move_engagement.assert_not_awaited()
 
 
-@unittest.mock.patch("elevate_manager.events.terminate_existing_managers")
-@unittest.mock.patch("elevate_manager.events.get_existing_managers")
-@unittest.mock.patch("elevate_manager.events.get_manager_engagements")
+@unittest.mock.patch("elevate_manager.events.terminate_managers")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
 async def test_terminate_managers_when_existing_managers_present(
-    mock_get_manager_engagements: AsyncMock,
-    mock_get_existing_managers: AsyncMock,
-    mock_terminate_existing_managers: AsyncMock,
+    mock_get_manager_elevation: AsyncMock,
+    mock_terminate_managers: AsyncMock,
 ):
     """Test that any existing managers are terminated"""
 
     # ARRANGE
-    org_unit_uuid = uuid4()
-
-    graphql_manager_engagements = {
-        "objects": [
-            {
-                "current": {
-                    "employee": [{"engagements": [{"uuid": str(uuid4())}]}],
-                    "org_unit_uuid": str(org_unit_uuid),
-                }
-            }
-        ]
-    }
-    mock_get_manager_engagements.return_value = ManagerEngagementsManagers.parse_obj(
-        graphql_manager_engagements
-    )
-
-    graphql_existing_managers_resp = {
-        "objects": [
-            {
-                "current": {
-                    "name": "Some org unit",
-                    "uuid": str(uuid4()),
-                    "managers": [
-                        {"uuid": str(uuid4()), "user_key": "some manager 1"},
-                        {"uuid": str(uuid4()), "user_key": "some manager 2"},
-                    ],
-                }
-            }
-        ]
-    }
+    manager_uuid = uuid4()
+    existing_manager_uuids = [uuid4(), uuid4()]
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        uuid4(),
+        [engagement()],
+        [{"uuid": str(uuid)} for uuid in [manager_uuid, *existing_manager_uuids]],
+    )
 
-    mock_get_existing_managers.return_value = OrgUnitManagersOrgUnits.parse_obj(
-        graphql_existing_managers_resp
+    mock_terminate_managers.return_value = TerminationResult(
+        terminated=existing_manager_uuids
     )
 
     gql_client = AsyncMock()
-    manager_uuid = uuid4()
+    batcher = AsyncMock()
 
     # ACT
     await process_manager_event(
         gql_client=gql_client,
         manager_uuid=manager_uuid,
+        manager_elevation_batcher=batcher,
+        single_request=False,
+        termination_concurrency=3,
     )
 
     # ASSERT
-    mock_get_existing_managers.assert_awaited_once_with(org_unit_uuid, gql_client)
-    mock_terminate_existing_managers.assert_awaited_once_with(
-        gql_client,
-        OrgUnitManagersOrgUnits.parse_obj(graphql_existing_managers_resp),
+    mock_get_manager_elevation.assert_awaited_once_with(
+        gql_client, manager_uuid, batcher
+    )
+    mock_terminate_managers.assert_awaited_once_with(
+        gql_client, existing_manager_uuids, 3
+    )
+
+
+@unittest.mock.patch("elevate_manager.events.move_engagement")
+@unittest.mock.patch("elevate_manager.events.terminate_managers")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_engagement_not_moved_when_termination_fails(
+    mock_get_manager_elevation: AsyncMock,
+    mock_terminate_managers: AsyncMock,
+    mock_move_engagement: AsyncMock,
+):
+    """Test that partial termination failures are raised before moving"""
+    manager_uuid = uuid4()
+    terminated_uuid, failed_uuid = uuid4(), uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
         manager_uuid,
+        uuid4(),
+        [engagement()],
+        [{"uuid": str(terminated_uuid)}, {"uuid": str(failed_uuid)}],
+    )
+    error = ValueError("MO is down")
+    mock_terminate_managers.return_value = TerminationResult(
+        terminated=[terminated_uuid], failed={failed_uuid: error}
     )
 
+    with pytest.raises(ElevationError) as exc_info:
+        await process_manager_event(
+            gql_client=AsyncMock(), manager_uuid=manager_uuid, single_request=False
+        )
+
+    assert exc_info.value.errors == {str(failed_uuid): error}
+    mock_move_engagement.assert_not_awaited()
+
 
 @unittest.mock.patch("elevate_manager.events.move_engagement")
-@unittest.mock.patch("elevate_manager.events.get_existing_managers")
-@unittest.mock.patch("elevate_manager.events.get_manager_engagements")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
 async def test_move_engagement(
-    mock_get_manager_engagements: AsyncMock,
-    mock_get_existing_managers: AsyncMock,
+    mock_get_manager_elevation: AsyncMock,
     mock_move_engagement: AsyncMock,
 ):
     """Test that the new manager is moved"""
@@ -209,28 +250,8 @@ async def test_move_engagement(
     engagement_uuid = uuid4()
     manager_uuid = uuid4()
     manager_ou_uuid = uuid4()
-
-    graphql_manager_engagements = {
-        "objects": [
-            {
-                "current": {
-                    "employee": [{"engagements": [{"uuid": str(engagement_uuid)}]}],
-                    "org_unit_uuid": str(manager_ou_uuid),
-                }
-            }
-        ]
-    }
-    mock_get_manager_engagements.return_value = ManagerEngagementsManagers.parse_obj(
-        graphql_manager_engagements
-    )
-
-    graphql_existing_managers_resp = {
-        "objects": [
-            {"current": {"name": "Some org unit", "uuid": str(uuid4()), "managers": []}}
-        ]
-    }
-    mock_get_existing_managers.return_value = OrgUnitManagersOrgUnits.parse_obj(
-        graphql_existing_managers_resp
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, manager_ou_uuid, [engagement(engagement_uuid)], []
     )
 
     gql_client = AsyncMock()
@@ -239,9 +260,546 @@ async def test_move_engagement(
     await process_manager_event(
         gql_client=gql_client,
         manager_uuid=manager_uuid,
+        single_request=False,
     )
 
     # ASSERT
     mock_move_engagement.assert_awaited_once_with(
         gql_client, manager_ou_uuid, engagement_uuid
     )
+
+
+def test_plan_elevation():
+    """Test that the plan is built from the single ManagerElevation response"""
+    manager_uuid = uuid4()
+    org_unit_uuid = uuid4()
+    engagement_uuid = uuid4()
+    existing_manager_uuid = uuid4()
+
+    plan = plan_elevation(
+        manager_uuid,
+        manager_elevation_response(
+            manager_uuid,
+            org_unit_uuid,
+            [engagement(engagement_uuid)],
+            [{"uuid": str(manager_uuid)}, {"uuid": str(existing_manager_uuid)}],
+        ),
+    )
+
+    assert plan == ElevationPlan(
+        manager_uuid=manager_uuid,
+        org_unit_uuid=org_unit_uuid,
+        engagement_uuid=engagement_uuid,
+        managers_to_terminate=[existing_manager_uuid],
+    )
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_single_request_elevation(
+    mock_get_manager_elevation: AsyncMock,
+    mock_apply_elevation: AsyncMock,
+):
+    """Test that the whole elevation is applied in one request"""
+    manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), [engagement()], [{"uuid": str(uuid4())}]
+    )
+    mock_apply_elevation.return_value = AliasedMutationResult(
+        uuids={"terminate_0": uuid4(), "move": uuid4()}
+    )
+    gql_client = AsyncMock()
+
+    await process_manager_event(gql_client=gql_client, manager_uuid=manager_uuid)
+
+    mock_apply_elevation.assert_awaited_once()
+    gql_client.terminate_manager.assert_not_awaited()
+    gql_client.move_engagement.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_single_request_elevation_errors(
+    mock_get_manager_elevation: AsyncMock,
+    mock_apply_elevation: AsyncMock,
+):
+    """Test that errors of the single request are raised per alias"""
+    manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), [engagement()], [{"uuid": str(uuid4())}]
+    )
+    error = GraphQLClientGraphQLError(message="Manager not found")
+    mock_apply_elevation.return_value = AliasedMutationResult(
+        errors={"terminate_0": error}
+    )
+
+    with pytest.raises(ElevationError) as exc_info:
+        await process_manager_event(gql_client=AsyncMock(), manager_uuid=manager_uuid)
+
+    assert exc_info.value.errors == {"terminate_0": error}
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_org_unit_reread_when_changed_while_waiting(
+    mock_get_manager_elevation: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that the manager is re-read if the org unit was changed meanwhile"""
+    manager_uuid = uuid4()
+    org_unit_uuid = uuid4()
+    engagements = [engagement()]
+    stale_manager_uuid = uuid4()
+    org_unit_locks: KeyedLocks = KeyedLocks(history_size=10)
+
+    async def get_manager_elevation(*args):
+        # Another event for the same org unit finishes while we are reading.
+        async with org_unit_locks.hold(org_unit_uuid):
+            pass
+        mock_get_manager_elevation.side_effect = None
+        return manager_elevation_response(
+            manager_uuid,
+            org_unit_uuid,
+            engagements,
+            [{"uuid": str(stale_manager_uuid)}],
+        )
+
+    mock_get_manager_elevation.side_effect = get_manager_elevation
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, org_unit_uuid, engagements, []
+    )
+
+    await process_manager_event(
+        gql_client=AsyncMock(), manager_uuid=manager_uuid, org_unit_locks=org_unit_locks
+    )
+
+    assert mock_get_manager_elevation.await_count == 2
+    (_, plan, *_), _ = mock_execute_elevation_plan.call_args
+    assert plan.managers_to_terminate == []
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_echo_of_own_termination_is_dropped(
+    mock_get_manager_elevation: AsyncMock,
+    mock_apply_elevation: AsyncMock,
+):
+    """Test that the event for a manager we terminated makes no MO calls"""
+    manager_uuid = uuid4()
+    existing_manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        uuid4(),
+        [engagement()],
+        [{"uuid": str(existing_manager_uuid)}],
+    )
+    mock_apply_elevation.return_value = AliasedMutationResult(
+        uuids={"terminate_0": existing_manager_uuid, "move": uuid4()}
+    )
+    echo_filter = EchoFilter(ttl=60, max_size=10)
+
+    await process_manager_event(
+        gql_client=AsyncMock(), manager_uuid=manager_uuid, echo_filter=echo_filter
+    )
+    mock_get_manager_elevation.reset_mock()
+    await process_manager_event(
+        gql_client=AsyncMock(),
+        manager_uuid=existing_manager_uuid,
+        echo_filter=echo_filter,
+    )
+
+    mock_get_manager_elevation.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_no_op_elevation_is_skipped(
+    mock_get_manager_elevation: AsyncMock,
+    mock_apply_elevation: AsyncMock,
+):
+    """Test that no mutations are made if the manager is already in place"""
+    manager_uuid = uuid4()
+    org_unit_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        org_unit_uuid,
+        [engagement(org_unit_uuid=org_unit_uuid)],
+        [{"uuid": str(manager_uuid)}],
+    )
+
+    await process_manager_event(gql_client=AsyncMock(), manager_uuid=manager_uuid)
+
+    mock_apply_elevation.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.move_engagement")
+@unittest.mock.patch("elevate_manager.events.terminate_managers")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_engagement_in_place_is_not_moved(
+    mock_get_manager_elevation: AsyncMock,
+    mock_terminate_managers: AsyncMock,
+    mock_move_engagement: AsyncMock,
+):
+    """Test that existing managers are terminated without moving the engagement"""
+    manager_uuid = uuid4()
+    org_unit_uuid = uuid4()
+    existing_manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        org_unit_uuid,
+        [engagement(org_unit_uuid=org_unit_uuid)],
+        [{"uuid": str(existing_manager_uuid)}],
+    )
+    mock_terminate_managers.return_value = TerminationResult(
+        terminated=[existing_manager_uuid]
+    )
+
+    await process_manager_event(
+        gql_client=AsyncMock(), manager_uuid=manager_uuid, single_request=False
+    )
+
+    mock_terminate_managers.assert_awaited_once()
+    mock_move_engagement.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.get_elevation_plan")
+async def test_burst_of_events_is_processed_once(
+    mock_get_elevation_plan: AsyncMock,
+):
+    """Test that a create followed by an edit for the same manager reads MO once"""
+    manager_uuid = uuid4()
+    mock_get_elevation_plan.return_value = None
+    manager_debouncer: Debouncer = Debouncer(quiet_period=0.01)
+
+    await asyncio.gather(
+        *(
+            process_manager_event(
+                gql_client=AsyncMock(),
+                manager_uuid=manager_uuid,
+                manager_debouncer=manager_debouncer,
+            )
+            for _ in range(2)
+        )
+    )
+
+    mock_get_elevation_plan.assert_awaited_once()
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_elevation_plan")
+async def test_waiting_managers_of_same_org_unit_are_collapsed(
+    mock_get_elevation_plan: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that only the newest waiting manager of an org unit is elevated"""
+    org_unit_uuid = uuid4()
+    manager_uuids = [uuid4(), uuid4(), uuid4()]
+
+    async def get_elevation_plan(gql_client, manager_uuid, *args):
+        return ElevationPlan(
+            manager_uuid=manager_uuid,
+            org_unit_uuid=org_unit_uuid,
+            engagement_uuid=uuid4(),
+            managers_to_terminate=[],
+        )
+
+    async def execute_elevation_plan(*args):
+        await asyncio.sleep(0.01)
+
+    mock_get_elevation_plan.side_effect = get_elevation_plan
+    mock_execute_elevation_plan.side_effect = execute_elevation_plan
+    org_unit_locks: KeyedLocks = KeyedLocks(history_size=10)
+
+    await asyncio.gather(
+        *(
+            process_manager_event(
+                gql_client=AsyncMock(),
+                manager_uuid=manager_uuid,
+                org_unit_locks=org_unit_locks,
+            )
+            for manager_uuid in manager_uuids
+        )
+    )
+
+    elevated = [
+        plan.manager_uuid
+        for (_, plan, *_), _ in mock_execute_elevation_plan.call_args_list
+    ]
+    assert elevated == [manager_uuids[0], manager_uuids[2]]
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_dry_run_writes_plan_without_mutating(
+    mock_get_manager_elevation: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that a dry run writes the planned operations instead of applying them"""
+    manager_uuid = uuid4()
+    existing_manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), [engagement()], [{"uuid": str(existing_manager_uuid)}]
+    )
+    stream = io.StringIO()
+
+    await process_manager_event(
+        gql_client=AsyncMock(),
+        manager_uuid=manager_uuid,
+        plan_writer=PlanWriter(stream),
+    )
+
+    mock_execute_elevation_plan.assert_not_awaited()
+    operations = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [o["operation"] for o in operations] == [
+        "TerminateManager",
+        "MoveEngagement",
+    ]
+    assert operations[0]["uuid"] == str(existing_manager_uuid)
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_org_unit_managers_taken_from_cache_when_changed_while_waiting(
+    mock_get_manager_elevation: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that the managers left by the other event are used without a re-read"""
+    manager_uuid = uuid4()
+    org_unit_uuid = uuid4()
+    stale_manager_uuid, current_manager_uuid = uuid4(), uuid4()
+    org_unit_locks: KeyedLocks = KeyedLocks(history_size=10)
+    cache = OrgUnitManagersCache(ttl=60, max_size=10)
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        org_unit_uuid,
+        [engagement()],
+        [{"uuid": str(stale_manager_uuid)}],
+    )
+
+    async def other_event() -> None:
+        # Another event for the same org unit is elevating a manager meanwhile.
+        async with org_unit_locks.hold(org_unit_uuid):
+            await asyncio.sleep(0.01)
+            cache.put(org_unit_uuid, [current_manager_uuid])
+
+    await asyncio.gather(
+        other_event(),
+        process_manager_event(
+            gql_client=AsyncMock(),
+            manager_uuid=manager_uuid,
+            org_unit_locks=org_unit_locks,
+            org_unit_managers_cache=cache,
+        ),
+    )
+
+    mock_get_manager_elevation.assert_awaited_once()
+    (_, plan, *_), _ = mock_execute_elevation_plan.call_args
+    assert plan.managers_to_terminate == [current_manager_uuid]
+    assert cache.get(org_unit_uuid) == {manager_uuid}
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_cached_org_unit_invalidated_by_event_without_plan(
+    mock_get_manager_elevation: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that an event for a cached manager invalidates its org unit"""
+    manager_uuid, org_unit_uuid = uuid4(), uuid4()
+    cache = OrgUnitManagersCache(ttl=60, max_size=10)
+    cache.put(org_unit_uuid, [manager_uuid])
+    # The manager was vacated, so there is nothing to elevate.
+    mock_get_manager_elevation.side_effect = ValueError()
+
+    await process_manager_event(
+        gql_client=AsyncMock(),
+        manager_uuid=manager_uuid,
+        org_unit_locks=KeyedLocks(history_size=10),
+        org_unit_managers_cache=cache,
+    )
+
+    assert cache.get(org_unit_uuid) is None
+    mock_execute_elevation_plan.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_echo_forgotten_when_request_fails(
+    mock_get_manager_elevation: AsyncMock,
+    mock_apply_elevation: AsyncMock,
+):
+    """Test that no echo is expected when the single request raises"""
+    manager_uuid = uuid4()
+    existing_manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid,
+        uuid4(),
+        [engagement()],
+        [{"uuid": str(existing_manager_uuid)}],
+    )
+    mock_apply_elevation.side_effect = TimeoutError()
+    echo_filter = EchoFilter(ttl=60, max_size=10)
+
+    with pytest.raises(TimeoutError):
+        await process_manager_event(
+            gql_client=AsyncMock(), manager_uuid=manager_uuid, echo_filter=echo_filter
+        )
+
+    assert not echo_filter.is_echo(existing_manager_uuid)
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_manager_moved_while_waiting_is_skipped(
+    mock_get_manager_elevation: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that nothing is done in an org unit whose lock is not held"""
+    manager_uuid = uuid4()
+    org_unit_uuid, other_org_unit_uuid = uuid4(), uuid4()
+    org_unit_locks: KeyedLocks = KeyedLocks(history_size=10)
+
+    async def get_manager_elevation(*args):
+        # Another event for the same org unit finishes while we are reading.
+        async with org_unit_locks.hold(org_unit_uuid):
+            pass
+        # The re-read finds the manager moved to another org unit.
+        mock_get_manager_elevation.side_effect = None
+        return manager_elevation_response(
+            manager_uuid, org_unit_uuid, [engagement()], []
+        )
+
+    mock_get_manager_elevation.side_effect = get_manager_elevation
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, other_org_unit_uuid, [engagement()], [{"uuid": str(uuid4())}]
+    )
+
+    await process_manager_event(
+        gql_client=AsyncMock(), manager_uuid=manager_uuid, org_unit_locks=org_unit_locks
+    )
+
+    assert mock_get_manager_elevation.await_count == 2
+    mock_execute_elevation_plan.assert_not_awaited()
+
+
+@unittest.mock.patch("elevate_manager.events.execute_elevation_plan")
+@unittest.mock.patch("elevate_manager.events.refresh_managers")
+async def test_org_structure_replanned_without_read_when_changed_while_waiting(
+    mock_refresh_managers: AsyncMock,
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that the snapshot, rather than MO, is read again after waiting"""
+    org_unit_uuid = uuid4()
+    manager_uuid, old_manager_uuid, other_manager_uuid = uuid4(), uuid4(), uuid4()
+    engagement_uuid = uuid4()
+    org_structure = OrgStructureIndex()
+    managers = [
+        (old_manager_uuid, org_unit_uuid, uuid4(), []),
+        (other_manager_uuid, org_unit_uuid, uuid4(), []),
+        (manager_uuid, org_unit_uuid, uuid4(), [(engagement_uuid, uuid4())]),
+    ]
+    org_structure.update([m[0] for m in managers], snapshot_page(managers).objects)
+    org_unit_locks: KeyedLocks = KeyedLocks(history_size=10)
+
+    async def other_event() -> None:
+        # Another event for the same org unit elevates a manager meanwhile.
+        async with org_unit_locks.hold(org_unit_uuid):
+            await asyncio.sleep(0.01)
+            org_structure.remove(old_manager_uuid)
+
+    await asyncio.gather(
+        other_event(),
+        process_manager_event(
+            gql_client=AsyncMock(),
+            manager_uuid=manager_uuid,
+            org_unit_locks=org_unit_locks,
+            org_structure=org_structure,
+        ),
+    )
+
+    mock_refresh_managers.assert_awaited_once()
+    (_, plan, *args), _ = mock_execute_elevation_plan.call_args
+    assert plan.managers_to_terminate == [other_manager_uuid]
+    # The snapshot is passed on, to apply the elevation to.
+    assert args[-1] is org_structure
+
+
+@unittest.mock.patch("elevate_manager.events.refresh_managers")
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+async def test_elevation_applied_to_org_structure(
+    mock_apply_elevation: AsyncMock, mock_refresh_managers: AsyncMock
+):
+    """Test that elevations made outside of the listener update the snapshot"""
+    org_unit_uuid, manager_uuid, old_manager_uuid = uuid4(), uuid4(), uuid4()
+    org_structure = OrgStructureIndex()
+    managers = [
+        (old_manager_uuid, org_unit_uuid, uuid4(), []),
+        (manager_uuid, org_unit_uuid, uuid4(), [(uuid4(), uuid4())]),
+    ]
+    org_structure.update([m[0] for m in managers], snapshot_page(managers).objects)
+    plan = plan_elevation(manager_uuid, org_structure.manager_elevation(manager_uuid))
+    assert plan is not None
+    mock_apply_elevation.side_effect = ValueError("MO is down")
+
+    with pytest.raises(ValueError):
+        await execute_elevation_plan(AsyncMock(), plan, org_structure=org_structure)
+
+    # The managers of a failed elevation are read again instead.
+    mock_refresh_managers.assert_awaited_once_with(
+        unittest.mock.ANY, org_structure, [manager_uuid, old_manager_uuid]
+    )
+    assert old_manager_uuid in org_structure
+
+    mock_apply_elevation.side_effect = None
+    mock_apply_elevation.return_value = AliasedMutationResult(
+        uuids={"terminate_0": uuid4(), "move": uuid4()}
+    )
+    assert await execute_elevation_plan(AsyncMock(), plan, org_structure=org_structure)
+
+    assert old_manager_uuid not in org_structure
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@unittest.mock.patch("elevate_manager.events.apply_elevation")
+@unittest.mock.patch("elevate_manager.events.get_manager_elevation")
+async def test_event_outcomes_are_counted(
+    mock_get_manager_elevation: AsyncMock, mock_apply_elevation: AsyncMock
+):
+    """Test that each outcome, and each reason to skip a manager, is counted"""
+    manager_uuid = uuid4()
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), [engagement()], [{"uuid": str(uuid4())}]
+    )
+    mock_apply_elevation.return_value = AliasedMutationResult()
+    elevated = sample("elevate_manager_events_processed_total", outcome="elevated")
+    events = sample("elevate_manager_stage_seconds_count", stage="event")
+
+    await process_manager_event(gql_client=AsyncMock(), manager_uuid=manager_uuid)
+
+    assert (
+        sample("elevate_manager_events_processed_total", outcome="elevated")
+        == elevated + 1
+    )
+    assert sample("elevate_manager_stage_seconds_count", stage="event") == events + 1
+
+    mock_get_manager_elevation.return_value = manager_elevation_response(
+        manager_uuid, uuid4(), [engagement(), engagement()], []
+    )
+    skipped = sample("elevate_manager_events_processed_total", outcome="skipped")
+    not_one_engagement = sample(
+        "elevate_manager_elevations_skipped_total", reason="not_one_engagement"
+    )
+
+    await process_manager_event(gql_client=AsyncMock(), manager_uuid=manager_uuid)
+
+    assert (
+        sample("elevate_manager_events_processed_total", outcome="skipped")
+        == skipped + 1
+    )
+    assert (
+        sample("elevate_manager_elevations_skipped_total", reason="not_one_engagement")
+        == not_one_engagement + 1
+    )
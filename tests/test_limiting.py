@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+
+import httpx
+import pytest
+
+from elevate_manager.client import GraphQLClient
+from elevate_manager.limiting import AdaptiveLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def limiter(clock: FakeClock, initial_limit: int = 2) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        initial_limit=initial_limit,
+        min_limit=1,
+        max_limit=4,
+        latency_target=1.0,
+        clock=clock,
+    )
+
+
+def respond(status_code: int, clock: FakeClock | None = None, seconds: float = 0):
+    async def send() -> httpx.Response:
+        if clock is not None:
+            clock.now += seconds
+        return httpx.Response(status_code)
+
+    return send
+
+
+async def test_limit_grows_while_healthy():
+    """Test that the limit grows by one per round of fast requests, up to the max"""
+    clock = FakeClock()
+    adaptive_limiter = limiter(clock)
+
+    for _ in range(3):
+        await adaptive_limiter.run(respond(200))
+    assert adaptive_limiter.limit == 3
+
+    for _ in range(20):
+        await adaptive_limiter.run(respond(200))
+    assert adaptive_limiter.limit == 4
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+async def test_limit_backs_off_when_overloaded(status_code: int):
+    """Test that 429 and 5xx responses halve the limit"""
+    adaptive_limiter = limiter(FakeClock(), initial_limit=4)
+
+    response = await adaptive_limiter.run(respond(status_code))
+
+    assert response.status_code == status_code
+    assert adaptive_limiter.limit == 2
+
+
+async def test_limit_backs_off_when_slow_or_unreachable():
+    """Test that slow requests and transport errors halve the limit"""
+    clock = FakeClock()
+    adaptive_limiter = limiter(clock, initial_limit=4)
+
+    await adaptive_limiter.run(respond(200, clock, seconds=2))
+    assert adaptive_limiter.limit == 2
+
+    async def timeout() -> httpx.Response:
+        clock.now += 1
+        raise httpx.ReadTimeout("MO is slow")
+
+    with pytest.raises(httpx.ReadTimeout):
+        await adaptive_limiter.run(timeout)
+    assert adaptive_limiter.limit == 1
+    assert adaptive_limiter.in_flight == 0
+
+
+async def test_concurrent_failures_back_off_once():
+    """Test that failures of requests in flight at the same time back off once"""
+    clock = FakeClock()
+    adaptive_limiter = limiter(clock, initial_limit=4)
+    release = asyncio.Event()
+
+    async def overloaded() -> httpx.Response:
+        await release.wait()
+        clock.now += 0.1
+        return httpx.Response(503)
+
+    requests = [asyncio.create_task(adaptive_limiter.run(overloaded)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*requests)
+
+    assert adaptive_limiter.limit == 2
+
+
+async def test_requests_wait_for_the_limit():
+    """Test that no more requests than the limit are sent at once"""
+    adaptive_limiter = limiter(FakeClock(), initial_limit=1)
+    release = asyncio.Event()
+
+    async def slow() -> httpx.Response:
+        await release.wait()
+        return httpx.Response(200)
+
+    first = asyncio.create_task(adaptive_limiter.run(slow))
+    second = asyncio.create_task(adaptive_limiter.run(slow))
+    await asyncio.sleep(0)
+    assert adaptive_limiter.in_flight == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+    assert adaptive_limiter.in_flight == 0
+
+
+async def test_client_requests_pass_through_limiter():
+    """Test that the GraphQL client sends its requests through the limiter"""
+    adaptive_limiter = limiter(FakeClock(), initial_limit=4)
+    client = GraphQLClient(
+        url="http://mo/graphql",
+        http_client=httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(502))
+        ),
+    )
+    client.concurrency_limiter = adaptive_limiter
+
+    response = await client.execute("query { version }")
+
+    assert response.status_code == 502
+    assert adaptive_limiter.limit == 2
@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+import time
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from elevate_manager.loop_monitor import LoopMonitor
+
+
+def parse_large_response() -> None:
+    time.sleep(0.3)
+
+
+@patch("elevate_manager.loop_monitor.logger")
+async def test_blocked_loop_is_measured_and_logged(mock_logger: MagicMock):
+    """Test that a synchronous call shows as lag, and its stack is logged once"""
+    name = "elevate_manager_event_loop_lag_seconds_bucket"
+    slow = REGISTRY.get_sample_value(name, {"le": "0.25"}) or 0
+    total = REGISTRY.get_sample_value(name, {"le": "+Inf"}) or 0
+    monitor = LoopMonitor(interval=0.01, slow_threshold=0.1)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    parse_large_response()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    # One of the samples was delayed by more than 0.25 seconds.
+    assert (REGISTRY.get_sample_value(name, {"le": "+Inf"}) or 0) - total > (
+        REGISTRY.get_sample_value(name, {"le": "0.25"}) or 0
+    ) - slow
+    mock_logger.warning.assert_called_once()
+    assert "parse_large_response" in mock_logger.warning.call_args.kwargs["stack"]
@@ -1,5 +1,6 @@
 # SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
 # SPDX-License-Identifier: MPL-2.0
+import asyncio
 from datetime import datetime, time, timezone, timedelta
 import unittest.mock
 from unittest.mock import AsyncMock
@@ -13,140 +14,37 @@ from elevate_manager.autogenerated_graphql_client.input_types import (
     ManagerTerminateInput,
     RAValidityInput,
 )
-from elevate_manager.autogenerated_graphql_client.manager_engagements import (
-    ManagerEngagementsManagers,
+from elevate_manager.autogenerated_graphql_client.manager_elevation import (
+    ManagerElevationManagers,
 )
-from elevate_manager.autogenerated_graphql_client.org_unit_managers import (
-    OrgUnitManagersOrgUnits,
-)
-from elevate_manager.mo import get_existing_managers
-from elevate_manager.mo import get_manager_engagements
+from elevate_manager.client import AliasedMutation
+from elevate_manager.mo import apply_elevation
+from elevate_manager.mo import get_manager_elevation
+from elevate_manager.mo import manager_elevation_batcher
 from elevate_manager.mo import move_engagement
-from elevate_manager.mo import terminate_existing_managers
-
-
-managers_empty_response = OrgUnitManagersOrgUnits.parse_obj(
-    {
-        "objects": [
-            {
-                "current": {
-                    "name": "Budget og Planlægning",
-                    "uuid": "1f06ed67-aa6e-4bbc-96d9-2f262b9202b5",
-                    "managers": [],
-                }
-            }
-        ]
-    }
-)
-
-managers_response = OrgUnitManagersOrgUnits.parse_obj(
-    {
-        "objects": [
-            {
-                "current": {
-                    "name": "Budget og Planlægning",
-                    "uuid": "1f06ed67-aa6e-4bbc-96d9-2f262b9202b5",
-                    "managers": [{"uuid": "5a988dee-109a-4353-95f2-fb414ea8d605"}],
-                }
-            }
-        ]
-    }
-)
-
-multiple_managers_response = OrgUnitManagersOrgUnits.parse_obj(
-    {
-        "objects": [
-            {
-                "current": {
-                    "name": "Budget og Planlægning",
-                    "uuid": "1f06ed67-aa6e-4bbc-96d9-2f262b9202b5",
-                    "managers": [
-                        {"uuid": "5a988dee-109a-4353-95f2-fb414ea8d605"},
-                        {"uuid": "12388dee-109a-4353-95f2-fb414ea84321"},
-                        {"uuid": "98788dee-109a-4353-95f2-fb414ea8d789"},
-                    ],
-                }
-            }
-        ]
-    }
-)
-
-manager_one_engagement_response = ManagerEngagementsManagers.parse_obj(
-    {
-        "objects": [
-            {
-                "current": {
-                    "employee": [
-                        {
-                            "engagements": [
-                                {"uuid": "fa5e2af6-ae28-4b6b-8895-3b7d39f93d54"}
-                            ]
-                        }
-                    ],
-                    "org_unit_uuid": "5e5407f1-12d4-4bfa-a4e4-57b3068b1d6d",
-                }
-            }
-        ]
-    }
-)
-
-
-@pytest.mark.asyncio
-async def test_get_manager_engagements():
-    """Tests if the GraphQL execute coroutine was awaited and that the response data
-    is parsed as we expect it in accordance with the autogenerated models."""
-    manager_uuid = uuid4()
-    mocked_mo_client = AsyncMock()
-
-    mocked_mo_client.manager_engagements.return_value = manager_one_engagement_response
-
-    actual_manager_response = await get_manager_engagements(
-        gql_client=mocked_mo_client, manager_uuid=manager_uuid
-    )
-
-    assert actual_manager_response == manager_one_engagement_response
-    mocked_mo_client.manager_engagements.assert_awaited_once_with(
-        [manager_uuid],
-    )
-
-
-@pytest.mark.asyncio
-async def test_get_existing_managers():
-    """Tests if the GraphQL execute coroutine was awaited and that the response data
-    is parsed with the expected model."""
-    org_unit_uuid = uuid4()
-    mocked_mo_client = AsyncMock()
-
-    mocked_mo_client.org_unit_managers.return_value = managers_response
-
-    actual_managers_response = await get_existing_managers(
-        gql_client=mocked_mo_client, org_unit_uuid=org_unit_uuid
-    )
-    assert actual_managers_response == managers_response
-    await mocked_mo_client.org_unit_managers()
-    mocked_mo_client.org_unit_managers.assert_awaited()
+from elevate_manager.mo import TerminationResult
+from elevate_manager.mo import terminate_managers
+from elevate_manager.models import ElevationPlan
+from elevate_manager.retry import RetryPolicy
 
 
 @pytest.mark.asyncio
-async def test_terminate_existing_managers_awaited():
+async def test_terminate_managers_awaited():
     """
     Tests if the GraphQL execute coroutine was awaited and that the mutation
     was executed with the length of the list of manager uuids.
     """
-    # Actual uuid of the manager, that has been assigned this Organisation Unit.
-    # This uuid is therefore NOT to be terminated in our function call.
-    manager_uuid = UUID("5a988dee-109a-4353-95f2-fb414ea8d605")
+    manager_uuids = [
+        UUID("12388dee-109a-4353-95f2-fb414ea84321"),
+        UUID("98788dee-109a-4353-95f2-fb414ea8d789"),
+    ]
 
     mocked_mo_client = AsyncMock()
 
     # ACT
-    await terminate_existing_managers(
-        mocked_mo_client, multiple_managers_response, manager_uuid
-    )
+    await terminate_managers(mocked_mo_client, manager_uuids)
 
     # ASSERT
-    # Asserting for the length of the managers list, which should exclude the
-    # manager uuid provided in the function call that matches the objects' payload,
     assert len(mocked_mo_client.terminate_manager.call_args_list) == 2
     # The first element in the list should be the call to be terminated.
     assert mocked_mo_client.terminate_manager.call_args_list[0] == unittest.mock.call(
@@ -168,41 +66,6 @@ async def test_terminate_existing_managers_awaited():
     )
 
 
-@pytest.mark.asyncio
-async def test_terminate_existing_manager_not_awaited():
-    """
-    Test to verify the GraphQL execute coroutine is not awaited and that the mutation
-    was executed with only 1 manager uuid.
-    """
-    # ARRANGE
-    manager_uuid = UUID("5a988dee-109a-4353-95f2-fb414ea8d605")
-    mocked_mo_client = AsyncMock()
-
-    # ACT
-    await terminate_existing_managers(mocked_mo_client, managers_response, manager_uuid)
-    # ASSERT
-    mocked_mo_client.terminate_manager.assert_not_awaited()  # Awaited 0 times.
-
-
-@pytest.mark.asyncio
-async def test_no_existing_manager_to_terminate_and_not_awaited():
-    """
-    Test to verify the GraphQL execute coroutine is not awaited and that the mutation
-    was executed with only 1 manager uuid.
-    """
-    # ARRANGE
-    manager_uuid = UUID("12388dee-109a-4353-95f2-fb414ea84321")
-    mocked_mo_client = AsyncMock()
-
-    # ACT
-    await terminate_existing_managers(
-        mocked_mo_client, managers_empty_response, manager_uuid
-    )
-
-    # ASSERT
-    mocked_mo_client.terminate_manager.assert_not_awaited()  # Awaited 0 times.
-
-
 @pytest.mark.asyncio
 async def test_elevate_engagements():
     """Tests if the GraphQL execute coroutine was awaited and that the mutation was executed."""
@@ -230,3 +93,128 @@ async def test_elevate_engagements():
             org_unit=org_unit_uuid,
         )
     )
+
+
+@pytest.mark.asyncio
+async def test_get_manager_elevation_uses_batcher():
+    """Tests that concurrent elevation lookups are merged into a single query."""
+    manager_uuid = uuid4()
+    other_manager_uuid = uuid4()
+    response = ManagerElevationManagers.parse_obj(
+        {"objects": [{"uuid": str(manager_uuid), "current": None}]}
+    )
+    mocked_mo_client = AsyncMock()
+    mocked_mo_client.manager_elevation.return_value = response
+
+    batcher = manager_elevation_batcher(mocked_mo_client, max_delay=0, max_size=10)
+    found, missing = await asyncio.gather(
+        get_manager_elevation(mocked_mo_client, manager_uuid, batcher),
+        get_manager_elevation(mocked_mo_client, other_manager_uuid, batcher),
+    )
+
+    assert found == response
+    assert missing == ManagerElevationManagers(objects=[])
+    mocked_mo_client.manager_elevation.assert_awaited_once_with(
+        [manager_uuid, other_manager_uuid]
+    )
+
+
+@pytest.mark.asyncio
+async def test_apply_elevation():
+    """Tests that the terminations and the move are sent as aliased mutations."""
+    plan = ElevationPlan(
+        manager_uuid=uuid4(),
+        org_unit_uuid=uuid4(),
+        engagement_uuid=uuid4(),
+        managers_to_terminate=[uuid4(), uuid4()],
+    )
+    mocked_mo_client = AsyncMock()
+
+    await apply_elevation(mocked_mo_client, plan)
+
+    today = datetime.combine(
+        datetime.now(), time.min, tzinfo=timezone(timedelta(hours=1))
+    )
+    mocked_mo_client.aliased_mutations.assert_awaited_once_with(
+        {
+            "terminate_0": AliasedMutation(
+                field="manager_terminate",
+                input_type="ManagerTerminateInput",
+                input=ManagerTerminateInput(
+                    uuid=plan.managers_to_terminate[0], to=today
+                ),
+            ),
+            "terminate_1": AliasedMutation(
+                field="manager_terminate",
+                input_type="ManagerTerminateInput",
+                input=ManagerTerminateInput(
+                    uuid=plan.managers_to_terminate[1], to=today
+                ),
+            ),
+            "move": AliasedMutation(
+                field="engagement_update",
+                input_type="EngagementUpdateInput",
+                input=EngagementUpdateInput(
+                    uuid=plan.engagement_uuid,
+                    validity=RAValidityInput(from_=today),
+                    org_unit=plan.org_unit_uuid,
+                ),
+            ),
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_apply_elevation_without_move():
+    """Tests that the move is left out if the engagement is already in place."""
+    plan = ElevationPlan(
+        manager_uuid=uuid4(),
+        org_unit_uuid=uuid4(),
+        engagement_uuid=uuid4(),
+        managers_to_terminate=[uuid4()],
+        move_engagement=False,
+    )
+    mocked_mo_client = AsyncMock()
+
+    await apply_elevation(mocked_mo_client, plan)
+
+    (mutations,), _ = mocked_mo_client.aliased_mutations.await_args
+    assert list(mutations) == ["terminate_0"]
+
+
+@pytest.mark.asyncio
+async def test_terminate_managers_bounded_concurrency():
+    """Tests that terminations run concurrently, but never above the cap."""
+    in_flight = 0
+    max_in_flight = 0
+
+    async def terminate_manager(input):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    mocked_mo_client = AsyncMock()
+    mocked_mo_client.terminate_manager.side_effect = terminate_manager
+    manager_uuids = [uuid4() for _ in range(10)]
+
+    result = await terminate_managers(mocked_mo_client, manager_uuids, concurrency=3)
+
+    assert result == TerminationResult(terminated=manager_uuids)
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_terminate_managers_reports_partial_failures():
+    """Tests that a failing termination does not stop the others."""
+    manager_uuids = [uuid4(), uuid4(), uuid4()]
+    error = ValueError("Manager not found")
+    mocked_mo_client = AsyncMock()
+    mocked_mo_client.retry_policy = RetryPolicy()
+    mocked_mo_client.terminate_manager.side_effect = [None, error, None]
+
+    result = await terminate_managers(mocked_mo_client, manager_uuids, concurrency=1)
+
+    assert result.terminated == [manager_uuids[0], manager_uuids[2]]
+    assert result.failed == {manager_uuids[1]: error}
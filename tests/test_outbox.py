@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import unittest.mock
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+
+from elevate_manager.events import execute_elevation_plan
+from elevate_manager.events import resume_elevations
+from elevate_manager.mo import TerminationResult
+from elevate_manager.models import ElevationPlan
+from elevate_manager.outbox import Outbox
+
+
+def elevation_plan(terminate: int = 2) -> ElevationPlan:
+    return ElevationPlan(
+        manager_uuid=uuid4(),
+        org_unit_uuid=uuid4(),
+        engagement_uuid=uuid4(),
+        managers_to_terminate=[uuid4() for _ in range(terminate)],
+    )
+
+
+def test_pending_elevations_survive_reopening(tmp_path):
+    """Test that interrupted elevations are reduced to their remaining operations"""
+    plan = elevation_plan()
+    outbox = Outbox(tmp_path / "outbox.db")
+    elevation = outbox.add(plan)
+    outbox.done(elevation, terminated=plan.managers_to_terminate[:1])
+    outbox.remove(outbox.add(elevation_plan()))
+    outbox.close()
+
+    pending = Outbox(tmp_path / "outbox.db").pending()
+
+    assert pending == [
+        (
+            elevation,
+            plan.copy(update={"managers_to_terminate": plan.managers_to_terminate[1:]}),
+        )
+    ]
+
+
+@unittest.mock.patch("elevate_manager.events.move_engagement")
+@unittest.mock.patch("elevate_manager.events.terminate_managers")
+async def test_failed_elevation_leaves_outbox(
+    mock_terminate_managers: AsyncMock, mock_move_engagement: AsyncMock, tmp_path
+):
+    """Test that only elevations interrupted by a crash are left in the outbox"""
+    mock_move_engagement.side_effect = ValueError("MO is down")
+    plan = elevation_plan()
+    mock_terminate_managers.return_value = TerminationResult(
+        terminated=plan.managers_to_terminate
+    )
+    outbox = Outbox(tmp_path / "outbox.db")
+
+    with pytest.raises(ValueError):
+        await execute_elevation_plan(
+            AsyncMock(), plan, single_request=False, outbox=outbox
+        )
+
+    assert outbox.pending() == []
+
+
+@unittest.mock.patch("elevate_manager.events.move_engagement")
+@unittest.mock.patch("elevate_manager.events.terminate_managers")
+async def test_interrupted_elevation_resumed(
+    mock_terminate_managers: AsyncMock, mock_move_engagement: AsyncMock, tmp_path
+):
+    """Test that only the remaining operations are resumed, without reading MO"""
+    plan = elevation_plan()
+    outbox = Outbox(tmp_path / "outbox.db")
+    elevation = outbox.add(plan)
+    outbox.done(elevation, terminated=plan.managers_to_terminate[:1])
+    remaining = plan.managers_to_terminate[1:]
+    mock_terminate_managers.return_value = TerminationResult(terminated=remaining)
+    gql_client = AsyncMock()
+
+    await resume_elevations(gql_client, outbox, single_request=False)
+
+    mock_terminate_managers.assert_awaited_once_with(gql_client, remaining, 1)
+    mock_move_engagement.assert_awaited_once_with(
+        gql_client, plan.org_unit_uuid, plan.engagement_uuid
+    )
+    gql_client.manager_elevation.assert_not_awaited()
+    assert outbox.pending() == []
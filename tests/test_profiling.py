@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+import marshal
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from elevate_manager.main import profile_statistical
+from elevate_manager.profiling import Profiler
+from elevate_manager.profiling import collapse
+from elevate_manager.profiling import dump
+from elevate_manager.profiling import report
+
+
+def busy_parsing(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+async def test_statistical_profile_ends_after_events():
+    """Test that the stack of the loop is sampled until the events are processed"""
+    profiler = Profiler()
+    profile = asyncio.create_task(
+        profiler.statistical(seconds=60, events=2, interval=0.001)
+    )
+    await asyncio.sleep(0)
+    assert profiler.running
+
+    for _ in range(2):
+        busy_parsing(0.05)
+        profiler.event_processed()
+    stacks = await asyncio.wait_for(profile, 5)
+
+    assert not profiler.running
+    assert any(stack.endswith("test_profiling:busy_parsing") for stack in stacks)
+    stack, count = collapse(stacks).splitlines()[0].rsplit(" ", 1)
+    assert stacks[stack] == int(count)
+
+
+async def test_deterministic_profile_ends_after_seconds():
+    """Test that every call is recorded, and returned as pstats or text"""
+    profiler = Profiler()
+    profile = asyncio.create_task(profiler.deterministic(seconds=0.05, events=None))
+    await asyncio.sleep(0)
+    busy_parsing(0.01)
+
+    stats = marshal.loads(dump(await profile))
+
+    assert any(name == "busy_parsing" for _, _, name in stats)
+    assert "busy_parsing" in report(await profile, limit=10)
+
+
+async def test_one_profile_at_a_time():
+    """Test that a second profile is refused while one is being recorded"""
+    profiler = Profiler()
+    profile = asyncio.create_task(profiler.deterministic(seconds=60, events=1))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await profile_statistical(profiler)
+
+    assert exc_info.value.status_code == 409
+    profiler.event_processed()
+    await profile
@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import io
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from elevate_manager.autogenerated_graphql_client.manager_elevation import (
+    ManagerElevationManagers,
+)
+from elevate_manager.autogenerated_graphql_client.manager_page import (
+    ManagerPageManagers,
+)
+from elevate_manager.dry_run import PlanWriter
+from elevate_manager.reconcile import is_newest_manager
+from elevate_manager.reconcile import reconcile
+from elevate_manager.retry import RetryPolicy
+from elevate_manager.snapshot import OrgStructureIndex
+
+
+def manager_object(manager_uuid, org_unit_uuid, engagement_org_unit_uuid, managers):
+    return {
+        "uuid": str(manager_uuid),
+        "current": {
+            "employee": [
+                {
+                    "engagements": [
+                        {
+                            "uuid": str(uuid4()),
+                            "org_unit": [{"uuid": str(engagement_org_unit_uuid)}],
+                        }
+                    ]
+                }
+            ],
+            "org_unit": [
+                {
+                    "uuid": str(org_unit_uuid),
+                    "managers": [
+                        {"uuid": str(uuid), "validity": {"from": start}}
+                        for uuid, start in managers
+                    ],
+                }
+            ],
+        },
+    }
+
+
+def page(manager_uuids, next_cursor) -> ManagerPageManagers:
+    return ManagerPageManagers.parse_obj(
+        {
+            "objects": [{"uuid": str(uuid)} for uuid in manager_uuids],
+            "page_info": {"next_cursor": next_cursor},
+        }
+    )
+
+
+def test_is_newest_manager():
+    """Test that only the latest started manager of an org unit is elevated"""
+    old, new, org_unit_uuid = uuid4(), uuid4(), uuid4()
+    managers = [(old, "2000-01-01T00:00:00+01:00"), (new, "2001-01-01T00:00:00+01:00")]
+    response = ManagerElevationManagers.parse_obj(
+        {
+            "objects": [
+                manager_object(old, org_unit_uuid, org_unit_uuid, managers),
+                manager_object(new, org_unit_uuid, org_unit_uuid, managers),
+            ]
+        }
+    )
+
+    assert [is_newest_manager(obj) for obj in response.objects] == [False, True]
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_reconcile_applies_missing_elevations(
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that all pages are read and only missing elevations are applied"""
+    start = "2000-01-01T00:00:00+01:00"
+    elevated, missing, org_unit_uuid, other_org_unit_uuid = (
+        uuid4(),
+        uuid4(),
+        uuid4(),
+        uuid4(),
+    )
+    responses = {
+        elevated: manager_object(
+            elevated, org_unit_uuid, org_unit_uuid, [(elevated, start)]
+        ),
+        missing: manager_object(
+            missing, other_org_unit_uuid, org_unit_uuid, [(missing, start)]
+        ),
+    }
+    gql_client = AsyncMock()
+    gql_client.manager_page.side_effect = [
+        page([elevated], "cursor"),
+        page([], "empty page cursor"),
+        page([missing], None),
+    ]
+    gql_client.manager_elevation.side_effect = (
+        lambda uuids: ManagerElevationManagers.parse_obj(
+            {"objects": [responses[uuid] for uuid in uuids]}
+        )
+    )
+
+    org_structure = OrgStructureIndex()
+
+    result = await reconcile(
+        gql_client, page_size=1, concurrency=2, org_structure=org_structure
+    )
+
+    assert (result.managers, result.planned, result.elevated) == (2, 1, 1)
+    assert gql_client.manager_page.await_count == 3
+    (_, plan, *_), kwargs = mock_execute_elevation_plan.call_args
+    assert plan.manager_uuid == missing
+    assert plan.org_unit_uuid == other_org_unit_uuid
+    assert kwargs["org_structure"] is org_structure
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_reconcile_counts_failures(mock_execute_elevation_plan: AsyncMock):
+    """Test that a failing elevation does not stop the reconciliation"""
+    start = "2000-01-01T00:00:00+01:00"
+    manager_uuid = uuid4()
+    gql_client = AsyncMock()
+    gql_client.manager_page.return_value = page([manager_uuid], None)
+    gql_client.manager_elevation.return_value = ManagerElevationManagers.parse_obj(
+        {
+            "objects": [
+                manager_object(manager_uuid, uuid4(), uuid4(), [(manager_uuid, start)])
+            ]
+        }
+    )
+    mock_execute_elevation_plan.side_effect = ValueError("MO is down")
+
+    result = await reconcile(gql_client, page_size=10, concurrency=1)
+
+    assert (result.planned, result.elevated, result.failed) == (1, 0, 1)
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_reconcile_dry_run(mock_execute_elevation_plan: AsyncMock):
+    """Test that a dry run writes the missing elevations instead of applying them"""
+    start = "2000-01-01T00:00:00+01:00"
+    manager_uuid = uuid4()
+    gql_client = AsyncMock()
+    gql_client.manager_page.return_value = page([manager_uuid], None)
+    gql_client.manager_elevation.return_value = ManagerElevationManagers.parse_obj(
+        {
+            "objects": [
+                manager_object(manager_uuid, uuid4(), uuid4(), [(manager_uuid, start)])
+            ]
+        }
+    )
+    writer = PlanWriter(io.StringIO())
+
+    result = await reconcile(
+        gql_client, page_size=10, concurrency=1, plan_writer=writer
+    )
+
+    assert (result.planned, result.elevated) == (1, 0)
+    assert writer.operations == 1
+    mock_execute_elevation_plan.assert_not_awaited()
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_reconcile_counts_elevations_no_longer_needed(
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that elevations found to be in place when applied are not counted"""
+    start = "2000-01-01T00:00:00+01:00"
+    manager_uuid = uuid4()
+    gql_client = AsyncMock()
+    gql_client.manager_page.return_value = page([manager_uuid], None)
+    gql_client.manager_elevation.return_value = ManagerElevationManagers.parse_obj(
+        {
+            "objects": [
+                manager_object(manager_uuid, uuid4(), uuid4(), [(manager_uuid, start)])
+            ]
+        }
+    )
+    mock_execute_elevation_plan.return_value = False
+
+    result = await reconcile(gql_client, page_size=10, concurrency=1)
+
+    assert (result.planned, result.elevated, result.skipped) == (1, 0, 1)
+
+
+@patch("elevate_manager.reconcile.execute_elevation_plan")
+async def test_reconcile_finishes_page_when_read_fails(
+    mock_execute_elevation_plan: AsyncMock,
+):
+    """Test that the page being applied is finished before a failed read is raised"""
+    start = "2000-01-01T00:00:00+01:00"
+    manager_uuid = uuid4()
+    gql_client = AsyncMock()
+    gql_client.retry_policy = RetryPolicy()
+    gql_client.manager_page.side_effect = [
+        page([manager_uuid], "cursor"),
+        page([uuid4()], None),
+    ]
+    gql_client.manager_elevation.side_effect = [
+        ManagerElevationManagers.parse_obj(
+            {
+                "objects": [
+                    manager_object(
+                        manager_uuid, uuid4(), uuid4(), [(manager_uuid, start)]
+                    )
+                ]
+            }
+        ),
+        ValueError("Invalid response"),
+    ]
+
+    with pytest.raises(ValueError):
+        await reconcile(gql_client, page_size=1, concurrency=1)
+
+    mock_execute_elevation_plan.assert_awaited_once()
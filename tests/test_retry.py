@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from elevate_manager.autogenerated_graphql_client import GraphQLClientGraphQLMultiError
+from elevate_manager.autogenerated_graphql_client import GraphQLClientHttpError
+from elevate_manager.exceptions import CircuitOpenError
+from elevate_manager.mo import terminate_managers
+from elevate_manager.retry import RetryPolicy
+from elevate_manager.retry import is_transient
+from elevate_manager.retry import retry
+
+
+def http_error(status_code: int, headers: dict | None = None) -> GraphQLClientHttpError:
+    return GraphQLClientHttpError(
+        status_code=status_code, response=httpx.Response(status_code, headers=headers)
+    )
+
+
+@pytest.mark.parametrize(
+    "error,transient",
+    [
+        (httpx.ReadTimeout("slow"), True),
+        (httpx.ConnectError("down"), True),
+        (http_error(429), True),
+        (http_error(503), True),
+        (http_error(500), False),
+        (http_error(400), False),
+        (
+            GraphQLClientGraphQLMultiError.from_errors_dicts(
+                [{"message": "Cannot query field 'foo'"}], data={}
+            ),
+            False,
+        ),
+        (CircuitOpenError(retry_in=10), False),
+    ],
+)
+def test_errors_are_classified(error: Exception, transient: bool):
+    """Test that only errors of MO being briefly unavailable are transient"""
+    assert is_transient(error) is transient
+
+
+@patch("elevate_manager.retry.asyncio.sleep")
+async def test_transient_errors_retried_with_backoff(mock_sleep: AsyncMock):
+    """Test that transient errors are retried with growing, jittered delays"""
+    operation = AsyncMock(
+        side_effect=[httpx.ReadTimeout("slow"), http_error(503), "result"]
+    )
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=10)
+
+    assert await retry(operation, policy, "operation") == "result"
+
+    assert operation.await_count == 3
+    first, second = (call.args[0] for call in mock_sleep.await_args_list)
+    assert 0 <= first <= 1
+    assert 0 <= second <= 2
+
+
+@patch("elevate_manager.retry.asyncio.sleep")
+async def test_retries_give_up(mock_sleep: AsyncMock):
+    """Test that the last transient error is raised once all attempts failed"""
+    operation = AsyncMock(side_effect=http_error(502))
+
+    with pytest.raises(GraphQLClientHttpError):
+        await retry(operation, RetryPolicy(attempts=2), "operation")
+
+    assert operation.await_count == 2
+
+
+@patch("elevate_manager.retry.asyncio.sleep")
+async def test_permanent_errors_fail_fast(mock_sleep: AsyncMock):
+    """Test that GraphQL errors are raised without retrying"""
+    operation = AsyncMock(
+        side_effect=GraphQLClientGraphQLMultiError.from_errors_dicts(
+            [{"message": "Invalid input"}], data={}
+        )
+    )
+
+    with pytest.raises(GraphQLClientGraphQLMultiError):
+        await retry(operation, RetryPolicy(), "operation")
+
+    operation.assert_awaited_once()
+    mock_sleep.assert_not_awaited()
+
+
+def test_retry_after_is_respected():
+    """Test that MO asking to slow down delays the retry, up to the maximum"""
+    policy = RetryPolicy(base_delay=0.1, max_delay=10)
+
+    assert policy.delay(0, http_error(429, {"Retry-After": "5"})) == 5
+    assert policy.delay(0, http_error(429, {"Retry-After": "60"})) == 10
+
+
+@patch("elevate_manager.retry.asyncio.sleep")
+async def test_failed_termination_retried_alone(mock_sleep: AsyncMock):
+    """Test that only the termination which failed is sent again"""
+    first, second = uuid4(), uuid4()
+    gql_client = AsyncMock()
+    gql_client.retry_policy = RetryPolicy()
+
+    async def terminate_manager(input):
+        if input.uuid == second and gql_client.terminate_manager.await_count == 2:
+            raise httpx.ConnectError("MO is down")
+
+    gql_client.terminate_manager.side_effect = terminate_manager
+
+    result = await terminate_managers(gql_client, [first, second])
+
+    assert result.terminated == [first, second]
+    assert [
+        call.kwargs["input"].uuid
+        for call in gql_client.terminate_manager.await_args_list
+    ] == [first, second, second]
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+
+from elevate_manager.scheduling import Debouncer
+from elevate_manager.scheduling import KeyedLocks
+
+
+async def test_same_key_is_serialized():
+    """Test that work on the same key runs one at a time, in order"""
+    locks: KeyedLocks[str] = KeyedLocks(history_size=10)
+    order = []
+
+    async def work(name: str) -> None:
+        async with locks.hold("unit"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    await asyncio.gather(work("first"), work("second"))
+
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert len(locks) == 0
+
+
+async def test_different_keys_run_in_parallel():
+    """Test that work on different keys is not serialized"""
+    locks: KeyedLocks[str] = KeyedLocks(history_size=10)
+    both_held = asyncio.Event()
+    held = set()
+
+    async def work(key: str) -> None:
+        async with locks.hold(key):
+            held.add(key)
+            if len(held) == 2:
+                both_held.set()
+            await asyncio.wait_for(both_held.wait(), timeout=1)
+
+    await asyncio.gather(work("first unit"), work("second unit"))
+
+
+async def test_released_since():
+    """Test that releases by other holders are detected"""
+    locks: KeyedLocks[str] = KeyedLocks(history_size=10)
+    generation = locks.generation
+
+    async with locks.hold("unit") as lock:
+        assert not lock.released_since(generation)
+
+    async with locks.hold("unit") as lock:
+        assert lock.released_since(generation)
+        assert not lock.released_since(locks.generation)
+
+
+async def test_released_since_history_is_bounded():
+    """Test that forgotten keys are treated as just released"""
+    locks: KeyedLocks[str] = KeyedLocks(history_size=1)
+    async with locks.hold("first unit"):
+        pass
+    generation = locks.generation
+    async with locks.hold("second unit"):
+        pass
+    async with locks.hold("third unit"):
+        pass
+
+    async with locks.hold("first unit") as lock:
+        # The first unit was not released after the generation, but has been
+        # forgotten, so it must be assumed to have been.
+        assert lock.released_since(generation)
+    assert len(locks._releases) == 1
+
+
+async def test_superseded_by_newer_waiter():
+    """Test that a holder knows whether newer callers wait for the key"""
+    locks: KeyedLocks[str] = KeyedLocks(history_size=10)
+    superseded = {}
+
+    async def work(name: str) -> None:
+        async with locks.hold("unit") as lock:
+            superseded[name] = lock.superseded()
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(work("first"), work("second"), work("third"))
+
+    assert superseded == {"first": False, "second": True, "third": False}
+
+
+async def test_debouncer_only_settles_last_of_burst():
+    """Test that only the last work of a burst on the same key is carried out"""
+    debouncer: Debouncer[str] = Debouncer(quiet_period=0.01)
+
+    async def delayed(key: str, delay: float) -> bool:
+        await asyncio.sleep(delay)
+        return await debouncer.settle(key)
+
+    results = await asyncio.gather(
+        delayed("manager", 0),
+        delayed("manager", 0.005),
+        delayed("other manager", 0.005),
+    )
+
+    assert results == [False, True, True]
+    assert len(debouncer) == 0
+
+
+async def test_debouncer_settles_after_quiet_period():
+    """Test that work arriving after the quiet period starts a new burst"""
+    debouncer: Debouncer[str] = Debouncer(quiet_period=0)
+
+    assert await debouncer.settle("manager")
+    assert await debouncer.settle("manager")
@@ -0,0 +1,275 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timezone
+from unittest.mock import AsyncMock
+from uuid import UUID
+from uuid import uuid4
+
+import pytest
+
+from elevate_manager.autogenerated_graphql_client.engagement_employees import (
+    EngagementEmployeesEngagements,
+)
+from elevate_manager.autogenerated_graphql_client.manager_snapshot import (
+    ManagerSnapshotManagers,
+)
+from elevate_manager.autogenerated_graphql_client.registrations import (
+    RegistrationsRegistrations,
+)
+from elevate_manager.events import plan_elevation
+from elevate_manager.models import ElevationPlan
+from elevate_manager.snapshot import OrgStructureIndex
+from elevate_manager.snapshot import load_org_structure
+from elevate_manager.snapshot import restore_org_structure
+
+
+def snapshot_page(
+    managers: Sequence[tuple[UUID, UUID, UUID | None, list[tuple[UUID, UUID]]]],
+    next_cursor: str | None = None,
+    ends: dict[UUID, str] | None = None,
+) -> ManagerSnapshotManagers:
+    """A page of managers, each given as manager, org unit, employee and the
+    engagements of the employee with their org unit, and optionally the end of
+    the validity of some of the managers."""
+    return ManagerSnapshotManagers.parse_obj(
+        {
+            "objects": [
+                {
+                    "uuid": str(manager_uuid),
+                    "current": {
+                        "employee": [
+                            {
+                                "uuid": str(employee_uuid),
+                                "engagements": [
+                                    {"uuid": str(e), "org_unit": [{"uuid": str(ou)}]}
+                                    for e, ou in engagements
+                                ],
+                            }
+                        ]
+                        if employee_uuid is not None
+                        else None,
+                        "org_unit": [{"uuid": str(org_unit_uuid)}],
+                        "validity": {
+                            "from": "2000-01-01T00:00:00+01:00",
+                            "to": (ends or {}).get(manager_uuid),
+                        },
+                    },
+                }
+                for manager_uuid, org_unit_uuid, employee_uuid, engagements in managers
+            ],
+            "page_info": {"next_cursor": next_cursor},
+        }
+    )
+
+
+def test_elevation_planned_from_index():
+    """Test that the index is planned like the ManagerElevation query"""
+    org_unit_uuid, old_manager_uuid, manager_uuid = uuid4(), uuid4(), uuid4()
+    engagement_uuid = uuid4()
+    page = snapshot_page(
+        [
+            (old_manager_uuid, org_unit_uuid, uuid4(), []),
+            (manager_uuid, org_unit_uuid, uuid4(), [(engagement_uuid, uuid4())]),
+        ]
+    )
+    index = OrgStructureIndex()
+    index.update([old_manager_uuid, manager_uuid], page.objects)
+
+    plan = plan_elevation(manager_uuid, index.manager_elevation(manager_uuid))
+
+    assert plan == ElevationPlan(
+        manager_uuid=manager_uuid,
+        org_unit_uuid=org_unit_uuid,
+        engagement_uuid=engagement_uuid,
+        managers_to_terminate=[old_manager_uuid],
+    )
+
+
+def test_applied_elevation_updates_index():
+    """Test that our own elevations are applied without reading MO"""
+    org_unit_uuid, old_manager_uuid, manager_uuid = uuid4(), uuid4(), uuid4()
+    old_employee_uuid, engagement_uuid = uuid4(), uuid4()
+    page = snapshot_page(
+        [
+            (old_manager_uuid, org_unit_uuid, old_employee_uuid, []),
+            (manager_uuid, org_unit_uuid, uuid4(), [(engagement_uuid, uuid4())]),
+        ]
+    )
+    index = OrgStructureIndex()
+    index.update([old_manager_uuid, manager_uuid], page.objects)
+    plan = plan_elevation(manager_uuid, index.manager_elevation(manager_uuid))
+    assert plan is not None
+
+    index.apply(plan)
+
+    assert old_manager_uuid not in index
+    assert index.employee_managers(old_employee_uuid) == set()
+    replan = plan_elevation(manager_uuid, index.manager_elevation(manager_uuid))
+    assert replan is not None
+    assert replan.managers_to_terminate == []
+    assert replan.move_engagement is False
+
+
+def test_managers_not_found_are_removed():
+    """Test that refreshed managers no longer current in MO are removed"""
+    org_unit_uuid, manager_uuid, employee_uuid = uuid4(), uuid4(), uuid4()
+    index = OrgStructureIndex()
+    index.update(
+        [manager_uuid],
+        snapshot_page([(manager_uuid, org_unit_uuid, employee_uuid, [])]).objects,
+    )
+    assert manager_uuid in index
+
+    index.update([manager_uuid], [])
+
+    assert len(index) == 0
+    assert index.org_units == 0
+    assert index.employee_managers(employee_uuid) == set()
+    assert index.manager_elevation(manager_uuid).objects == []
+
+
+async def test_load_org_structure_pages():
+    """Test that the snapshot is loaded a page at a time"""
+    first, second = uuid4(), uuid4()
+    gql_client = AsyncMock()
+    gql_client.manager_snapshot.side_effect = [
+        snapshot_page([(first, uuid4(), uuid4(), [(uuid4(), uuid4())])], "cursor"),
+        snapshot_page([(second, uuid4(), None, [])]),
+    ]
+    index = OrgStructureIndex()
+
+    await load_org_structure(gql_client, index, page_size=1)
+
+    assert first in index
+    assert second in index
+    assert index.org_units == 2
+    assert index.memory_footprint() > 0
+    assert gql_client.manager_snapshot.await_args_list[1].kwargs == {
+        "cursor": "cursor",
+        "limit": 1,
+    }
+
+
+def test_saved_index_is_loaded(tmp_path):
+    """Test that the index is the same after saving and loading it"""
+    org_unit_uuid, manager_uuid, vacant_uuid = uuid4(), uuid4(), uuid4()
+    employee_uuid, engagement_uuid = uuid4(), uuid4()
+    page = snapshot_page(
+        [
+            (vacant_uuid, org_unit_uuid, None, []),
+            (
+                manager_uuid,
+                org_unit_uuid,
+                employee_uuid,
+                [(engagement_uuid, uuid4()), (uuid4(), org_unit_uuid)],
+            ),
+        ]
+    )
+    index = OrgStructureIndex()
+    index.update([vacant_uuid, manager_uuid], page.objects)
+    as_of = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    path = tmp_path / "snapshot.bin"
+
+    index.save(path, as_of)
+    loaded, loaded_as_of = OrgStructureIndex.load(path)
+
+    assert loaded_as_of == as_of
+    assert len(loaded) == 2
+    assert loaded.employee_managers(employee_uuid) == {manager_uuid}
+    for uuid in (vacant_uuid, manager_uuid):
+        assert loaded.manager_elevation(uuid) == index.manager_elevation(uuid)
+
+
+def test_ended_managers_are_removed(tmp_path):
+    """Test that managers are no longer terminated once their validity ended"""
+    org_unit_uuid, ending_uuid, manager_uuid = uuid4(), uuid4(), uuid4()
+    page = snapshot_page(
+        [
+            (ending_uuid, org_unit_uuid, uuid4(), []),
+            (manager_uuid, org_unit_uuid, uuid4(), [(uuid4(), org_unit_uuid)]),
+        ],
+        ends={ending_uuid: "2000-06-01T00:00:00+02:00"},
+    )
+    index = OrgStructureIndex(
+        clock=lambda: datetime(2000, 6, 1, 12, tzinfo=timezone.utc)
+    )
+    index.update([ending_uuid, manager_uuid], page.objects)
+    path = tmp_path / "snapshot.bin"
+    index.save(path, datetime(2000, 6, 1, tzinfo=timezone.utc))
+
+    # The manager is current through the last day of its validity.
+    plan = plan_elevation(manager_uuid, index.manager_elevation(manager_uuid))
+    assert plan is not None
+    assert plan.managers_to_terminate == [ending_uuid]
+
+    loaded, _ = OrgStructureIndex.load(path)
+    loaded.clock = lambda: datetime(2000, 6, 2, tzinfo=timezone.utc)
+    plan = plan_elevation(manager_uuid, loaded.manager_elevation(manager_uuid))
+    assert plan is not None
+    assert plan.managers_to_terminate == []
+    assert ending_uuid not in loaded
+    assert loaded.manager_elevation(ending_uuid).objects == []
+
+
+def test_truncated_snapshot_is_rejected(tmp_path):
+    """Test that a partially written snapshot file is not loaded"""
+    manager_uuid = uuid4()
+    index = OrgStructureIndex()
+    index.update(
+        [manager_uuid],
+        snapshot_page([(manager_uuid, uuid4(), uuid4(), [])]).objects,
+    )
+    path = tmp_path / "snapshot.bin"
+    index.save(path, datetime(2000, 1, 1, tzinfo=timezone.utc))
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError):
+        OrgStructureIndex.load(path)
+
+
+async def test_restored_snapshot_catches_up(tmp_path):
+    """Test that only the managers changed since the snapshot are read from MO"""
+    org_unit_uuid, changed_uuid, unchanged_uuid = uuid4(), uuid4(), uuid4()
+    employee_uuid, engagement_uuid = uuid4(), uuid4()
+    index = OrgStructureIndex()
+    managers = [
+        (changed_uuid, org_unit_uuid, uuid4(), []),
+        (unchanged_uuid, org_unit_uuid, employee_uuid, [(engagement_uuid, uuid4())]),
+    ]
+    index.update([changed_uuid, unchanged_uuid], snapshot_page(managers).objects)
+    path = tmp_path / "snapshot.bin"
+    as_of = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    index.save(path, as_of)
+    gql_client = AsyncMock()
+    gql_client.registrations.return_value = RegistrationsRegistrations.parse_obj(
+        {
+            "objects": [
+                {"uuid": str(changed_uuid), "model": "manager", "start": as_of},
+                {"uuid": str(engagement_uuid), "model": "engagement", "start": as_of},
+            ],
+            "page_info": {"next_cursor": None},
+        }
+    )
+    gql_client.engagement_employees.return_value = (
+        EngagementEmployeesEngagements.parse_obj(
+            {
+                "objects": [
+                    {"validities": [{"employee": [{"uuid": str(employee_uuid)}]}]}
+                ]
+            }
+        )
+    )
+    # The changed manager was terminated.
+    gql_client.manager_snapshot.return_value = snapshot_page([managers[1]])
+
+    restored = await restore_org_structure(gql_client, path, page_size=100)
+
+    gql_client.registrations.assert_awaited_once()
+    assert gql_client.registrations.await_args.kwargs["start"] < as_of
+    gql_client.manager_snapshot.assert_awaited_once_with(
+        uuids=sorted([changed_uuid, unchanged_uuid])
+    )
+    assert changed_uuid not in restored
+    assert unchanged_uuid in restored
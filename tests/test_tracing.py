@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: Magenta ApS <https://magenta.dk>
+# SPDX-License-Identifier: MPL-2.0
+import io
+import json
+from collections.abc import Iterator
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from elevate_manager.client import GraphQLClient
+from elevate_manager.mo import move_engagement
+from elevate_manager.tracing import JSONLinesExporter
+from elevate_manager.tracing import Span
+from elevate_manager.tracing import set_exporter
+from elevate_manager.tracing import span
+
+
+class ListExporter:
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exporter() -> Iterator[ListExporter]:
+    exporter = ListExporter()
+    set_exporter(exporter)
+    yield exporter
+    set_exporter(None)
+
+
+async def test_spans_are_nested(exporter: ListExporter):
+    """Test that the spans of mo.py functions are children of the event span"""
+    with span("listener", manager_uuid="manager"):
+        await move_engagement(AsyncMock(), uuid4(), uuid4())
+
+    child, parent = exporter.spans
+    assert (child.name, parent.name) == ("move_engagement", "listener")
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert parent.attributes == {"manager_uuid": "manager"}
+    assert parent.duration is not None
+
+
+async def test_failed_span_is_exported(exporter: ListExporter):
+    """Test that spans ending with an exception record it"""
+    with pytest.raises(ValueError):
+        with span("listener"):
+            raise ValueError("MO is down")
+
+    assert exporter.spans[0].error == "ValueError('MO is down')"
+
+
+async def test_trace_sent_to_mo(exporter: ListExporter):
+    """Test that requests to MO carry the trace, and are traced themselves"""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"data": {}})
+
+    client = GraphQLClient(
+        url="http://mo/graphql",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    with span("listener"):
+        await client.execute("query Version { version }")
+
+    request_span, listener_span = exporter.spans
+    assert request_span.attributes == {
+        "operation": "Version",
+        "status_code": 200,
+        "response_size": len('{"data":{}}'),
+    }
+    trace_id, span_id = request_span.trace_id, request_span.span_id
+    assert requests[0].headers["traceparent"] == f"00-{trace_id}-{span_id}-01"
+
+
+def test_spans_written_as_json_lines():
+    """Test that the file exporter writes a JSON line per span"""
+    stream = io.StringIO()
+    set_exporter(JSONLinesExporter(stream))
+    try:
+        with span("listener", manager_uuid="manager"):
+            pass
+    finally:
+        set_exporter(None)
+
+    line = json.loads(stream.getvalue())
+    assert line["name"] == "listener"
+    assert line["attributes"] == {"manager_uuid": "manager"}